@@ -0,0 +1,61 @@
+# benchmarks/tiled_executor.py
+"""Замер масштабирования TiledExecutor от 1 до N потоков.
+
+Запуск из корня проекта:
+    python -m benchmarks.tiled_executor [ширина высота]
+"""
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image, ImageFilter
+from core.point_ops import PointPipeline
+from core.tiled_executor import TiledExecutor
+
+# Число повторов каждого замера (берется лучшее время)
+REPEATS = 3
+
+
+def _best_time(function) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(width: int = 4000, height: int = 3000):
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, (height, width, 4), dtype=np.uint8), "RGBA")
+    pipeline = PointPipeline().brightness(1.2).contrast(1.1, pivot=128).gamma(1.4)
+    lut = pipeline.compile()
+
+    cases = {
+        "LUT": lambda ex: ex.map_strips(image, lambda s: pipeline.apply(s, lut)),
+        "Размытие": lambda ex: ex.map_strips(image, lambda s: s.filter(ImageFilter.GaussianBlur(4)),
+                                             overlap=16),
+        "Размер x0.5": lambda ex: ex.resize(image, (width // 2, height // 2)),
+        "Размер x1.5": lambda ex: ex.resize(image, (width * 3 // 2, height * 3 // 2)),
+    }
+
+    cores = os.cpu_count() or 1
+    workers = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    print(f"Изображение {width}x{height}, ядер: {cores}")
+    print("Операция".ljust(14) + "".join(f"{n:>7} пот." for n in workers))
+
+    for name, case in cases.items():
+        times = []
+        for n in workers:
+            executor = TiledExecutor(max_workers=n, min_pixels=0)
+            times.append(_best_time(lambda: case(executor)))
+            executor.shutdown()
+        row = "".join(f"{t * 1000:>9.0f} мс" for t in times)
+        print(name.ljust(14) + row + f"   ускорение x{times[0] / times[-1]:.2f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run(int(sys.argv[1]), int(sys.argv[2]))
+    else:
+        run()
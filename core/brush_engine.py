@@ -0,0 +1,263 @@
+# core/brush_engine.py
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+import numpy as np
+from PIL import Image
+from core.flood_fill import pixel_value, pixel_view
+from core.tiles import clip_box, union_box
+from utils.constants import DEFAULT_BG_COLOR, StrokeMode
+
+# Запас (пиксели), с которым растет буфер штриха, чтобы не перевыделять его
+# на каждом событии мыши
+STROKE_BUFFER_MARGIN = 128
+
+
+@lru_cache(maxsize=64)
+def brush_stamp(size: int, hardness: float = 1.0, antialias: bool = False) -> np.ndarray:
+    """Маска отпечатка кисти (float32, 0..1) размером (2r+1, 2r+1), r = size // 2.
+
+    hardness = 1 - жесткий круг, меньшие значения дают плавный спад к краю
+    (с 1 - hardness доли радиуса). antialias сглаживает край жесткого круга
+    на один пиксель. Маски кэшируются по (size, hardness, antialias).
+    """
+    radius = size // 2
+    y, x = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    distance = np.sqrt(x * x + y * y, dtype=np.float32)
+    edge = radius + 0.5
+
+    if hardness >= 1.0 and antialias:
+        stamp = np.clip(edge + 0.5 - distance, 0, 1).astype(np.float32)
+    elif hardness >= 1.0:
+        stamp = (distance <= edge).astype(np.float32)
+    else:
+        soft = max(edge * (1.0 - hardness), 1e-6)
+        stamp = np.clip((edge - distance) / soft, 0, 1).astype(np.float32)
+
+    stamp.setflags(write=False)
+    return stamp
+
+
+def segment_positions(x0: int, y0: int, x1: int, y1: int, size: int) -> np.ndarray:
+    """Центры отпечатков вдоль отрезка (массив (N, 2)) с шагом size // 3"""
+    distance = np.hypot(x1 - x0, y1 - y0)
+    if distance == 0:
+        return np.array([[x0, y0]], dtype=np.int64)
+
+    step = max(1, size // 3)
+    steps = max(1, int(distance / step))
+    t = np.arange(steps + 1) / steps
+    xs = (x0 + (x1 - x0) * t).astype(np.int64)
+    ys = (y0 + (y1 - y0) * t).astype(np.int64)
+    return np.stack([xs, ys], axis=1)
+
+
+def stroke_positions(points: Sequence[Tuple[int, int]], size: int) -> np.ndarray:
+    """Центры отпечатков для всего штриха: первая точка и все отрезки.
+
+    Общая точка соседних отрезков берется один раз (как в StrokeBuffer при
+    рисовании мышью), чтобы накапливаемое покрытие не удваивалось на стыках.
+    """
+    parts = [np.array([points[0]], dtype=np.int64)]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        parts.append(segment_positions(x0, y0, x1, y1, size)[1:])
+    return np.concatenate(parts)
+
+
+def stamps_bbox(positions: np.ndarray, size: int) -> Tuple[int, int, int, int]:
+    """Область, покрываемая отпечатками"""
+    radius = size // 2
+    return (int(positions[:, 0].min()) - radius, int(positions[:, 1].min()) - radius,
+            int(positions[:, 0].max()) + radius + 1, int(positions[:, 1].max()) + radius + 1)
+
+
+def stamp_coverage(positions: np.ndarray, size: int, hardness: float,
+                   bbox: Tuple[int, int, int, int]) -> np.ndarray:
+    """Покрытие области bbox отпечатками: максимум масок (без накопления)"""
+    x1, y1, x2, y2 = bbox
+    coverage = np.zeros((y2 - y1, x2 - x1), dtype=np.float32)
+    _stamp_into(coverage, (x1, y1), np.unique(positions, axis=0),
+                brush_stamp(size, hardness), StrokeMode.MAX)
+    return coverage
+
+
+def _stamp_into(coverage: np.ndarray, origin: Tuple[int, int], positions: np.ndarray,
+                stamp: np.ndarray, mode: StrokeMode):
+    """Нанести отпечатки на массив покрытия, левый верхний угол которого - origin"""
+    radius = stamp.shape[0] // 2
+    for x, y in positions:
+        # Пересечение отпечатка с массивом
+        left, top = x - radius - origin[0], y - radius - origin[1]
+        sx1, sy1 = max(0, -left), max(0, -top)
+        sx2 = min(stamp.shape[1], coverage.shape[1] - left)
+        sy2 = min(stamp.shape[0], coverage.shape[0] - top)
+        if sx1 >= sx2 or sy1 >= sy2:
+            continue
+        target = coverage[top + sy1:top + sy2, left + sx1:left + sx2]
+        part = stamp[sy1:sy2, sx1:sx2]
+        if mode is StrokeMode.ACCUMULATE:
+            # Наложение "поверх": c + s * (1 - c)
+            target += part * (1.0 - target)
+        else:
+            np.maximum(target, part, out=target)
+
+
+def paint_stamps(image: Image.Image, positions: np.ndarray, color: Tuple, size: int,
+                 hardness: float = 1.0) -> Optional[Tuple]:
+    """Нанести отпечатки в точках positions одним проходом по их общей области.
+
+    Пиксели смешиваются с цветом (все каналы, включая альфу) пропорционально
+    покрытию; при полном покрытии цвет просто записывается. Изображение
+    изменяется на месте, возвращается измененная область или None.
+    """
+    if len(positions) == 0:
+        return None
+    bbox = clip_box(stamps_bbox(positions, size), image.width, image.height)
+    x1, y1, x2, y2 = bbox
+    if x1 >= x2 or y1 >= y2:
+        return None
+
+    coverage = stamp_coverage(positions, size, hardness, bbox)
+    region = np.array(image.crop(bbox))
+
+    if hardness >= 1.0:
+        pixel_view(region)[coverage > 0] = pixel_value(region, color)
+    else:
+        alpha = coverage[..., None]
+        target = np.asarray(color, dtype=np.float32)
+        region = np.rint(region + (target - region) * alpha).astype(np.uint8)
+
+    image.paste(Image.fromarray(region, image.mode), (x1, y1))
+    return bbox
+
+
+def blend_over(region: np.ndarray, coverage: np.ndarray, color: Tuple,
+               opacity: float = 1.0) -> np.ndarray:
+    """Наложить цвет поверх пикселей region (uint8, h x w x c) с непрозрачностью
+    coverage * opacity * альфа цвета (обычное наложение "source over")"""
+    src_alpha = coverage * (opacity * (color[3] / 255.0 if len(color) > 3 else 1.0))
+    rgb = np.asarray(color[:3], dtype=np.float32)
+
+    if region.shape[2] < 4:
+        # Непрозрачное изображение: простое смешивание
+        result = region + (rgb - region) * src_alpha[..., None]
+        return np.rint(result).astype(np.uint8)
+
+    dst_alpha = region[..., 3] * np.float32(1 / 255.0)
+    keep = dst_alpha * (1.0 - src_alpha)
+    out_alpha = src_alpha + keep
+    safe = np.where(out_alpha > 0, out_alpha, 1.0)
+
+    result = np.empty(region.shape, dtype=np.uint8)
+    color_part = rgb * src_alpha[..., None] + region[..., :3] * keep[..., None]
+    result[..., :3] = np.rint(color_part / safe[..., None])
+    result[..., 3] = np.rint(out_alpha * 255)
+    return result
+
+
+def erase_alpha(region: np.ndarray, coverage: np.ndarray, opacity: float = 1.0) -> np.ndarray:
+    """Уменьшить альфу пикселей region пропорционально coverage * opacity.
+
+    У изображения без альфа-канала стертые пиксели смешиваются с цветом фона.
+    """
+    if region.shape[2] < 4:
+        return blend_over(region, coverage, DEFAULT_BG_COLOR, opacity)
+    result = region.copy()
+    keep = 1.0 - coverage * opacity
+    result[..., 3] = np.rint(region[..., 3] * keep)
+    return result
+
+
+class StrokeBuffer:
+    """Буфер покрытия одного штриха.
+
+    Отпечатки накапливаются в массиве альфа-покрытия (максимум или
+    накопление), который занимает только область штриха и растет вместе с
+    ним. Изображение не меняется до apply(): холст показывает наложение
+    буфера через composite(), а в изображение штрих записывается один раз
+    с непрозрачностью opacity. Поэтому перекрывающиеся отпечатки
+    полупрозрачного цвета не темнеют, а край жесткой кисти сглажен.
+    С erase=True буфер не рисует цвет, а уменьшает альфу (ластик).
+    """
+
+    def __init__(self, image_size: Tuple[int, int], color: Tuple, size: int,
+                 hardness: float = 1.0, opacity: float = 1.0,
+                 mode: StrokeMode = StrokeMode.MAX, erase: bool = False):
+        self.image_size = image_size
+        self.color = tuple(color)
+        self.size = size
+        self.opacity = opacity
+        self.mode = mode
+        self.erase = erase
+        self.stamp = brush_stamp(size, hardness, antialias=True)
+
+        self.bbox: Optional[Tuple] = None        # Закрашенная область
+        self._origin = (0, 0)                    # Левый верхний угол массива
+        self._coverage = np.zeros((0, 0), dtype=np.float32)
+
+    def add(self, positions: np.ndarray) -> Optional[Tuple]:
+        """Добавить отпечатки, вернуть затронутую ими область"""
+        if len(positions) == 0:
+            return None
+        bbox = clip_box(stamps_bbox(positions, self.size), *self.image_size)
+        if bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+            return None
+
+        self._reserve(bbox)
+        _stamp_into(self._coverage, self._origin, positions, self.stamp, self.mode)
+        self.bbox = union_box(self.bbox, bbox)
+        return bbox
+
+    def _reserve(self, bbox: Tuple):
+        """Расширить массив покрытия так, чтобы он содержал bbox"""
+        ox, oy = self._origin
+        h, w = self._coverage.shape
+        if (bbox[0] >= ox and bbox[1] >= oy and
+                bbox[2] <= ox + w and bbox[3] <= oy + h):
+            return
+
+        m = STROKE_BUFFER_MARGIN
+        grown = (bbox[0] - m, bbox[1] - m, bbox[2] + m, bbox[3] + m)
+        if w and h:
+            grown = union_box(grown, (ox, oy, ox + w, oy + h))
+        nx1, ny1, nx2, ny2 = clip_box(grown, *self.image_size)
+
+        coverage = np.zeros((ny2 - ny1, nx2 - nx1), dtype=np.float32)
+        if w and h:
+            coverage[oy - ny1:oy - ny1 + h, ox - nx1:ox - nx1 + w] = self._coverage
+        self._coverage = coverage
+        self._origin = (nx1, ny1)
+
+    def _coverage_for(self, box: Tuple) -> np.ndarray:
+        ox, oy = self._origin
+        return self._coverage[box[1] - oy:box[3] - oy, box[0] - ox:box[2] - ox]
+
+    def _blend(self, region: np.ndarray, box: Tuple) -> np.ndarray:
+        coverage = self._coverage_for(box)
+        if self.erase:
+            return erase_alpha(region, coverage, self.opacity)
+        return blend_over(region, coverage, self.color, self.opacity)
+
+    def composite(self, tile: Image.Image, box: Tuple) -> Image.Image:
+        """Наложить буфер на фрагмент изображения tile с координатами box
+        (используется холстом при отрисовке тайлов)"""
+        if self.bbox is None:
+            return tile
+        x1, y1 = max(box[0], self.bbox[0]), max(box[1], self.bbox[1])
+        x2, y2 = min(box[2], self.bbox[2]), min(box[3], self.bbox[3])
+        if x1 >= x2 or y1 >= y2:
+            return tile
+
+        part = (x1 - box[0], y1 - box[1], x2 - box[0], y2 - box[1])
+        region = np.asarray(tile.crop(part))
+        blended = self._blend(region, (x1, y1, x2, y2))
+        tile.paste(Image.fromarray(blended, tile.mode), part[:2])
+        return tile
+
+    def apply(self, image: Image.Image) -> Optional[Tuple]:
+        """Записать штрих в изображение, вернуть измененную область"""
+        if self.bbox is None:
+            return None
+        region = np.asarray(image.crop(self.bbox))
+        blended = self._blend(region, self.bbox)
+        image.paste(Image.fromarray(blended, image.mode), self.bbox[:2])
+        return self.bbox
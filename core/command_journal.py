@@ -0,0 +1,260 @@
+# core/command_journal.py
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from PIL import Image
+from core.mapped_image import MappedImage
+from core.pixel_store import PixelStore, copy_meter, image_nbytes
+from core.tiles import clip_box
+
+
+class DrawCommand:
+    """Компактная запись операции рисования: инструмент, цвет, толщина, точки"""
+
+    __slots__ = ("tool", "color", "width", "points", "fill_color", "params")
+
+    def __init__(self, tool: str, color: Tuple, width: int,
+                 points: Sequence[Tuple[int, int]], fill_color: Optional[Tuple] = None,
+                 params: Optional[Dict] = None):
+        self.tool = tool
+        self.color = tuple(color)
+        self.width = width
+        self.points = tuple((int(x), int(y)) for x, y in points)
+        self.fill_color = tuple(fill_color) if fill_color is not None else None
+        # Дополнительные параметры инструмента (жесткость кисти и т.п.)
+        self.params = dict(params) if params else {}
+
+    @property
+    def nbytes(self) -> int:
+        """Примерный объем памяти команды (байты)"""
+        extra = sum(getattr(value, "nbytes", 0) for value in self.params.values())
+        return 64 + 16 * len(self.points) + extra
+
+    def __repr__(self):
+        return f"DrawCommand({self.tool!r}, points={len(self.points)})"
+
+
+def command_bbox(command: DrawCommand) -> Tuple[int, int, int, int]:
+    """Область, которую может затронуть команда (точки плюс толщина линии)"""
+    xs = [x for x, _ in command.points]
+    ys = [y for _, y in command.points]
+    # ImageDraw рисует контур рамки уже толщины линии с выходом за рамку
+    # почти на всю толщину, поэтому запас - толщина, а не половина
+    margin = command.width + 1
+    return (min(xs) - margin, min(ys) - margin, max(xs) + margin + 1, max(ys) + margin + 1)
+
+
+# Функции воспроизведения команд: имя инструмента -> renderer(image, command),
+# renderer возвращает измененную область
+_renderers: Dict[str, Callable[[Image.Image, DrawCommand], Optional[Tuple]]] = {}
+
+
+def register_renderer(tool: str, renderer: Callable[[Image.Image, DrawCommand], Optional[Tuple]]):
+    """Зарегистрировать функцию воспроизведения команд инструмента"""
+    _renderers[tool] = renderer
+
+
+def render_command(image: Image.Image, command: DrawCommand) -> Optional[Tuple]:
+    """Воспроизвести команду на изображении (без участия Tk), вернуть измененную область"""
+    try:
+        renderer = _renderers[command.tool]
+    except KeyError:
+        raise ValueError(f"Нет функции воспроизведения для инструмента '{command.tool}'")
+    return renderer(image, command)
+
+
+class _Entry:
+    """Состояние в журнале: команда и/или опорный кадр"""
+
+    __slots__ = ("command", "keyframe")
+
+    def __init__(self, command: Optional[DrawCommand] = None,
+                 keyframe: Optional[Image.Image] = None):
+        self.command = command
+        self.keyframe = keyframe
+
+
+class CommandHistory:
+    """История в виде журнала команд с периодическими опорными кадрами.
+
+    Операции инструментов записываются как DrawCommand, а полный снимок
+    пикселей берется только каждые keyframe_interval команд. Отмена
+    восстанавливает ближайший опорный кадр и заново проигрывает команды.
+    Действия без команд (фильтры, трансформации) сохраняются опорными кадрами.
+    Интерфейс совместим с HistoryManager.
+    """
+
+    def __init__(self, max_history: int = 50, keyframe_interval: int = 10,
+                 memory_limit: Optional[int] = None):
+        self._entries: List[_Entry] = []
+        self._cursor = -1  # Индекс текущего состояния
+        self._head: Optional[Image.Image] = None  # Копия текущего состояния
+        self._max_history = max_history
+        self._keyframe_interval = keyframe_interval
+        self._memory_limit = memory_limit
+        # Область, переписанная последним undo/redo (None - все изображение)
+        self.last_changed_box: Optional[Tuple] = None
+
+    @property
+    def memory_limit(self) -> Optional[int]:
+        return self._memory_limit
+
+    def set_memory_limit(self, limit: Optional[int]):
+        """Установить бюджет памяти истории (байты, None - без ограничения)"""
+        if limit is not None and limit <= 0:
+            raise ValueError("Лимит памяти должен быть положительным")
+        self._memory_limit = limit
+        self._trim()
+
+    def push_state(self, state: Image.Image, dirty_box: Optional[Tuple] = None):
+        """Сохранить состояние в историю (перед действием).
+
+        dirty_box - область, в которой state мог измениться с последнего
+        обращения к истории (None - неизвестно).
+        """
+        self._truncate_redo()
+
+        if self._head is not None and self._is_head(state, dirty_box):
+            return  # Состояние уже записано в журнал
+
+        self._entries.append(_Entry(keyframe=_snapshot(state)))
+        self._cursor += 1
+        self._head = _snapshot(state)
+        self._trim()
+
+    def push_command(self, command: DrawCommand, state: Image.Image):
+        """Записать команду, результат которой - state"""
+        self._truncate_redo()
+
+        if self._head is None:
+            self.push_state(state)
+            return
+
+        entry = _Entry(command=command)
+        if self._commands_since_keyframe() + 1 >= self._keyframe_interval:
+            entry.keyframe = _snapshot(state)
+            self._head = _snapshot(state)
+        else:
+            render_command(self._head, command)
+
+        self._entries.append(entry)
+        self._cursor += 1
+        self._trim()
+
+    def _is_head(self, state: Image.Image, dirty_box: Optional[Tuple] = None) -> bool:
+        """Совпадает ли изображение с текущим состоянием журнала"""
+        if state.size != self._head.size or state.mode != self._head.mode:
+            return False
+        if dirty_box is None:
+            return np.array_equal(np.asarray(state), np.asarray(self._head))
+
+        # После каждого обращения к истории head совпадает с изображением,
+        # поэтому достаточно сравнить измененную область
+        x1, y1, x2, y2 = clip_box(dirty_box, state.width, state.height)
+        if x1 >= x2 or y1 >= y2:
+            return True
+        box = (x1, y1, x2, y2)
+        return np.array_equal(np.asarray(state.crop(box)), np.asarray(self._head.crop(box)))
+
+    def _truncate_redo(self):
+        del self._entries[self._cursor + 1:]
+
+    def _commands_since_keyframe(self) -> int:
+        count = 0
+        for entry in reversed(self._entries[:self._cursor + 1]):
+            if entry.keyframe is not None:
+                break
+            count += 1
+        return count
+
+    def _reconstruct(self, index: int) -> Image.Image:
+        """Восстановить состояние: ближайший опорный кадр + команды после него"""
+        start = index
+        while self._entries[start].keyframe is None:
+            start -= 1
+
+        image = _snapshot(self._entries[start].keyframe)
+        for entry in self._entries[start + 1:index + 1]:
+            render_command(image, entry.command)
+        return image
+
+    def _trim(self):
+        """Ограничить размер истории по числу состояний и памяти"""
+        while len(self._entries) > 1 and self._cursor > 0 and (
+                len(self._entries) > self._max_history or
+                (self._memory_limit is not None and self.memory_usage() > self._memory_limit)):
+            # Первое состояние всегда должно быть опорным кадром
+            if self._entries[1].keyframe is None:
+                self._entries[1].keyframe = self._reconstruct(1)
+            self._entries.pop(0)
+            self._cursor -= 1
+
+    def undo(self, current_state: Image.Image, dirty_box: Optional[Tuple] = None) -> Image.Image:
+        """Отменить последнее действие"""
+        if self._cursor <= 0:
+            return current_state
+
+        # Изменения без команды (после последнего сохранения) - в опорный кадр
+        self.last_changed_box = None
+        if not self._is_head(current_state, dirty_box):
+            self._truncate_redo()
+            self._entries.append(_Entry(keyframe=_snapshot(current_state)))
+            self._cursor += 1
+
+        self._cursor -= 1
+        self._head = self._reconstruct(self._cursor)
+        return _snapshot(self._head)
+
+    def redo(self, current_state: Image.Image, dirty_box: Optional[Tuple] = None) -> Image.Image:
+        """Вернуть отмененное действие"""
+        if not self.can_redo():
+            return current_state
+
+        self._cursor += 1
+        entry = self._entries[self._cursor]
+        self.last_changed_box = None
+        if entry.keyframe is not None:
+            self._head = _snapshot(entry.keyframe)
+            return _snapshot(entry.keyframe)
+
+        # Быстрый путь: проигрываем одну команду поверх текущего состояния
+        render_command(self._head, entry.command)
+        self.last_changed_box = render_command(current_state, entry.command)
+        return current_state
+
+    def can_undo(self) -> bool:
+        return self._cursor > 0
+
+    def can_redo(self) -> bool:
+        return self._cursor + 1 < len(self._entries)
+
+    def memory_usage(self) -> int:
+        """Объем памяти, занятой историей (байты)"""
+        total = _image_nbytes(self._head) if self._head is not None else 0
+        for entry in self._entries:
+            if entry.keyframe is not None:
+                total += _image_nbytes(entry.keyframe)
+            if entry.command is not None:
+                total += entry.command.nbytes
+        return total
+
+    def clear(self):
+        """Очистить историю"""
+        self._entries.clear()
+        self._cursor = -1
+        self._head = None
+
+
+def _snapshot(image: Image.Image) -> Image.Image:
+    """Копия состояния: у хранилищ PixelStore снимок (у TiledImage тайлы
+    общие до первой записи), у изображения PIL - копия всех пикселей"""
+    if not isinstance(image, PixelStore):
+        copy_meter.add(image_nbytes(image))
+    return image.copy()
+
+
+def _image_nbytes(image: Image.Image) -> int:
+    if isinstance(image, MappedImage):
+        return 0  # Пиксели во временном файле, а не в оперативной памяти
+    if isinstance(image, PixelStore):
+        return image.nbytes  # Хранимые тайлы в формате хранения
+    return image_nbytes(image)
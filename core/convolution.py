@@ -0,0 +1,147 @@
+# core/convolution.py
+import math
+from typing import Optional
+import numpy as np
+from PIL import Image, ImageFilter
+from core.tiled_executor import TiledExecutor, get_executor
+
+# Тиснение: направленная разность со сдвигом в серый
+EMBOSS_KERNEL = (-2, -1, 0, -1, 0, 1, 0, 1, 2)
+EMBOSS_OFFSET = 128
+
+
+def blur_radius(sigma: float) -> int:
+    """Сколько соседних строк затрагивает гауссово размытие Pillow.
+
+    GaussianBlur реализован тремя проходами box blur, каждый радиусом
+    около sigma, поэтому носитель - примерно 3 * sigma.
+    """
+    return math.ceil(3 * sigma) + 3
+
+
+def _premultiplied(image: Image.Image) -> Image.Image:
+    """Цвет, умноженный на альфу: прозрачные пиксели не "протекают" при свертке"""
+    if image.mode == "RGBA":
+        return image.convert("RGBa")
+    if image.mode == "LA":
+        return image.convert("La")
+    return image
+
+
+def _straight(image: Image.Image, mode: str) -> Image.Image:
+    return image.convert(mode) if image.mode != mode else image
+
+
+def _run(image: Image.Image, operation, overlap: int,
+         executor: Optional[TiledExecutor]) -> Image.Image:
+    """Выполнить операцию над полосами с перекрытием (ограничивает пиковую память)"""
+    executor = executor or get_executor()
+    return executor.map_strips(image, operation, overlap=overlap)
+
+
+def box_blur(image: Image.Image, radius: int,
+             executor: Optional[TiledExecutor] = None) -> Image.Image:
+    """Размытие по квадрату 2*radius+1.
+
+    Pillow считает его скользящей суммой по строкам и столбцам, поэтому
+    время не зависит от радиуса.
+    """
+    def operation(strip):
+        return _straight(_premultiplied(strip).filter(ImageFilter.BoxBlur(radius)), strip.mode)
+
+    return _run(image, operation, math.ceil(radius) + 1, executor)
+
+
+def gaussian_blur(image: Image.Image, sigma: float,
+                  executor: Optional[TiledExecutor] = None) -> Image.Image:
+    """Гауссово размытие (разделимое, три box-прохода) с премультиплицированной альфой"""
+    def operation(strip):
+        return _straight(_premultiplied(strip).filter(ImageFilter.GaussianBlur(sigma)), strip.mode)
+
+    return _run(image, operation, blur_radius(sigma), executor)
+
+
+def unsharp_mask(image: Image.Image, sigma: float = 2.0, percent: int = 150,
+                 threshold: int = 3, executor: Optional[TiledExecutor] = None) -> Image.Image:
+    """Нерезкое маскирование: усиление разницы с размытой копией больше порога"""
+    def operation(strip):
+        sharpened = _premultiplied(strip).filter(ImageFilter.UnsharpMask(sigma, percent, threshold))
+        return _straight(sharpened, strip.mode)
+
+    return _run(image, operation, blur_radius(sigma), executor)
+
+
+def sobel_magnitude(array: np.ndarray) -> np.ndarray:
+    """|Gx| + |Gy| оператора Собеля для массива uint8 (h, w) или (h, w, c).
+
+    Ядро Собеля разделимо: разность [-1, 0, 1] по одной оси и сглаживание
+    [1, 2, 1] по другой, все считается в int16 без временных float-массивов.
+    """
+    pad = ((1, 1), (1, 1)) + ((0, 0),) * (array.ndim - 2)
+    p = np.pad(array, pad, mode="edge").astype(np.int16)
+
+    dx = p[:, 2:] - p[:, :-2]
+    gx = dx[:-2] + 2 * dx[1:-1] + dx[2:]
+    sy = p[:, :-2] + 2 * p[:, 1:-1] + p[:, 2:]
+    gy = sy[2:] - sy[:-2]
+
+    np.abs(gx, out=gx)
+    np.abs(gy, out=gy)
+    gx += gy
+    return np.minimum(gx, 255).astype(np.uint8)
+
+
+def _color_bands(image: Image.Image):
+    """Цветовые каналы изображения и его альфа (None, если ее нет)"""
+    bands = image.split()
+    if image.mode in ("RGBA", "RGBa", "LA", "La"):
+        return bands[:-1], bands[-1]
+    return bands, None
+
+
+def edge_detect(image: Image.Image, executor: Optional[TiledExecutor] = None) -> Image.Image:
+    """Выделение краев: |Gx| + |Gy| Собеля по каждому цветовому каналу, альфа сохраняется"""
+    def operation(strip):
+        premultiplied = _premultiplied(strip)
+        colors, alpha = _color_bands(premultiplied)
+        color = colors[0] if len(colors) == 1 else Image.merge("RGB", colors)
+        edges = Image.fromarray(sobel_magnitude(np.asarray(color)), color.mode)
+        if alpha is None:
+            return edges
+        # Перепады считались по премультиплицированному цвету - делим на альфу
+        return _straight(Image.merge(premultiplied.mode, edges.split() + (alpha,)), strip.mode)
+
+    return _run(image, operation, 1, executor)
+
+
+def _straight_relief(relief: Image.Image, alpha: Image.Image) -> Image.Image:
+    """Рельеф премультиплицированной яркости в обычной альфе.
+
+    На альфу делится отклонение от серого EMBOSS_OFFSET, а не само значение:
+    ровная полупрозрачная область остается серой. Полностью прозрачные
+    пиксели получают серый.
+    """
+    a = np.asarray(alpha, dtype=np.float32)
+    deviation = np.asarray(relief, dtype=np.float32) - EMBOSS_OFFSET
+    np.multiply(deviation, 255, out=deviation)
+    np.divide(deviation, a, out=deviation, where=a > 0)
+    deviation[a == 0] = 0
+    straight = np.clip(np.rint(deviation) + EMBOSS_OFFSET, 0, 255).astype(np.uint8)
+    return Image.fromarray(straight, "L")
+
+
+def emboss(image: Image.Image, executor: Optional[TiledExecutor] = None) -> Image.Image:
+    """Тиснение по яркости премультиплицированного цвета, альфа сохраняется"""
+    def operation(strip):
+        premultiplied = _premultiplied(strip)
+        colors, alpha = _color_bands(premultiplied)
+        gray = colors[0] if len(colors) == 1 else Image.merge("RGB", colors).convert("L")
+        relief = gray.filter(ImageFilter.Kernel((3, 3), EMBOSS_KERNEL, 1, EMBOSS_OFFSET))
+        if alpha is not None:
+            relief = _straight_relief(relief, alpha)
+        bands = [relief] * len(colors)
+        if alpha is not None:
+            bands.append(alpha)
+        return Image.merge(strip.mode, bands)
+
+    return _run(image, operation, 1, executor)
@@ -0,0 +1,501 @@
+# core/flood_fill.py
+from collections import deque
+import numpy as np
+from PIL import Image
+from typing import Dict, Optional, Tuple
+from core.pixel_store import Tile
+from core.tiles import clip_box, tiles_in_box, union_box
+from utils.constants import ToleranceMetric
+
+# Допустимые типы связности: 4 - соседи по сторонам, 8 - и по диагоналям
+CONNECTIVITY = (4, 8)
+
+# Метрики допуска: максимум разницы по каналам или евклидово расстояние в RGBA
+METRIC_CHANNEL = ToleranceMetric.CHANNEL.value
+METRIC_EUCLIDEAN = ToleranceMetric.EUCLIDEAN.value
+
+# Высота полосы строк при построении маски допуска
+_BAND_ROWS = 128
+
+
+
+def pixel_view(array: np.ndarray) -> np.ndarray:
+    """Представление массива (h, w, c) как (h, w) с одним скаляром на пиксель.
+
+    Для 2 и 4 каналов uint8 это view без копирования (uint16/uint32),
+    сравнения и присваивания по нему идут за одну операцию на пиксель.
+    """
+    if array.ndim == 3 and array.shape[2] in (2, 4) and array.dtype == np.uint8:
+        dtype = np.uint32 if array.shape[2] == 4 else np.uint16
+        return np.ascontiguousarray(array).view(dtype)[..., 0]
+    return array
+
+
+def pixel_value(array: np.ndarray, color):
+    """Цвет в виде значения элемента pixel_view(array)"""
+    color = np.asarray(color, dtype=array.dtype)
+    if array.ndim == 3 and array.shape[2] in (2, 4) and array.dtype == np.uint8:
+        dtype = np.uint32 if array.shape[2] == 4 else np.uint16
+        return color.reshape(1, -1).view(dtype)[0, 0]
+    return color
+
+
+def color_mask(array: np.ndarray, color) -> np.ndarray:
+    """Маска пикселей массива, в точности совпадающих с цветом"""
+    view = pixel_view(array)
+    match = view == pixel_value(array, color)
+    return match if match.ndim == 2 else match.all(axis=2)
+
+
+def tolerance_mask(array: np.ndarray, color, tolerance: int = 0,
+                   metric: str = METRIC_CHANNEL) -> np.ndarray:
+    """Маска пикселей, отличающихся от цвета не больше чем на tolerance.
+
+    Маска считается за один векторный проход полосами строк (чтобы
+    промежуточные массивы помещались в кэш): для метрики по каналам -
+    сравнение каналов с границами, для евклидовой - сумма квадратов
+    разностей через таблицы по 256 значений на канал.
+    """
+    if tolerance <= 0:
+        return color_mask(array, color)
+    if metric not in (METRIC_CHANNEL, METRIC_EUCLIDEAN):
+        raise ValueError(f"Неизвестная метрика допуска: {metric}")
+
+    channels = array[..., None] if array.ndim == 2 else array
+    color = np.atleast_1d(np.asarray(color, dtype=np.int32))
+    levels = np.arange(256, dtype=np.int32)
+    squares = [(levels - value) ** 2 for value in color]
+    bounds = [(max(0, value - tolerance), min(255, value + tolerance)) for value in color]
+
+    mask = np.empty(channels.shape[:2], dtype=bool)
+    for y in range(0, channels.shape[0], _BAND_ROWS):
+        band = channels[y:y + _BAND_ROWS]
+        if metric == METRIC_CHANNEL:
+            match = np.ones(band.shape[:2], dtype=bool)
+            for k, (lo, hi) in enumerate(bounds):
+                if lo > 0:
+                    match &= band[..., k] >= lo
+                if hi < 255:
+                    match &= band[..., k] <= hi
+            mask[y:y + _BAND_ROWS] = match
+        else:
+            dist2 = np.take(squares[0], band[..., 0])
+            for k in range(1, len(squares)):
+                dist2 += np.take(squares[k], band[..., k])
+            np.less_equal(dist2, tolerance * tolerance, out=mask[y:y + _BAND_ROWS])
+    return mask
+
+
+def _neighbour_count(mask: np.ndarray, borders: Tuple[bool, bool, bool, bool]) -> np.ndarray:
+    """Число пикселей маски в окне 3x3 вокруг каждого пикселя (0..9).
+
+    borders - какие стороны (слева, сверху, справа, снизу) совпадают с краем
+    изображения: за краем маска продолжается, чтобы он не сглаживался.
+    """
+    padded = np.pad(mask.view(np.uint8), 1)
+    left, top, right, bottom = borders
+    if left:
+        padded[:, 0] = padded[:, 1]
+    if right:
+        padded[:, -1] = padded[:, -2]
+    if top:
+        padded[0] = padded[1]
+    if bottom:
+        padded[-1] = padded[-2]
+    h, w = mask.shape
+    total = np.zeros((h, w), dtype=np.uint8)
+    for dy in range(3):
+        for dx in range(3):
+            total += padded[dy:dy + h, dx:dx + w]
+    return total
+
+
+def paint_mask(image: Image.Image, mask: np.ndarray, bbox: Tuple, color: Tuple,
+               antialias: bool = False, array: Optional[np.ndarray] = None,
+               origin: Tuple[int, int] = (0, 0)):
+    """Закрасить пиксели маски цветом в пределах bbox (на месте).
+
+    array - уже полученный np.asarray(image), чтобы не копировать
+    изображение повторно. При antialias край области смешивается с исходными
+    пикселями пропорционально покрытию, чтобы граница не была ступенчатой.
+    Если mask, array и bbox относятся к фрагменту изображения, origin -
+    левый верхний угол фрагмента.
+    """
+    if array is None:
+        array = np.asarray(image)
+    x1, y1, x2, y2 = bbox
+    ox, oy = origin
+    region = array[y1:y2, x1:x2].copy()
+    region_mask = mask[y1:y2, x1:x2]
+
+    if antialias:
+        # Покрытие края - доля соседей 3x3, попавших в маску; соседи за
+        # рамкой bbox берутся из самой маски (она может быть шире рамки)
+        borders = (x1 + ox == 0, y1 + oy == 0, x2 + ox == image.width, y2 + oy == image.height)
+        ex1, ey1 = max(0, x1 - 1), max(0, y1 - 1)
+        ex2, ey2 = min(mask.shape[1], x2 + 1), min(mask.shape[0], y2 + 1)
+        count = _neighbour_count(mask[ey1:ey2, ex1:ex2], borders)
+        count = count[y1 - ey1:y1 - ey1 + y2 - y1, x1 - ex1:x1 - ex1 + x2 - x1]
+        edge = region_mask & (count < 9)
+        original = region[edge].astype(np.float32)
+
+    pixel_view(region)[region_mask] = pixel_value(region, color)
+
+    if antialias:
+        alpha = count[edge] / np.float32(9)
+        if original.ndim == 2:
+            alpha = alpha[:, None]
+        blended = original + (np.asarray(color, dtype=np.float32) - original) * alpha
+        region[edge] = np.clip(np.rint(blended), 0, 255).astype(np.uint8)
+
+    image.paste(Image.fromarray(region, image.mode), (x1 + ox, y1 + oy))
+
+
+def _limited(array: np.ndarray,
+             limit: Optional[Tuple]) -> Tuple[np.ndarray, Optional[np.ndarray], Tuple[int, int]]:
+    """Фрагмент массива пикселей для limit = (bbox, allowed), маска allowed
+    (bool, размер bbox) и левый верхний угол фрагмента"""
+    if limit is None:
+        return array, None, (0, 0)
+    (x1, y1, x2, y2), allowed = limit
+    return array[y1:y2, x1:x2], allowed, (x1, y1)
+
+
+def _offset(bbox: Tuple, origin: Tuple[int, int]) -> Tuple:
+    return (bbox[0] + origin[0], bbox[1] + origin[1], bbox[2] + origin[0], bbox[3] + origin[1])
+
+
+def mask_bbox(mask: np.ndarray) -> Optional[Tuple]:
+    """Границы ненулевой области маски (None для пустой маски)"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not len(rows):
+        return None
+    cols = np.flatnonzero(mask[rows[0]:rows[-1] + 1].any(axis=0))
+    return (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+
+
+def flood_fill_mask(match: np.ndarray, x: int, y: int,
+                    connectivity: int = 4) -> Tuple[np.ndarray, Optional[Tuple]]:
+    """Связная область маски match, содержащая точку (x, y).
+
+    Построчный (scanline) алгоритм: каждый отрезок строки находится и
+    закрашивается срезом NumPy, в стек попадают только начала отрезков
+    соседних строк. Возвращает маску области и ее границы (x1, y1, x2, y2);
+    если точка не входит в match, область пуста и границы - None.
+    """
+    if connectivity not in CONNECTIVITY:
+        raise ValueError(f"Связность должна быть 4 или 8, получено {connectivity}")
+
+    height, width = match.shape
+    filled = np.zeros((height, width), dtype=bool)
+    if not (0 <= x < width and 0 <= y < height) or not match[y, x]:
+        return filled, None
+
+    # Незакрашенные пиксели, подходящие под заливку
+    avail = match.copy()
+    reach = 1 if connectivity == 8 else 0
+    min_x, min_y, max_x, max_y = x, y, x, y
+
+    stack = [(x, y)]
+    while stack:
+        sx, sy = stack.pop()
+        row = avail[sy]
+        if not row[sx]:
+            continue
+
+        # Границы отрезка строки, содержащего (sx, sy)
+        left = row[sx::-1]
+        x1 = sx - (int(left.argmin()) if not left.all() else sx + 1) + 1
+        right = row[sx:]
+        x2 = sx + (int(right.argmin()) if not right.all() else width - sx)
+
+        row[x1:x2] = False
+        filled[sy, x1:x2] = True
+        min_x, max_x = min(min_x, x1), max(max_x, x2 - 1)
+        min_y, max_y = min(min_y, sy), max(max_y, sy)
+
+        lo, hi = max(0, x1 - reach), min(width, x2 + reach)
+        for ny in (sy - 1, sy + 1):
+            if not 0 <= ny < height:
+                continue
+            segment = avail[ny, lo:hi]
+            if not segment.any():
+                continue
+            # Начала отрезков соседней строки
+            starts = np.flatnonzero(segment & ~np.concatenate(([False], segment[:-1])))
+            stack.extend((lo + int(s), ny) for s in starts)
+
+    return filled, (min_x, min_y, max_x + 1, max_y + 1)
+
+
+def _bounds(image, limit: Optional[Tuple]) -> Tuple[int, int, int, int]:
+    return limit[0] if limit is not None else (0, 0, image.width, image.height)
+
+
+def _allowed_part(limit: Optional[Tuple], box: Tuple) -> Optional[np.ndarray]:
+    """Часть маски limit, приходящаяся на box (box лежит внутри рамки limit)"""
+    if limit is None:
+        return None
+    (lx, ly, _, _), allowed = limit
+    return allowed[box[1] - ly:box[3] - ly, box[0] - lx:box[2] - lx]
+
+
+def _tile_allowed(limit: Optional[Tuple], box: Tuple):
+    """Маска limit в тайле box: None - весь тайл разрешен, False - ничего,
+    иначе массив bool размера тайла"""
+    if limit is None:
+        return None
+    (lx1, ly1, lx2, ly2), allowed = limit
+    x1, y1, x2, y2 = box
+    px1, py1, px2, py2 = max(x1, lx1), max(y1, ly1), min(x2, lx2), min(y2, ly2)
+    if px1 >= px2 or py1 >= py2:
+        return False
+    part = allowed[py1 - ly1:py2 - ly1, px1 - lx1:px2 - lx1]
+    if (px1, py1, px2, py2) == tuple(box) and part.all():
+        return None
+    result = np.zeros((y2 - y1, x2 - x1), dtype=bool)
+    result[py1 - y1:py2 - y1, px1 - x1:px2 - x1] = part
+    return result
+
+
+def _edge_seeds(line: np.ndarray, size: int, connectivity: int) -> np.ndarray:
+    """Затравки соседнего тайла по закрашенным пикселям края line"""
+    positions = np.flatnonzero(line)
+    if connectivity == 8 and len(positions):
+        positions = np.unique(np.clip(np.concatenate((positions - 1, positions, positions + 1)),
+                                      0, size - 1))
+    return positions[positions < size]
+
+
+def flood_fill_tiles(image, x: int, y: int, target: Tuple, tolerance: int = 0,
+                     metric: str = METRIC_CHANNEL, connectivity: int = 4,
+                     limit: Optional[Tuple] = None) -> Dict[Tuple[int, int], object]:
+    """Связная область цвета target вокруг (x, y) в хранилище PixelStore.
+
+    Область растет по тайлам: внутри тайла - построчным алгоритмом, через
+    границу она переходит затравками в соседний тайл. Тайлы цвета фона
+    проверяются одним сравнением, а тайлы, вошедшие в область целиком,
+    хранятся без маски. Полное изображение не читается.
+
+    Возвращает {ключ тайла: маска bool тайла или True (весь тайл)}.
+    """
+    if connectivity not in CONNECTIVITY:
+        raise ValueError(f"Связность должна быть 4 или 8, получено {connectivity}")
+
+    size = image.tile_size
+    columns, rows = -(-image.width // size), -(-image.height // size)
+    background = np.asarray(Image.new(image.mode, (1, 1), image.color))
+    background = bool(tolerance_mask(background, target, tolerance, metric)[0, 0])
+    matches: Dict[Tuple[int, int], object] = {}
+    filled: Dict[Tuple[int, int], object] = {}
+
+    def match_for(key):
+        if key not in matches:
+            allowed = _tile_allowed(limit, image.tile_box(key))
+            tile = image.tile(key)
+            if allowed is False:
+                match = False
+            elif tile is None:
+                match = background if allowed is None or not background else allowed
+            else:
+                match = tolerance_mask(np.asarray(tile), target, tolerance, metric)
+                if allowed is not None:
+                    match = match & allowed
+                elif match.all():
+                    match = True
+            matches[key] = match
+        return matches[key]
+
+    key = (x // size, y // size)
+    queue = deque([(key, [(x - key[0] * size, y - key[1] * size)])])
+    while queue:
+        key, seeds = queue.popleft()
+        match = match_for(key)
+        done = filled.get(key)
+        if match is False or done is True:
+            continue
+        x1, y1, x2, y2 = image.tile_box(key)
+        width, height = x2 - x1, y2 - y1
+        before = done if done is not None else np.zeros((height, width), dtype=bool)
+
+        if match is True:
+            # Тайл подходит целиком: любая затравка заливает его весь
+            filled[key] = True
+            new = ~before
+        else:
+            current = before.copy()
+            avail = match & ~current
+            for sx, sy in seeds:
+                if avail[sy, sx]:
+                    region, _ = flood_fill_mask(avail, sx, sy, connectivity)
+                    current |= region
+                    avail &= ~region
+            new = current & ~before
+            if not new.any():
+                continue
+            filled[key] = True if current.all() else current
+
+        # Новые пиксели на краях тайла - затравки соседей
+        tx, ty = key
+        sides = ((1, 0, new[:, -1]), (-1, 0, new[:, 0]), (0, 1, new[-1]), (0, -1, new[0]))
+        for dx, dy, line in sides:
+            nx, ny = tx + dx, ty + dy
+            if not (0 <= nx < columns and 0 <= ny < rows) or not line.any():
+                continue
+            nbox = image.tile_box((nx, ny))
+            if dx:
+                positions = _edge_seeds(line, nbox[3] - nbox[1], connectivity)
+                column = 0 if dx > 0 else nbox[2] - nbox[0] - 1
+                queue.append(((nx, ny), [(column, int(p)) for p in positions]))
+            else:
+                positions = _edge_seeds(line, nbox[2] - nbox[0], connectivity)
+                row = 0 if dy > 0 else nbox[3] - nbox[1] - 1
+                queue.append(((nx, ny), [(int(p), row) for p in positions]))
+        if connectivity == 8:
+            corners = ((1, 1, new[-1, -1]), (-1, 1, new[-1, 0]),
+                       (1, -1, new[0, -1]), (-1, -1, new[0, 0]))
+            for dx, dy, corner in corners:
+                nx, ny = tx + dx, ty + dy
+                if corner and 0 <= nx < columns and 0 <= ny < rows:
+                    nbox = image.tile_box((nx, ny))
+                    column = 0 if dx > 0 else nbox[2] - nbox[0] - 1
+                    row = 0 if dy > 0 else nbox[3] - nbox[1] - 1
+                    queue.append(((nx, ny), [(column, row)]))
+    return filled
+
+
+def tiles_mask(image, filled: Dict[Tuple[int, int], object],
+               box: Tuple[int, int, int, int]) -> np.ndarray:
+    """Маска области flood_fill_tiles в прямоугольнике box"""
+    x1, y1, x2, y2 = box
+    mask = np.zeros((y2 - y1, x2 - x1), dtype=bool)
+    for key in tiles_in_box(box, image.width, image.height, image.tile_size):
+        tile_mask = filled.get(key)
+        if tile_mask is None:
+            continue
+        tx1, ty1, tx2, ty2 = image.tile_box(key)
+        px1, py1, px2, py2 = max(x1, tx1), max(y1, ty1), min(x2, tx2), min(y2, ty2)
+        target = mask[py1 - y1:py2 - y1, px1 - x1:px2 - x1]
+        if tile_mask is True:
+            target[:] = True
+        else:
+            target[:] = tile_mask[py1 - ty1:py2 - ty1, px1 - tx1:px2 - tx1]
+    return mask
+
+
+def _fill_tiles(image, filled: Dict[Tuple[int, int], object], color: Tuple,
+                antialias: bool) -> Optional[Tuple]:
+    """Закрасить область flood_fill_tiles; тайлы, залитые целиком, делят
+    один тайл цвета (копируется при записи)"""
+    solid: Dict[Tuple[int, int], Tile] = {}
+    changed = None
+    for key, tile_mask in filled.items():
+        box = image.tile_box(key)
+        x1, y1, x2, y2 = box
+        ext = clip_box((x1 - 1, y1 - 1, x2 + 1, y2 + 1), image.width, image.height)
+        mask = tiles_mask(image, filled, ext) if antialias or tile_mask is not True else None
+
+        if tile_mask is True and (mask is None or mask.all()):
+            size = (x2 - x1, y2 - y1)
+            if size not in solid:
+                solid[size] = image.solid_tile(size, color)
+            image.set_tile(key, solid[size])
+            changed = union_box(changed, box)
+            continue
+
+        inner = (x1 - ext[0], y1 - ext[1], x2 - ext[0], y2 - ext[1])
+        array = np.asarray(image.crop(ext))
+        paint_mask(image, mask, inner, color, antialias, array, ext[:2])
+        bbox = mask_bbox(mask[inner[1]:inner[3], inner[0]:inner[2]])
+        changed = union_box(changed, _offset(bbox, box[:2]))
+    return changed
+
+
+def flood_fill(image: Image.Image, x: int, y: int, color: Tuple,
+               connectivity: int = 4, tolerance: int = 0,
+               metric: str = METRIC_CHANNEL, antialias: bool = False,
+               limit: Optional[Tuple] = None) -> Optional[Tuple]:
+    """Залить связную область похожего цвета, начиная с точки (x, y).
+
+    Изображение изменяется на месте, перезаписывается только
+    прямоугольник области. Возвращает его (x1, y1, x2, y2) или None,
+    если ничего не изменилось. limit = (bbox, allowed) ограничивает заливку
+    пикселями маски allowed в рамке bbox (выделением); остальное
+    изображение не просматривается.
+    """
+    if not (0 <= x < image.width and 0 <= y < image.height):
+        return None
+
+    target = image.getpixel((x, y))
+    if target == color and tolerance <= 0:
+        return None
+
+    if not isinstance(image, Image.Image):
+        # Хранилище большого документа: заливка по тайлам, изображение целиком не читается
+        filled = flood_fill_tiles(image, x, y, target, tolerance, metric, connectivity, limit)
+        return _fill_tiles(image, filled, color, antialias) if filled else None
+
+    array, allowed, origin = _limited(np.asarray(image), limit)
+    match = tolerance_mask(array, target, tolerance, metric)
+    if allowed is not None:
+        match = match & allowed
+    mask, bbox = flood_fill_mask(match, x - origin[0], y - origin[1], connectivity)
+    if bbox is None:
+        return None
+
+    paint_mask(image, mask, bbox, color, antialias, array, origin)
+    return _offset(bbox, origin)
+
+
+def replace_color(image: Image.Image, target: Tuple, color: Tuple,
+                  tolerance: int = 0, metric: str = METRIC_CHANNEL,
+                  antialias: bool = False, limit: Optional[Tuple] = None) -> Optional[Tuple]:
+    """Заменить цвет target на color по всему изображению (на месте).
+
+    limit = (bbox, allowed) ограничивает замену пикселями маски allowed в
+    рамке bbox. Возвращает область изменений или None, если совпадений нет.
+    """
+    if target == color and tolerance <= 0:
+        return None
+    if not isinstance(image, Image.Image):
+        return _replace_color_strips(image, target, color, tolerance, metric, antialias, limit)
+
+    array, allowed, origin = _limited(np.asarray(image), limit)
+    mask = tolerance_mask(array, target, tolerance, metric)
+    if allowed is not None:
+        mask = mask & allowed
+    bbox = mask_bbox(mask)
+    if bbox is None:
+        return None
+
+    paint_mask(image, mask, bbox, color, antialias, array, origin)
+    return _offset(bbox, origin)
+
+
+def _replace_color_strips(image, target: Tuple, color: Tuple, tolerance: int,
+                          metric: str, antialias: bool, limit: Optional[Tuple]) -> Optional[Tuple]:
+    """replace_color для хранилища PixelStore: полосами строк (image.strips),
+    каждая читается с запасом в строку для сглаживания края"""
+    bx1, by1, bx2, by2 = _bounds(image, limit)
+    changed = None
+    last_row = None  # Маска последней строки предыдущей полосы (до закрашивания)
+    for y1, y2 in image.strips((bx1, by1, bx2, by2)):
+        top, bottom = max(by1, y1 - 1), min(by2, y2 + 1)
+        window = (bx1, top, bx2, bottom)
+        array = np.asarray(image.crop(window))
+        mask = tolerance_mask(array, target, tolerance, metric)
+        allowed = _allowed_part(limit, window)
+        if allowed is not None:
+            mask = mask & allowed
+        if last_row is not None and top < y1:
+            # Верхняя запасная строка уже закрашена предыдущей полосой
+            mask[0] = last_row
+        last_row = mask[y2 - 1 - top].copy()
+        # Рисуем только строки самой полосы, запасные строки - для соседей
+        inner = mask_bbox(mask[y1 - top:y2 - top])
+        if inner is None:
+            continue
+        bbox = (inner[0], inner[1] + y1 - top, inner[2], inner[3] + y1 - top)
+        paint_mask(image, mask, bbox, color, antialias, array, window[:2])
+        changed = union_box(changed, _offset(bbox, window[:2]))
+    return changed
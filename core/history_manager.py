@@ -1,78 +1,556 @@
 1.	# core/history_manager.py
-from typing import List, Any
-import copy
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
+import threading
+import zlib
+import numpy as np
 from PIL import Image
+from core.mapped_image import MappedImage
+from core.pixel_store import PixelStore, Tile, copy_meter, image_nbytes
+from core.tiled_image import TiledImage
+from core.tiles import TILE_SIZE, changed_tiles, tile_box, tiles_bbox, tiles_in_box
+
+
+class TileDelta:
+    """Тайлы одного состояния, отличающиеся от соседнего состояния в истории.
+
+    Дельта симметрична: при применении тайлы меняются местами с тайлами
+    изображения, и дельта начинает хранить вытесненные пиксели.
+    Если размеры состояний различаются, хранится изображение целиком.
+
+    Тайл хранится массивом пикселей, а у TiledImage - самим тайлом Tile
+    (None - тайл цвета фона): дельта становится еще одним владельцем
+    тайла, поэтому обмен с изображением не копирует пиксели.
+
+    Пиксели могут храниться как есть, сжатыми (zlib) или во временном
+    файле подкачки; перед применением дельта распаковывается автоматически.
+    """
+
+    def __init__(self, tile_size: int, tiles: Dict[Tuple[int, int], object] = None,
+                 full: Optional[np.ndarray] = None):
+        self.tile_size = tile_size
+        self.tiles = tiles or {}
+        self.full = full
+
+        # Упакованное представление: [(ключ тайла, форма, режим Tile)] и сжатые байты
+        self._layout: Optional[List[Tuple[Optional[Tuple[int, int]], Optional[Tuple],
+                                          Optional[str]]]] = None
+        self._packed: Optional[bytes] = None
+        self._spill_file = None
+        self._spill_pos: Optional[Tuple[int, int]] = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def __del__(self):
+        _release_tiles(getattr(self, "tiles", {}))
+
+    @property
+    def empty(self) -> bool:
+        return self._layout is None and self.full is None and not self.tiles
+
+    @property
+    def compressed(self) -> bool:
+        return self._layout is not None
+
+    def keys(self) -> Optional[set]:
+        """Индексы тайлов дельты (None, если хранится изображение целиком)"""
+        with self._lock:
+            if self._layout is not None:
+                keys = {key for key, _, _ in self._layout}
+                return None if None in keys else keys
+            if self.full is not None:
+                return None
+            return set(self.tiles)
+
+    @property
+    def spilled(self) -> bool:
+        return self._spill_pos is not None
+
+    @property
+    def nbytes(self) -> int:
+        """Объем оперативной памяти, занятой дельтой (байты)"""
+        if self._spill_pos is not None:
+            return 0
+        if self._packed is not None:
+            return len(self._packed)
+        if self.full is not None:
+            return _state_nbytes(self.full)
+        return sum(_tile_nbytes(tile) for tile in self.tiles.values())
+
+    def compress(self):
+        """Сжать пиксели дельты (можно вызывать из фонового потока)"""
+        with self._lock:
+            if self._layout is not None or self.empty or isinstance(self.full, PixelStore):
+                return  # Хранилище документа не сжимается: тайлы общие или пиксели на диске
+            version = self._version
+            if self.full is not None:
+                entries = [(None, self.full, None)]
+            else:
+                entries = [(key, np.asarray(tile.image), tile.image.mode)
+                           if isinstance(tile, Tile) else (key, tile, None)
+                           for key, tile in self.tiles.items()]
+
+        # zlib отпускает GIL, поэтому сжатие не блокирует интерфейс
+        packed = zlib.compress(b"".join(array.tobytes() for _, array, _ in entries
+                                        if array is not None), 1)
+
+        with self._lock:
+            if version != self._version or self._layout is not None:
+                return  # Дельта применялась или уже упакована, пока мы ее сжимали
+            self._layout = [(key, array.shape if array is not None else None, mode)
+                            for key, array, mode in entries]
+            self._packed = packed
+            _release_tiles(self.tiles)
+            self.tiles = {}
+            self.full = None
+
+    def spill(self, spill_file):
+        """Выгрузить сжатые пиксели во временный файл"""
+        self.compress()
+        with self._lock:
+            if self._packed is None:
+                return
+            spill_file.seek(0, 2)
+            offset = spill_file.tell()
+            spill_file.write(self._packed)
+            self._spill_file = spill_file
+            self._spill_pos = (offset, len(self._packed))
+            self._packed = None
+
+    def _load(self):
+        """Вернуть пиксели в несжатый вид (вызывается под блокировкой)"""
+        if self._layout is None:
+            return
+
+        if self._spill_pos is not None:
+            offset, length = self._spill_pos
+            self._spill_file.seek(offset)
+            packed = self._spill_file.read(length)
+        else:
+            packed = self._packed
+        raw = zlib.decompress(packed)
+
+        pos = 0
+        for key, shape, mode in self._layout:
+            if shape is None:
+                self.tiles[key] = None  # Тайл цвета фона
+                continue
+            size = int(np.prod(shape))
+            if mode is not None:
+                image = Image.frombytes(mode, (shape[1], shape[0]), raw[pos:pos + size])
+                self.tiles[key] = Tile(image).acquire()
+            else:
+                array = np.frombuffer(raw, dtype=np.uint8, count=size,
+                                      offset=pos).reshape(shape).copy()
+                if key is None:
+                    self.full = array
+                else:
+                    self.tiles[key] = array
+            pos += size
+
+        self._layout = None
+        self._packed = None
+        self._spill_file = None
+        self._spill_pos = None
+
+    def swap(self, array: np.ndarray) -> np.ndarray:
+        """Обменять тайлы с массивом (массив изменяется на месте)"""
+        with self._lock:
+            self._load()
+            self._version += 1
+
+            if self.full is not None:
+                array, self.full = self.full, array
+                return array
+
+            width, height = _state_size(array)
+            for (tx, ty), tile in self.tiles.items():
+                if not isinstance(tile, np.ndarray):
+                    # Тайлы меняются владельцами, пиксели не копируются
+                    old = array.tile_ref((tx, ty))
+                    _hold(old)
+                    array.set_tile((tx, ty), tile)
+                    if tile is not None:
+                        tile.release()
+                    self.tiles[(tx, ty)] = old
+                    continue
+                box = tile_box(tx, ty, width, height, self.tile_size)
+                old = _read(array, box).copy()
+                _write(array, box, tile)
+                copy_meter.add(old.nbytes + tile.nbytes)
+                self.tiles[(tx, ty)] = old
+            return array
+
+    def apply_to_image(self, image: Image.Image) -> Image.Image:
+        """Записать тайлы дельты в изображение (изображение изменяется на месте)"""
+        with self._lock:
+            self._load()
+
+            if isinstance(self.full, PixelStore):
+                return self.full.copy()
+            if self.full is not None:
+                copy_meter.add(self.full.nbytes)
+                return _array_to_image(self.full)
+
+            for (tx, ty), tile in self.tiles.items():
+                if isinstance(tile, np.ndarray):
+                    image.paste(Image.fromarray(tile), (tx * self.tile_size, ty * self.tile_size))
+                    copy_meter.add(tile.nbytes)
+                else:
+                    image.set_tile((tx, ty), tile)
+            return image
+
+
+def _array_to_image(array: np.ndarray) -> Image.Image:
+    """Создать изменяемое изображение из массива"""
+    return Image.fromarray(array).copy()
+
+
+def _hold(tile: Optional[Tile]) -> Optional[Tile]:
+    """Стать еще одним владельцем тайла (None - тайл цвета фона)"""
+    return tile.acquire() if tile is not None else None
+
+
+def _release_tiles(tiles: Dict[Tuple[int, int], object]):
+    for tile in tiles.values():
+        if isinstance(tile, Tile):
+            tile.release()
+
+
+def _tile_nbytes(tile) -> int:
+    if isinstance(tile, Tile):
+        return image_nbytes(tile.image)
+    return tile.nbytes if tile is not None else 0
+
+
+# Состояние истории - массив пикселей, а для хранилищ PixelStore - копия:
+# снимок TiledImage делит тайлы с изображением (копирование при записи),
+# копия MappedImage лежит в своем временном файле
+
+def _snapshot(state):
+    if isinstance(state, PixelStore):
+        return state.copy()
+    array = np.array(state)
+    copy_meter.add(array.nbytes)
+    return array
+
+
+def _state_size(state) -> Tuple[int, int]:
+    if isinstance(state, PixelStore):
+        return state.size
+    return state.shape[1], state.shape[0]
+
+
+def _state_nbytes(state) -> int:
+    """Оперативная память, занятая состоянием (у MappedImage пиксели на диске)"""
+    if isinstance(state, MappedImage):
+        return 0
+    return state.nbytes
+
+
+def _read(state, box: Tuple) -> np.ndarray:
+    x1, y1, x2, y2 = box
+    if isinstance(state, PixelStore):
+        return np.asarray(state.raw_crop(box))
+    return state[y1:y2, x1:x2]
+
+
+def _write(state, box: Tuple, tile: np.ndarray):
+    x1, y1, x2, y2 = box
+    if isinstance(state, PixelStore):
+        state.paste(Image.fromarray(tile), (x1, y1))
+    else:
+        state[y1:y2, x1:x2] = tile
+
+
+def _same_layout(base, state) -> bool:
+    """Можно ли сравнивать состояния по тайлам (тот же размер и формат)"""
+    if isinstance(base, PixelStore) or isinstance(state, PixelStore):
+        return (type(base) is type(state) and base.size == state.size and
+                base.mode == state.mode and base.pixel_format == state.pixel_format and
+                base.tile_size == state.tile_size)
+    channels = base.shape[2] if base.ndim == 3 else 1
+    return state.size == (base.shape[1], base.shape[0]) and len(state.getbands()) == channels
 
 
 class HistoryManager:
-    """Управление историей действий для Undo/Redo"""
+    """Управление историей действий для Undo/Redo.
+
+    Полностью хранится только верхнее состояние стека отмены, остальные
+    состояния хранятся как дельты из изменившихся тайлов (tile_size x tile_size).
+    Поэтому объем памяти растет с площадью правок, а не с размером холста.
+
+    Если задан memory_limit (байты), история держится в этом бюджете:
+    при превышении compress_ratio старые дельты сжимаются в фоне, при
+    превышении spill_ratio выгружаются во временный файл, а при превышении
+    самого бюджета сначала отбрасывается redo stack, затем старые действия.
+    """
 
-    def __init__(self, max_history: int = 50):
-        self._undo_stack: List[Image.Image] = []
-        self._redo_stack: List[Image.Image] = []
+    def __init__(self, max_history: int = 50, tile_size: int = TILE_SIZE,
+                 memory_limit: Optional[int] = None,
+                 compress_ratio: float = 0.5, spill_ratio: float = 0.75,
+                 keep_recent: int = 2):
+        # Дельта i переводит состояние i + 1 в состояние i
+        self._undo_stack: List[TileDelta] = []
+        # Дельта переводит состояние, возвращенное undo, в отмененное
+        self._redo_stack: List[TileDelta] = []
+        self._top: Optional[np.ndarray] = None
         self._max_history = max_history
+        self._tile_size = tile_size
+
+        # Тайлы, в которых изображение может отличаться от верхнего состояния
+        # помимо области, сообщенной вызывающим (None - любые)
+        self._stale: Optional[set] = None
+        # Область, переписанная последним undo/redo (None - все изображение)
+        self.last_changed_box: Optional[Tuple] = None
+
+        self._memory_limit = memory_limit
+        self._compress_ratio = compress_ratio
+        self._spill_ratio = spill_ratio
+        self._keep_recent = keep_recent  # Последние дельты не сжимаются
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._spill_file = None
 
-    def push_state(self, state: Image.Image):
-        """Сохранить состояние в историю"""
+    @property
+    def memory_limit(self) -> Optional[int]:
+        return self._memory_limit
+
+    def set_memory_limit(self, limit: Optional[int]):
+        """Установить бюджет памяти истории (байты, None - без ограничения)"""
+        if limit is not None and limit <= 0:
+            raise ValueError("Лимит памяти должен быть положительным")
+        self._memory_limit = limit
+        self._enforce_budget()
+
+    def push_state(self, state: Image.Image, dirty_box: Optional[Tuple] = None):
+        """Сохранить состояние в историю.
+
+        dirty_box - область, в которой state мог измениться с последнего
+        обращения к истории (None - неизвестно, сравнивается все изображение).
+        """
         # Очищаем redo stack при новом действии
         self._redo_stack.clear()
 
-        # Сохраняем копию состояния
-        state_copy = state.copy()
+        if self._top is None:
+            self._top = _snapshot(state)
+            self._stale = set()
+            return
 
-        # Проверяем, не идентично ли новое состояние последнему в истории
-        if self._undo_stack:
-            last_state = self._undo_stack[-1]
-            if self._images_equal(state_copy, last_state):
-                return  # Не сохраняем одинаковые состояния
+        delta = self._diff(state, dirty_box)
+        self._stale = set()
+        if delta.empty:
+            return  # Не сохраняем одинаковые состояния
 
-        self._undo_stack.append(state_copy)
+        # В верхнее состояние попадают новые тайлы, в дельту - старые
+        self._top = delta.swap(self._top)
+        self._undo_stack.append(delta)
 
-        # Ограничиваем размер истории
-        if len(self._undo_stack) > self._max_history:
+        self._trim()
+        self._enforce_budget()
+
+    def _diff(self, state: Image.Image, dirty_box: Optional[Tuple] = None) -> TileDelta:
+        """Дельта с тайлами state, отличающимися от верхнего состояния"""
+        base = self._top
+        if not _same_layout(base, state):
+            return TileDelta(self._tile_size, full=_snapshot(state))
+        width, height = _state_size(base)
+
+        region = self._diff_region(dirty_box, width, height)
+        tiles = {}
+        if self._shares_tiles(state):
+            # Тайлы, общие с верхним состоянием, заведомо не менялись;
+            # изменившиеся дельта забирает без копирования
+            if region is None:
+                region = tiles_in_box((0, 0, width, height), width, height, self._tile_size)
+            for key in region:
+                if state.shares_tile(base, key):
+                    continue
+                box = tile_box(key[0], key[1], width, height, self._tile_size)
+                if not np.array_equal(_read(state, box), _read(base, box)):
+                    tiles[key] = _hold(state.tile_ref(key))
+            return TileDelta(self._tile_size, tiles)
+
+        if region is None and isinstance(state, PixelStore):
+            # Хранилище сравниваем полосами, не читая его в память целиком
+            step = self._tile_size * max(1, state.strip_rows // self._tile_size)
+            for y in range(0, height, step):
+                box = (0, y, width, min(height, y + step))
+                new, old = _read(state, box), _read(base, box)
+                for tx, ty in changed_tiles(old, new, self._tile_size):
+                    x1, y1, x2, y2 = tile_box(tx, ty, width, box[3] - y, self._tile_size)
+                    tiles[(tx, ty + y // self._tile_size)] = new[y1:y2, x1:x2].copy()
+        elif region is None:
+            # Сравниваем все изображение одним векторным проходом
+            other = np.asarray(state)
+            for tx, ty in changed_tiles(base, other, self._tile_size):
+                x1, y1, x2, y2 = tile_box(tx, ty, width, height, self._tile_size)
+                tiles[(tx, ty)] = other[y1:y2, x1:x2].copy()
+        else:
+            # Сравниваем только тайлы, которые могли измениться
+            for tx, ty in region:
+                box = tile_box(tx, ty, width, height, self._tile_size)
+                if isinstance(state, PixelStore):
+                    tile = _read(state, box)
+                else:
+                    tile = np.asarray(state.crop(box))
+                if not np.array_equal(tile, _read(base, box)):
+                    tiles[(tx, ty)] = tile
+        copy_meter.add(sum(tile.nbytes for tile in tiles.values()))
+        return TileDelta(self._tile_size, tiles)
+
+    def _shares_tiles(self, state) -> bool:
+        """Обмениваются ли история и state самими тайлами (TiledImage с той же сеткой)"""
+        return isinstance(state, TiledImage) and state.tile_size == self._tile_size
+
+    def _diff_region(self, dirty_box: Optional[Tuple], width: int, height: int) -> Optional[set]:
+        """Тайлы для сравнения (None - сравнивать все изображение)"""
+        if dirty_box is None or self._stale is None:
+            return None
+
+        region = set(tiles_in_box(dirty_box, width, height, self._tile_size)) | self._stale
+        total = (-(-width // self._tile_size)) * (-(-height // self._tile_size))
+        if len(region) * 2 > total:
+            return None  # Выгоднее сравнить все сразу
+        return region
+
+    def _trim(self):
+        """Ограничить размер истории"""
+        while self._state_count() > self._max_history:
             self._undo_stack.pop(0)
 
-    def _images_equal(self, img1: Image.Image, img2: Image.Image) -> bool:
-        """Проверить, идентичны ли два изображения"""
-        if img1.size != img2.size or img1.mode != img2.mode:
-            return False
+    def _state_count(self) -> int:
+        if self._top is None:
+            return 0
+        return len(self._undo_stack) + 1
+
+    def _enforce_budget(self):
+        """Удержать историю в бюджете памяти"""
+        if self._memory_limit is None:
+            return
+
+        # Старые дельты (от дальних к ближним), последние остаются несжатыми
+        keep = self._keep_recent
+        candidates = self._undo_stack[:max(0, len(self._undo_stack) - keep)]
+        candidates += self._redo_stack[:max(0, len(self._redo_stack) - keep)]
 
-        # Сравниваем данные пикселей
-        return list(img1.getdata()) == list(img2.getdata())
+        usage = self.memory_usage()
+        if usage > self._memory_limit * self._compress_ratio:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            for delta in candidates:
+                if not delta.compressed:
+                    self._executor.submit(delta.compress)
 
-    def undo(self, current_state: Image.Image) -> Image.Image:
-        """Отменить последнее действие"""
-        if not self._undo_stack:
+        if usage > self._memory_limit * self._spill_ratio:
+            if self._spill_file is None:
+                self._spill_file = tempfile.TemporaryFile(prefix="history_")
+            for delta in candidates:
+                if usage <= self._memory_limit * self._spill_ratio:
+                    break
+                if not delta.spilled:
+                    usage -= delta.nbytes
+                    delta.spill(self._spill_file)
+
+        # Памяти не хватает: сначала жертвуем redo stack, затем старыми действиями
+        while usage > self._memory_limit and self._redo_stack:
+            usage -= self._redo_stack.pop(0).nbytes
+        while usage > self._memory_limit and self._undo_stack:
+            usage -= self._undo_stack.pop(0).nbytes
+
+    def undo(self, current_state: Image.Image, dirty_box: Optional[Tuple] = None) -> Image.Image:
+        """Отменить последнее действие.
+
+        Тайлы переписываются в current_state на месте, если размер не менялся;
+        переписанная область сохраняется в last_changed_box.
+        """
+        if self._top is None:
             return current_state
 
-        # Сохраняем текущее состояние в redo stack
-        self._redo_stack.append(current_state.copy())
+        # Сохраняем в redo stack тайлы текущего состояния, отличные от верхнего
+        redo_delta = self._diff(current_state, dirty_box)
+        self._redo_stack.append(redo_delta)
 
-        # Восстанавливаем предыдущее состояние
-        previous_state = self._undo_stack.pop()
+        # Восстанавливаем верхнее состояние: возвращаем его тайлы в изображение
+        restore = TileDelta(self._tile_size)
+        if redo_delta.full is not None:
+            restore.full = self._top
+        else:
+            width, height = _state_size(self._top)
+            for tx, ty in redo_delta.tiles:
+                if self._shares_tiles(self._top):
+                    restore.tiles[(tx, ty)] = _hold(self._top.tile_ref((tx, ty)))
+                    continue
+                box = tile_box(tx, ty, width, height, self._tile_size)
+                restore.tiles[(tx, ty)] = _read(self._top, box)
+        previous_state = restore.apply_to_image(current_state)
+        self.last_changed_box = self._keys_box(redo_delta.keys())
+
+        # Снимаем верхнее состояние со стека; изображение теперь отличается
+        # от нового верхнего состояния ровно в тайлах снятой дельты
+        if self._undo_stack:
+            delta = self._undo_stack.pop()
+            self._stale = delta.keys()
+            self._top = delta.swap(self._top)
+        else:
+            self._top = None
+            self._stale = None
 
+        self._enforce_budget()
         return previous_state
 
-    def redo(self, current_state: Image.Image) -> Image.Image:
-        """Вернуть отмененное действие"""
+    def redo(self, current_state: Image.Image, dirty_box: Optional[Tuple] = None) -> Image.Image:
+        """Вернуть отмененное действие.
+
+        Тайлы переписываются в current_state на месте, если размер не менялся;
+        переписанная область сохраняется в last_changed_box.
+        """
         if not self._redo_stack:
             return current_state
 
         # Сохраняем текущее состояние в undo stack
-        self._undo_stack.append(current_state.copy())
+        if self._top is None:
+            self._top = _snapshot(current_state)
+        else:
+            delta = self._diff(current_state, dirty_box)
+            self._top = delta.swap(self._top)
+            self._undo_stack.append(delta)
+            self._trim()
 
         # Восстанавливаем состояние из redo
-        next_state = self._redo_stack.pop()
-
+        delta = self._redo_stack.pop()
+        self._stale = delta.keys()
+        self.last_changed_box = self._keys_box(self._stale)
+        next_state = delta.apply_to_image(current_state)
+        self._enforce_budget()
         return next_state
 
+    def _keys_box(self, keys: Optional[set]) -> Optional[Tuple]:
+        """Область набора тайлов (None - все изображение)"""
+        if keys is None or self._top is None:
+            return None
+        width, height = _state_size(self._top)
+        return tiles_bbox(keys, width, height, self._tile_size) or (0, 0, 0, 0)
+
     def can_undo(self) -> bool:
-        return len(self._undo_stack) > 1  # >1 потому что текущее состояние тоже в стеке
+        return self._state_count() > 1  # >1 потому что текущее состояние тоже в стеке
 
     def can_redo(self) -> bool:
         return len(self._redo_stack) > 0
 
+    def memory_usage(self) -> int:
+        """Объем оперативной памяти, занятой историей (байты)"""
+        total = _state_nbytes(self._top) if self._top is not None else 0
+        total += sum(delta.nbytes for delta in self._undo_stack)
+        total += sum(delta.nbytes for delta in self._redo_stack)
+        return total
+
     def clear(self):
         """Очистить историю"""
         self._undo_stack.clear()
         self._redo_stack.clear()
+        self._top = None
+        self._stale = None
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
@@ -1,26 +1,106 @@
 2.	# core/image_model.py
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance
+from PIL import Image, ImageDraw, ImageFont
 import numpy as np
-from typing import Optional, Tuple, List
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional, Tuple, List
 import copy
+import math
+from core.tiles import clip_box, union_box
+from core.flood_fill import METRIC_CHANNEL, flood_fill, replace_color
+from core.point_ops import PointPipeline, brightness_contrast_pipeline
+from core.mapped_image import MappedImage
+from core.pixel_format import PIXEL_FORMATS, color_format, compact_image, has_alpha, has_color
+from core.pixel_store import PixelStore, map_strips_in_place
+from core.tiled_executor import get_executor
+from core.tiled_image import TiledImage
+from core.transforms import AffineTransform
+from core.selection import (TRANSPARENT, SelectionMask, apply_in_selection, magic_wand,
+                            move_region)
+from core.convolution import (blur_radius, box_blur, edge_detect, emboss, gaussian_blur,
+                              unsharp_mask)
+from utils.constants import PixelStorage, SelectionMode
+
+# Сколько последних изменений помнит журнал грязных областей
+DIRTY_LOG_SIZE = 256
 
 
 class ImageModel:
     """Модель, хранящая состояние изображения и данные"""
 
-    def __init__(self, width: int = 800, height: int = 600, bg_color: Tuple = (255, 255, 255, 255)):
-        self._image = Image.new("RGBA", (width, height), bg_color)
-        self._original_image = self._image.copy()
-        self._selection = None
+    def __init__(self, width: int = 800, height: int = 600, bg_color: Tuple = (255, 255, 255, 255),
+                 storage: Optional[PixelStorage] = None):
+        self._image = self._new_image((width, height), bg_color, storage)
+        self._selection: Optional[SelectionMask] = None
         self._clipboard = None
         self._modified = False
         self._current_color = (0, 0, 0, 255)
         self._filepath = None
 
+        # Поколение растет при каждом изменении пикселей; журнал хранит
+        # (поколение, измененная область) для запросов "что изменилось с G"
+        self._generation = 0
+        self._dirty_log = deque(maxlen=DIRTY_LOG_SIZE)
+        self._dirty_bbox = None
+
+        # Цепочка подряд идущих изменений размера/поворотов: исходное
+        # изображение и суммарное преобразование (сбрасывается любым другим изменением)
+        self._transform_source: Optional[Image.Image] = None
+        self._transform: Optional[AffineTransform] = None
+
+        # Отчет о ходе долгих операций (у копии, работающей в фоне, см. fork)
+        self._progress: Optional[Callable[[float], None]] = None
+        self._fork_generation: Optional[int] = None
+
     @property
     def image(self) -> Image.Image:
+        """Пиксели документа: Image, TiledImage или MappedImage (см. storage)"""
         return self._image
 
+    @property
+    def storage(self) -> PixelStorage:
+        """Как хранятся пиксели документа"""
+        if isinstance(self._image, TiledImage):
+            return PixelStorage.TILED
+        if isinstance(self._image, MappedImage):
+            return PixelStorage.MAPPED
+        return PixelStorage.MEMORY
+
+    @property
+    def pixel_format(self) -> str:
+        """Формат, в котором хранятся пиксели (L, LA, RGB, RGBA); операции
+        всегда видят RGBA, формат расширяется по мере надобности"""
+        return getattr(self._image, "pixel_format", self._image.mode)
+
+    @staticmethod
+    def _choose_storage(storage: Optional[PixelStorage]) -> PixelStorage:
+        # None - тайлы: снимки для истории делят тайлы с документом и
+        # копируют их только при записи; файл подкачки выбирается явно
+        return storage if storage is not None else PixelStorage.TILED
+
+    def _new_image(self, size: Tuple[int, int], color: Tuple, storage: Optional[PixelStorage]):
+        storage = self._choose_storage(storage)
+        # Хранилища начинают с наименьшего формата, вмещающего цвет фона
+        if storage is PixelStorage.TILED:
+            return TiledImage(size, color, pixel_format=color_format(color))
+        if storage is PixelStorage.MAPPED:
+            return MappedImage(size, color, pixel_format=color_format(color))
+        return Image.new("RGBA", size, color)
+
+    def _full_image(self, image=None) -> Image.Image:
+        """Полное изображение PIL для операций над всем холстом (у хранилищ
+        больших документов собирается только здесь)"""
+        image = self._image if image is None else image
+        return image.to_image() if isinstance(image, PixelStore) else image
+
+    def _store(self, image: Image.Image):
+        """Записать результат операции над всем холстом в текущее хранилище"""
+        if isinstance(self._image, TiledImage):
+            image = TiledImage.from_image(image, self._image.color, compact=True)
+        elif isinstance(self._image, MappedImage):
+            image = MappedImage.from_image(image, self._image.color, compact=True)
+        self._image = image
+
     @property
     def width(self) -> int:
         return self._image.width
@@ -31,6 +111,12 @@ class ImageModel:
 
     @property
     def selection(self) -> Optional[Tuple]:
+        """Рамка выделения (x1, y1, x2, y2) или None"""
+        return self._selection.bbox if self._selection is not None else None
+
+    @property
+    def selection_mask(self) -> Optional[SelectionMask]:
+        """Выделение произвольной формы (None - выделения нет)"""
         return self._selection
 
     @property
@@ -53,30 +139,166 @@ class ImageModel:
     def filepath(self) -> Optional[str]:
         return self._filepath
 
-    def create_new(self, width: int, height: int, bg_color: Tuple = (255, 255, 255, 255)):
-        self._image = Image.new("RGBA", (width, height), bg_color)
-        self._original_image = self._image.copy()
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def dirty_bbox(self) -> Optional[Tuple]:
+        """Накопленная область изменений с последнего clear_dirty()"""
+        return self._dirty_bbox
+
+    def mark_dirty(self, bbox: Optional[Tuple] = None):
+        """Отметить изменение пикселей в области bbox (None - все изображение)"""
+        if bbox is None:
+            bbox = (0, 0, self.width, self.height)
+        else:
+            bbox = clip_box(bbox, self.width, self.height)
+            if bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+                return
+
+        self._generation += 1
+        self._dirty_log.append((self._generation, bbox))
+        self._dirty_bbox = union_box(self._dirty_bbox, bbox)
+        self._transform_source = None
+        self._transform = None
+
+    def changes_since(self, generation: int) -> Optional[Tuple]:
+        """Область, измененная после поколения generation (None - изменений нет).
+
+        Журнал ограничен DIRTY_LOG_SIZE записями, поэтому время ответа
+        не зависит от размера изображения; для слишком старых поколений
+        возвращается все изображение.
+        """
+        if generation >= self._generation:
+            return None
+        if not self._dirty_log or self._dirty_log[0][0] > generation + 1:
+            return (0, 0, self.width, self.height)
+
+        bbox = None
+        for entry_generation, entry_bbox in reversed(self._dirty_log):
+            if entry_generation <= generation:
+                break
+            bbox = union_box(bbox, entry_bbox)
+        return clip_box(bbox, self.width, self.height)
+
+    def clear_dirty(self):
+        """Сбросить накопленную область изменений"""
+        self._dirty_bbox = None
+
+    def set_image(self, image: Image.Image, dirty_bbox: Optional[Tuple] = None):
+        """Заменить изображение (dirty_bbox - измененная область, None - все)"""
+        if image.size != self._image.size:
+            dirty_bbox = None
+        self._image = image
+        self.mark_dirty(dirty_bbox)
+
+    def fork(self, snapshot: bool = True) -> "ImageModel":
+        """Копия модели для операции в фоновой задаче (см. core/jobs.py).
+
+        Копия получает снимок пикселей (у TiledImage - за O(число тайлов),
+        тайлы общие до первой записи) и свой журнал изменений, поэтому
+        обычные методы модели выполняются на ней в другом потоке, не трогая
+        документ. Вызывается в потоке интерфейса, пока модель никто не
+        меняет, иначе снимок может оказаться несогласованным. snapshot=False -
+        копия работает с теми же пикселями: для операций, которые документ
+        только читают (сохранение) или заменяют целиком (загрузка).
+        Результат переносится в документ через commit.
+        """
+        fork = copy.copy(self)
+        if snapshot:
+            fork._image = self._image.copy()
+        fork._dirty_log = copy.copy(self._dirty_log)
+        fork._progress = None
+        fork._fork_generation = self._generation
+        return fork
+
+    @property
+    def progress(self) -> Optional[Callable[[float], None]]:
+        """Отчет о ходе: progress(доля) вызывается операциями, которые идут
+        полосами; исключение из него (отмена задачи) прерывает операцию"""
+        return self._progress
+
+    @progress.setter
+    def progress(self, progress: Optional[Callable[[float], None]]):
+        self._progress = progress
+
+    def is_current(self, fork: "ImageModel") -> bool:
+        """Не менялась ли модель после создания копии fork (тогда ее результат
+        можно перенести через commit)"""
+        return fork._fork_generation == self._generation
+
+    def commit(self, fork: "ImageModel") -> bool:
+        """Атомарно перенести результат копии fork в модель.
+
+        Переносятся пиксели, выделение, цепочка преобразований, путь к
+        файлу и признак изменения; измененная копией область отмечается
+        грязной. Если модель изменилась после создания копии, результат
+        отбрасывается и возвращается False.
+        """
+        if not self.is_current(fork):
+            return False
+        changed = fork.changes_since(fork._fork_generation)
+        resized = fork._image.size != self._image.size
+
+        self._image = fork._image
+        self._selection = fork._selection
+        self._modified = fork._modified
+        self._filepath = fork._filepath
+        if changed is not None or resized:
+            self.mark_dirty(None if resized else changed)
+        # mark_dirty сбрасывает цепочку; продолжаем цепочку копии
+        self._transform_source = fork._transform_source
+        self._transform = fork._transform
+        return True
+
+    def create_new(self, width: int, height: int, bg_color: Tuple = (255, 255, 255, 255),
+                   storage: Optional[PixelStorage] = None):
+        self._image = self._new_image((width, height), bg_color, storage)
         self._selection = None
         self._modified = False
         self._filepath = None
+        self.mark_dirty()
 
-    def load_image(self, filepath: str):
+    def load_image(self, filepath: str, storage: Optional[PixelStorage] = None):
         try:
-            self._image = Image.open(filepath).convert("RGBA")
-            self._original_image = self._image.copy()
+            image = Image.open(filepath)
+            storage = self._choose_storage(storage)
+            if storage is PixelStorage.MEMORY:
+                image = image.convert("RGBA")
+            else:
+                # Хранилище берет наименьший формат, вмещающий пиксели файла:
+                # серый скан остается L, непрозрачное фото - RGB
+                if image.mode not in PIXEL_FORMATS:
+                    image = image.convert("L" if image.mode == "1" else "RGBA")
+                if storage is PixelStorage.MAPPED:
+                    image = MappedImage.from_image(image, compact=True)
+                else:
+                    image = TiledImage.from_image(image, compact=True)
+            self._image = image
+            self._selection = None
             self._modified = False
             self._filepath = filepath
+            self.mark_dirty()
         except Exception as e:
             raise ValueError(f"Ошибка загрузки: {e}")
 
     def save_image(self, filepath: str, format: str = "PNG"):
         try:
-            if format.upper() == "JPEG" or format.upper() == "JPG":
-                save_image = self._image.convert("RGB")
+            mode = "RGB" if format.upper() == "JPEG" or format.upper() == "JPG" else None
+            if isinstance(self._image, PixelStore):
+                # Хранилище сохраняется в своем формате (без потерь); MappedImage
+                # кодируется прямо из файла подкачки, без копии холста
+                pixel_format = self._image.pixel_format
+                if mode is not None:
+                    mode = "RGB" if has_color(pixel_format) else "L"
+                elif format.upper() != "BMP" or pixel_format != "LA":
+                    mode = pixel_format
+                self._image.save(filepath, format, mode)
+            elif mode is not None:
+                self._image.convert(mode).save(filepath, format=format)
             else:
-                save_image = self._image
-
-            save_image.save(filepath, format=format)
+                self._image.save(filepath, format=format)
             self._modified = False
             self._filepath = filepath
         except Exception as e:
@@ -86,137 +308,285 @@ class ImageModel:
         if new_width <= 0 or new_height <= 0:
             raise ValueError("Размеры должны быть положительными")
 
-        self._image = self._image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        self._modified = True
+        self._apply_transform(self._current_transform().then_resize(new_width, new_height))
 
     def rotate(self, angle: float):
-        self._image = self._image.rotate(angle, expand=True)
+        self._apply_transform(self._current_transform().then_rotate(angle, expand=True))
+
+    def _current_transform(self) -> AffineTransform:
+        """Преобразование, к которому добавляется следующий шаг цепочки"""
+        if self._transform is None:
+            self._transform_source = self._image
+            self._transform = AffineTransform(self._image.size)
+        return self._transform
+
+    def _apply_transform(self, transform: AffineTransform):
+        """Пересчитать изображение из начала цепочки одним проходом"""
+        source = self._transform_source
+        self._store(transform.apply(self._full_image(source), get_executor()))
+        self._selection = None
         self._modified = True
+        self.mark_dirty()
+        # Следующий поворот или изменение размера продолжит эту цепочку
+        self._transform_source = source
+        self._transform = transform
 
     def crop(self, bbox: Tuple):
-        self._image = self._image.crop(bbox)
+        if isinstance(self._image, PixelStore):
+            self._image = self._image.cropped(bbox)
+        else:
+            self._image = self._image.crop(bbox)
         self._selection = None
         self._modified = True
+        self.mark_dirty()
 
     def apply_filter(self, filter_type: str, **kwargs):
+        """Применить фильтр или коррекцию.
+
+        Если есть выделение, обрабатывается только его рамка (с запасом на
+        окрестность фильтра), результат вставляется через маску выделения,
+        и измененной отмечается только эта область. Хранилище большого
+        документа без выделения обрабатывается полосами на месте.
+        """
+        operation, margin = self._filter_operation(filter_type, kwargs)
+        if operation is None:
+            return
+
+        if self._selection is None and isinstance(self._image, PixelStore):
+            map_strips_in_place(self._image, operation, margin, self._progress)
+            self.mark_dirty()
+        elif self._selection is None:
+            self._store(operation(self._full_image()))
+            self.mark_dirty()
+        else:
+            self.mark_dirty(apply_in_selection(self._image, self._selection, operation, margin))
+        self._modified = True
+
+    def _filter_operation(self, filter_type: str,
+                          kwargs: dict) -> Tuple[Optional[Callable[[Image.Image], Image.Image]], int]:
+        """Операция фильтра над изображением (или его фрагментом) и радиус ее окрестности"""
         if filter_type == "grayscale":
-            gray = self._image.convert("L")
-            self._image = gray.convert("RGBA")
+            return (lambda image: get_executor().map_strips(
+                image, lambda strip: strip.convert("L").convert("RGBA"))), 0
 
         elif filter_type == "invert":
-            if self._image.mode == 'RGBA':
-                r, g, b, a = self._image.split()
-                rgb = Image.merge('RGB', (r, g, b))
-                inverted = Image.eval(rgb, lambda x: 255 - x)
-                r2, g2, b2 = inverted.split()
-                self._image = Image.merge('RGBA', (r2, g2, b2, a))
-            else:
-                self._image = Image.eval(self._image, lambda x: 255 - x)
+            return self._point_operation(PointPipeline().invert()), 0
 
         elif filter_type == "brightness_contrast":
             brightness = kwargs.get('brightness', 0)
             contrast = kwargs.get('contrast', 0)
-
-            brightness_factor = (brightness + 100) / 100.0
-            contrast_factor = (contrast + 100) / 100.0
-
-            enhancer = ImageEnhance.Brightness(self._image)
-            img = enhancer.enhance(brightness_factor)
-
-            enhancer = ImageEnhance.Contrast(img)
-            self._image = enhancer.enhance(contrast_factor)
-
-        self._modified = True
-
-    def set_selection(self, bbox: Optional[Tuple]):
-        self._selection = bbox
+            return self._point_operation(brightness_contrast_pipeline(brightness, contrast)), 0
+
+        elif filter_type == "gamma":
+            return self._point_operation(PointPipeline().gamma(kwargs.get('gamma', 1.0))), 0
+
+        elif filter_type == "levels":
+            return self._point_operation(PointPipeline().levels(**kwargs)), 0
+
+        elif filter_type == "curves":
+            return self._point_operation(PointPipeline().curves(kwargs['points'])), 0
+
+        elif filter_type == "point":
+            # Произвольная цепочка точечных операций за один проход
+            return self._point_operation(kwargs['pipeline']), 0
+
+        elif filter_type == "box_blur":
+            radius = kwargs.get('radius', 2)
+            return (lambda image: box_blur(image, radius)), math.ceil(radius) + 1
+
+        elif filter_type == "gaussian_blur":
+            radius = kwargs.get('radius', 2)
+            return (lambda image: gaussian_blur(image, radius)), blur_radius(radius)
+
+        elif filter_type == "unsharp_mask":
+            radius = kwargs.get('radius', 2)
+            percent = kwargs.get('percent', 150)
+            threshold = kwargs.get('threshold', 3)
+            return ((lambda image: unsharp_mask(image, radius, percent, threshold)),
+                    blur_radius(radius))
+
+        elif filter_type == "edge_detect":
+            return edge_detect, 1
+
+        elif filter_type == "emboss":
+            return emboss, 1
+
+        return None, 0
+
+    def _point_operation(self, pipeline: PointPipeline) -> Callable[[Image.Image], Image.Image]:
+        """Цепочка точечных операций, применяемая полосами в пуле потоков"""
+        # Таблица собирается один раз по всем обрабатываемым пикселям
+        # (контраст зависит от их яркости), а не по фрагменту, который
+        # получит операция: изображение может обрабатываться полосами
+        lut = pipeline.compile(self.histogram() if pipeline.needs_histogram else None)
+        return lambda image: get_executor().map_strips(image,
+                                                       lambda strip: pipeline.apply(strip, lut))
+
+    def histogram(self) -> List[int]:
+        """Гистограмма всего изображения, при выделении - только его пикселей"""
+        if self._selection is None:
+            return self._image.histogram()
+        piece = self._image.crop(self._selection.bbox)
+        if self._selection.is_rectangle:
+            return piece.histogram()
+        return piece.histogram(self._selection.mask_image())
+
+    def set_selection(self, selection, mode: SelectionMode = SelectionMode.REPLACE):
+        """Задать выделение: рамка (x1, y1, x2, y2), SelectionMask или None.
+
+        mode - как совместить его с текущим выделением.
+        """
+        if isinstance(selection, tuple):
+            selection = SelectionMask.from_rect(self._image.size, selection)
+        if self._selection is not None and mode != SelectionMode.REPLACE:
+            empty = SelectionMask.from_rect(self._image.size, (0, 0, 0, 0))
+            selection = self._selection.combine(selection or empty, mode)
+        self._selection = selection if selection is not None and not selection.empty else None
+
+    def select_similar(self, x: int, y: int, tolerance: int = 0, metric: str = METRIC_CHANNEL,
+                       contiguous: bool = True, connectivity: int = 4,
+                       mode: SelectionMode = SelectionMode.REPLACE):
+        """Волшебная палочка: выделить пиксели, похожие на пиксель (x, y)"""
+        self.set_selection(magic_wand(self._image, x, y, tolerance, metric, contiguous,
+                                      connectivity), mode)
 
     def get_selection_image(self) -> Optional[Image.Image]:
-        if self._selection:
-            return self._image.crop(self._selection)
-        return None
+        """Выделенный фрагмент; пиксели вне формы выделения прозрачны"""
+        if self._selection is None:
+            return None
+        piece = self._image.crop(self._selection.bbox)
+        if self._selection.is_rectangle:
+            return piece
+
+        piece = piece.convert("RGBA")
+        shape = np.asarray(self._selection.mask_image())
+        piece.putalpha(Image.fromarray(np.minimum(shape, np.asarray(piece.getchannel("A")))))
+        return piece
+
+    def move_region(self, source: Tuple, position: Tuple[int, int]):
+        """Переместить выделенный фрагмент из source в position; выделение
+        переходит за ним.
+
+        Изменения отмечаются двумя областями (откуда и куда), а не общей
+        рамкой, поэтому история и холст затрагивают только их.
+        """
+        mask = self._selection
+        source, destination = move_region(self._image, source, position, mask)
+        self.mark_dirty(source)
+        self.mark_dirty(destination)
+        if mask is not None:
+            self._selection = mask.translate(position[0] - source[0], position[1] - source[1])
+        else:
+            self._selection = SelectionMask.from_rect(self._image.size, destination)
+        self._modified = True
 
     def cut_selection(self):
         if self._selection:
-            self._clipboard = self.get_selection_image()
-            draw = ImageDraw.Draw(self._image)
-            draw.rectangle(self._selection, fill=(0, 0, 0, 0))
-            self._selection = None
-            self._modified = True
+            self.copy_selection()
+            self.delete_selection()
 
     def copy_selection(self):
         if self._selection:
-            self._clipboard = self.get_selection_image()
+            # Буфер обмена хранит фрагмент в наименьшем формате
+            self._clipboard = compact_image(self.get_selection_image())
 
     def paste_from_clipboard(self, position: Tuple):
+        # Пиксели вне формы скопированного выделения прозрачны и не вставляются
         if self._clipboard:
-            self._image.paste(self._clipboard, position, self._clipboard)
+            mask = self._clipboard if has_alpha(self._clipboard.mode) else None
+            self._image.paste(self._clipboard, position, mask)
             self._modified = True
+            x, y = position
+            self.mark_dirty((x, y, x + self._clipboard.width, y + self._clipboard.height))
 
     def delete_selection(self):
+        """Сделать выделенные пиксели прозрачными (только внутри формы выделения)"""
         if self._selection:
-            draw = ImageDraw.Draw(self._image)
-            draw.rectangle(self._selection, fill=(0, 0, 0, 0))
+            bbox = self._selection.bbox
+            if self._selection.is_rectangle:
+                self._image.paste(TRANSPARENT, bbox)
+            else:
+                self._image.paste(TRANSPARENT, bbox, self._selection.mask_image())
+            self.mark_dirty(bbox)
             self._selection = None
             self._modified = True
 
+    @contextmanager
+    def _drawing(self, box: Tuple):
+        """ImageDraw для рисования в области box и сдвиг его координат.
+
+        В хранилище большого документа рисование идет во фрагменте области,
+        который затем записывается обратно.
+        """
+        if not isinstance(self._image, PixelStore):
+            yield ImageDraw.Draw(self._image), (0, 0)
+            return
+        box = clip_box(box, self.width, self.height)
+        with self._image.region(box) as piece:
+            yield ImageDraw.Draw(piece), (-box[0], -box[1])
+
     def draw_pixel(self, x: int, y: int, color: Tuple, size: int = 1):
         if 0 <= x < self.width and 0 <= y < self.height:
-            draw = ImageDraw.Draw(self._image)
-            if size == 1:
-                draw.point((x, y), fill=color)
-            else:
-                radius = size // 2
-                draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+            radius = size // 2
+            box = (x - radius, y - radius, x + radius + 1, y + radius + 1)
+            with self._drawing(box) as (draw, (dx, dy)):
+                if size == 1:
+                    draw.point((x + dx, y + dy), fill=color)
+                else:
+                    draw.ellipse((x - radius + dx, y - radius + dy,
+                                  x + radius + dx, y + radius + dy), fill=color)
             self._modified = True
+            self.mark_dirty(box)
 
-    def fill_area(self, x: int, y: int, color: Tuple):
+    def fill_area(self, x: int, y: int, color: Tuple, connectivity: int = 4,
+                  tolerance: int = 0, metric: str = METRIC_CHANNEL, antialias: bool = False):
+        """Заливка связной области; при выделении - только внутри него"""
         try:
-            target_color = self._image.getpixel((x, y))
-            if target_color == color:
-                return
-
-            img_array = np.array(self._image)
-            h, w = img_array.shape[:2]
-            stack = [(x, y)]
-            visited = set()
-
-            while stack:
-                cx, cy = stack.pop()
-                if (cx, cy) in visited:
-                    continue
-                if cx < 0 or cx >= w or cy < 0 or cy >= h:
-                    continue
-                if not np.array_equal(img_array[cy, cx], target_color):
-                    continue
-
-                img_array[cy, cx] = color
-                visited.add((cx, cy))
-
-                stack.append((cx + 1, cy))
-                stack.append((cx - 1, cy))
-                stack.append((cx, cy + 1))
-                stack.append((cx, cy - 1))
-
-            self._image = Image.fromarray(img_array, 'RGBA')
-            self._modified = True
+            bbox = flood_fill(self._image, x, y, color, connectivity,
+                              tolerance, metric, antialias, self._fill_limit())
+            if bbox:
+                self._modified = True
+                self.mark_dirty(bbox)
         except Exception as e:
             print(f"Ошибка заливки: {e}")
 
+    def _fill_limit(self) -> Optional[Tuple]:
+        """Ограничение заливки выделением: (рамка, маска bool) или None"""
+        if self._selection is None:
+            return None
+        return self._selection.bbox, self._selection.array()
+
+    def replace_color(self, target: Tuple, new: Tuple, tolerance: int = 0,
+                      metric: str = METRIC_CHANNEL, antialias: bool = False) -> Optional[Tuple]:
+        """Заменить цвет target (с допуском) на new по всему изображению
+        (при выделении - только в нем)"""
+        bbox = replace_color(self._image, target, new, tolerance, metric, antialias,
+                             self._fill_limit())
+        if bbox:
+            self._modified = True
+            self.mark_dirty(bbox)
+        return bbox
+
     def add_text(self, x: int, y: int, text: str, color: Tuple,
                  font_name: str = "Arial", font_size: int = 12):
         try:
-            draw = ImageDraw.Draw(self._image)
             try:
                 font = ImageFont.truetype(font_name, font_size)
             except:
                 font = ImageFont.load_default()
-
-            draw.text((x, y), text, fill=color, font=font)
-            self._modified = True
+            self.draw_text(x, y, text, color, font)
         except Exception as e:
             print(f"Ошибка добавления текста: {e}")
 
+    def draw_text(self, x: int, y: int, text: str, color: Tuple, font) -> Tuple:
+        """Нарисовать текст готовым шрифтом, вернуть его область"""
+        bbox = ImageDraw.Draw(Image.new("L", (1, 1))).textbbox((x, y), text, font=font)
+        with self._drawing(bbox) as (draw, (dx, dy)):
+            draw.text((x + dx, y + dy), text, fill=color, font=font)
+        self._modified = True
+        self.mark_dirty(bbox)
+        return bbox
+
     def get_pixel_color(self, x: int, y: int) -> Optional[Tuple]:
         if 0 <= x < self.width and 0 <= y < self.height:
             return self._image.getpixel((x, y))
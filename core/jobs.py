@@ -0,0 +1,164 @@
+# core/jobs.py
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Как часто поток интерфейса забирает сообщения фоновых задач (мс)
+POLL_INTERVAL_MS = 50
+
+
+class JobCancelled(Exception):
+    """Задача остановлена по запросу отмены"""
+
+
+class JobContext:
+    """То, что видит работа фоновой задачи: отчет о ходе и проверка отмены.
+
+    Отмена кооперативная: работа вызывает progress() или check() между
+    порциями (полосами, тайлами), и при запрошенной отмене они бросают
+    JobCancelled. Работа не трогает Tk - сообщения о ходе передаются в
+    поток интерфейса через очередь JobRunner.
+    """
+
+    def __init__(self, job: "Job", post: Callable[["Job", str, Any], None]):
+        self._job = job
+        self._post = post
+
+    @property
+    def cancelled(self) -> bool:
+        return self._job.cancelled
+
+    def check(self):
+        """Бросить JobCancelled, если задачу отменили"""
+        if self._job.cancelled:
+            raise JobCancelled()
+
+    def progress(self, fraction: float, text: Optional[str] = None):
+        """Сообщить долю выполненной работы (0..1) и проверить отмену"""
+        self.check()
+        self._post(self._job, "progress", (max(0.0, min(1.0, fraction)), text))
+
+
+class Job:
+    """Фоновая задача: работа work(context) и колбэки потока интерфейса.
+
+    on_done(результат), on_error(исключение), on_cancel() и
+    on_progress(доля, текст) вызываются только из JobRunner.poll, то есть
+    в потоке интерфейса; результат отмененной задачи не передается.
+    """
+
+    def __init__(self, title: str, work: Callable[[JobContext], Any],
+                 on_done: Optional[Callable[[Any], None]] = None,
+                 on_error: Optional[Callable[[Exception], None]] = None,
+                 on_cancel: Optional[Callable[[], None]] = None,
+                 on_progress: Optional[Callable[[float, Optional[str]], None]] = None):
+        self.title = title
+        self.work = work
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.on_progress = on_progress
+        self.finished = False
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """Запросить отмену; работа остановится на ближайшей проверке"""
+        self._cancel.set()
+
+
+class JobRunner:
+    """Пул потоков для долгих операций с доставкой результатов в поток интерфейса.
+
+    Работа задачи выполняется в пуле, а все ее сообщения (ход, результат,
+    ошибка, отмена) кладутся в очередь. Поток интерфейса забирает их в
+    poll(), который планируется через schedule(мс, колбэк) - для Tk это
+    root.after, - поэтому колбэки задач могут свободно работать с Tk и
+    моделью. Пока есть незавершенные задачи, poll перепланирует себя.
+    """
+
+    def __init__(self, schedule: Callable[[int, Callable[[], None]], Any],
+                 max_workers: int = 1, poll_interval_ms: int = POLL_INTERVAL_MS):
+        self._schedule = schedule
+        self._poll_interval = poll_interval_ms
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._messages: "queue.Queue" = queue.Queue()
+        self._active = []
+        self._polling = False
+
+    @property
+    def busy(self) -> bool:
+        """Есть ли незавершенные задачи"""
+        return bool(self._active)
+
+    def submit(self, job: Job) -> Job:
+        """Запустить задачу в пуле (вызывается из потока интерфейса)"""
+        self._active.append(job)
+        self._pool.submit(self._execute, job)
+        if not self._polling:
+            self._polling = True
+            self._schedule(self._poll_interval, self.poll)
+        return job
+
+    def cancel_all(self):
+        for job in self._active:
+            job.cancel()
+
+    def shutdown(self):
+        """Отменить задачи и остановить пул, не дожидаясь их"""
+        self.cancel_all()
+        self._pool.shutdown(wait=False)
+
+    def _post(self, job: Job, kind: str, value: Any = None):
+        self._messages.put((job, kind, value))
+
+    def _execute(self, job: Job):
+        """Выполнение работы в потоке пула"""
+        context = JobContext(job, self._post)
+        try:
+            context.check()
+            result = job.work(context)
+        except JobCancelled:
+            self._post(job, "cancelled")
+        except Exception as e:
+            self._post(job, "error", e)
+        else:
+            self._post(job, "done", result)
+
+    def poll(self):
+        """Доставить накопившиеся сообщения задач (в потоке интерфейса)"""
+        try:
+            while True:
+                try:
+                    job, kind, value = self._messages.get_nowait()
+                except queue.Empty:
+                    break
+                self._deliver(job, kind, value)
+        finally:
+            # Ошибка в колбэке не должна остановить доставку остальных сообщений
+            if self._active:
+                self._schedule(self._poll_interval, self.poll)
+            else:
+                self._polling = False
+
+    def _deliver(self, job: Job, kind: str, value: Any):
+        if kind == "progress":
+            if job.on_progress is not None and not job.cancelled:
+                job.on_progress(*value)
+            return
+
+        job.finished = True
+        self._active.remove(job)
+        # Отмена, запрошенная после конца работы, тоже отбрасывает результат
+        if kind == "done" and job.cancelled:
+            kind = "cancelled"
+        if kind == "done" and job.on_done is not None:
+            job.on_done(value)
+        elif kind == "error" and job.on_error is not None:
+            job.on_error(value)
+        elif kind == "cancelled" and job.on_cancel is not None:
+            job.on_cancel()
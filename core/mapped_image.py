@@ -0,0 +1,207 @@
+# core/mapped_image.py
+import tempfile
+from typing import Optional, Tuple
+import numpy as np
+from PIL import Image
+from core.pixel_format import color_format, expand_pixel, image_format
+from core.pixel_store import PixelStore, copy_meter
+from core.tiles import TILE_SIZE, clip_box
+
+# Объем полосы строк при обработке всего изображения (байты)
+MAPPED_STRIP_BYTES = 32 * 1024 * 1024
+
+
+class MappedImage(PixelStore):
+    """Изображение, пиксели которого лежат в numpy.memmap над временным файлом.
+
+    Буфер хранит строки подряд в формате режима PIL и не обязан помещаться
+    в оперативную память: какие страницы держать в ней, решает кэш страниц
+    ОС, а операции читают и пишут только строки своей области. PIL
+    получает буфер без копирования через Image.frombuffer (view),
+    np.asarray(image) возвращает сам memmap. Временный файл удаляется
+    вместе с изображением. Буфер хранит пиксели в формате pixel_format;
+    при расширении формата файл переписывается полосами.
+    """
+
+    def __init__(self, size: Tuple[int, int], color: Optional[Tuple] = (255, 255, 255, 255),
+                 mode: str = "RGBA", tile_size: int = TILE_SIZE,
+                 directory: Optional[str] = None, pixel_format: Optional[str] = None):
+        super().__init__(size, color, mode, tile_size, pixel_format)
+        self._directory = directory
+        self._file, self._array = self._allocate(self.pixel_format)
+        # Новый файл заполнен нулями; другой цвет записывается полосами
+        if color is not None and self._value(self._background).any():
+            value = self._value(self._background)
+            for y1, y2 in self.strips():
+                self._array[y1:y2] = value
+
+    def _allocate(self, pixel_format: str):
+        """Новый временный файл и memmap под пиксели формата pixel_format"""
+        bands = len(Image.new(pixel_format, (1, 1)).getbands())
+        shape = (self.height, self.width, bands) if bands > 1 else (self.height, self.width)
+        file = tempfile.TemporaryFile(prefix="canvas_", dir=self._directory)
+        return file, np.memmap(file, dtype=np.uint8, mode="w+", shape=shape)
+
+    @classmethod
+    def from_image(cls, image: Image.Image, color: Optional[Tuple] = None,
+                   mode: Optional[str] = None, tile_size: int = TILE_SIZE,
+                   directory: Optional[str] = None, compact: bool = False) -> "MappedImage":
+        """Записать изображение в новый файл полосами (mode - преобразовать).
+
+        compact - хранить в наименьшем формате, вмещающем пиксели
+        (image - L, LA, RGB или RGBA), операции видят RGBA.
+        """
+        pixel_format = mode or image.mode
+        if compact:
+            mode, pixel_format = "RGBA", image_format(image)
+        mapped = cls(image.size, None, mode or image.mode, tile_size, directory, pixel_format)
+        for y1, y2 in mapped.strips():
+            strip = image.crop((0, y1, image.width, y2))
+            if strip.mode != mapped.pixel_format:
+                strip = strip.convert(mapped.pixel_format)
+            mapped._array[y1:y2] = np.asarray(strip)
+        if color is None:
+            color = mapped.getpixel((0, 0)) if image.width and image.height else 0
+        mapped.color = color
+        if mapped.compact:
+            mapped._promote(color_format(color))
+        mapped._set_format(mapped.pixel_format)
+        return mapped
+
+    @property
+    def nbytes(self) -> int:
+        """Размер буфера (байты); в оперативной памяти из них лишь страницы,
+        которые держит ОС"""
+        return self._array.nbytes
+
+    @property
+    def strip_rows(self) -> int:
+        row = max(1, self.width * self.format_bands)
+        return max(1, MAPPED_STRIP_BYTES // row // self.tile_size) * self.tile_size
+
+    @property
+    def __array_interface__(self):
+        # Сам memmap: np.asarray(mapped) не копирует пиксели
+        return self._array.__array_interface__
+
+    def _value(self, color) -> np.ndarray:
+        """Цвет формата хранения в виде пикселя буфера (цвет PIL: кортеж, число)"""
+        return np.asarray(Image.new(self.pixel_format, (1, 1), color))[0, 0]
+
+    def view(self, rows: Optional[Tuple[int, int]] = None,
+             mode: Optional[str] = None) -> Image.Image:
+        """Строки rows = (y1, y2) во всю ширину как изображение PIL над буфером
+        в формате хранения (только для чтения). mode - другое прочтение тех
+        же байтов, например RGBX для RGBA (альфа не читается)."""
+        y1, y2 = rows or (0, self.height)
+        mode = mode or self.pixel_format
+        return Image.frombuffer(mode, (self.width, y2 - y1), self._array[y1:y2],
+                                "raw", mode, 0, 1)
+
+    def _rows(self, y1: int, y2: int) -> Image.Image:
+        rows = self.view((y1, y2))
+        return rows.convert(self.mode) if self.compact else rows
+
+    def _convert_pixels(self, pixel_format: str):
+        file, array = self._allocate(pixel_format)
+        for y1, y2 in self.strips():
+            array[y1:y2] = np.asarray(self.view((y1, y2)).convert(pixel_format))
+        copy_meter.add(array.nbytes)
+        self._file, self._array = file, array
+
+    def getpixel(self, xy: Tuple[int, int]):
+        x, y = int(xy[0]), int(xy[1])
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError("координаты пикселя вне изображения")
+        value = self._array[y, x]
+        value = tuple(int(v) for v in value) if value.ndim else int(value)
+        return expand_pixel(value, self.pixel_format) if self.compact else value
+
+    def crop(self, box: Tuple[int, int, int, int]) -> Image.Image:
+        """Фрагмент box как обычное изображение PIL (за краем - нули, как в Image.crop)"""
+        piece = self.raw_crop(box)
+        return piece.convert(self.mode) if self.compact else piece
+
+    def raw_crop(self, box: Tuple[int, int, int, int]) -> Image.Image:
+        x1, y1, x2, y2 = (int(v) for v in box)
+        px1, py1, px2, py2 = clip_box((x1, y1, x2, y2), self.width, self.height)
+        if (px1, py1, px2, py2) == (x1, y1, x2, y2) and x1 < x2 and y1 < y2:
+            return self.view((y1, y2)).crop((x1, 0, x2, y2 - y1))
+
+        result = Image.new(self.pixel_format, (max(0, x2 - x1), max(0, y2 - y1)))
+        if px1 < px2 and py1 < py2:
+            result.paste(self.view((py1, py2)).crop((px1, 0, px2, py2 - py1)),
+                         (px1 - x1, py1 - y1))
+        return result
+
+    def paste(self, im, box: Optional[Tuple] = None, mask: Optional[Image.Image] = None):
+        """Вставить изображение или цвет (как Image.paste), записывая только
+        строки области. box - левый верхний угол или прямоугольник."""
+        if box is None:
+            box = (0, 0)
+        im = self._fit(im)
+        if isinstance(im, Image.Image):
+            region = (int(box[0]), int(box[1]), int(box[0]) + im.width, int(box[1]) + im.height)
+        elif len(box) == 4:
+            region = tuple(int(v) for v in box)
+        else:
+            size = mask.size if mask is not None else self.size
+            region = (int(box[0]), int(box[1]), int(box[0]) + size[0], int(box[1]) + size[1])
+
+        px1, py1, px2, py2 = clip_box(region, self.width, self.height)
+        if px1 >= px2 or py1 >= py2:
+            return
+        source = (px1 - region[0], py1 - region[1], px2 - region[0], py2 - region[1])
+        part = im.crop(source) if isinstance(im, Image.Image) else im
+        target = self._array[py1:py2, px1:px2]
+
+        if mask is None:
+            target[...] = np.asarray(part) if isinstance(part, Image.Image) else self._value(part)
+            return
+        # С маской смешивает сам PIL на копии области
+        piece = Image.fromarray(np.array(target), self.pixel_format)
+        if isinstance(part, Image.Image):
+            piece.paste(part, (0, 0), mask.crop(source))
+        else:
+            piece.paste(part, (0, 0) + piece.size, mask.crop(source))
+        target[...] = np.asarray(piece)
+
+    def copy(self) -> "MappedImage":
+        """Копия в новом временном файле (копируется полосами)"""
+        result = MappedImage(self.size, None, self.mode, self.tile_size, self._directory,
+                             self.pixel_format)
+        result.color, result._background = self.color, self._background
+        for y1, y2 in self.strips():
+            result._array[y1:y2] = self._array[y1:y2]
+        copy_meter.add(self.nbytes)
+        return result
+
+    def cropped(self, box: Tuple[int, int, int, int]) -> "MappedImage":
+        """Обрезка в новый временный файл без сборки всего изображения"""
+        x1, y1, x2, y2 = clip_box(box, self.width, self.height)
+        result = MappedImage((x2 - x1, y2 - y1), None, self.mode, self.tile_size,
+                             self._directory, self.pixel_format)
+        result.color, result._background = self.color, self._background
+        for ry1, ry2 in result.strips():
+            result._array[ry1:ry2] = self._array[ry1 + y1:ry2 + y1, x1:x2]
+        return result
+
+    def to_image(self, mode: Optional[str] = None) -> Image.Image:
+        """Полное изображение PIL (копия всего буфера в памяти)"""
+        mode = mode or self.mode
+        view = self.view()
+        return view.copy() if view.mode == mode else view.convert(mode)
+
+    def save(self, fp, format: Optional[str] = None, mode: Optional[str] = None):
+        """Сохранить в файл; в формате хранения - не копируя буфер: кодировщик
+        PIL читает строки прямо из отображенного файла"""
+        mode = mode or self.mode
+        if mode == self.pixel_format:
+            image = self.view()
+        elif mode == "RGB" and self.pixel_format == "RGBA":
+            # Те же байты как RGBX: альфа пропускается, как при convert("RGB")
+            image = self.view(mode="RGBX")
+        else:
+            super().save(fp, format, mode)
+            return
+        image.save(fp, format=format)
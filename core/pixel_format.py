@@ -0,0 +1,87 @@
+# core/pixel_format.py
+from typing import Tuple
+from PIL import Image, ImageChops
+
+# Форматы хранения пикселей документа, от меньшего к большему
+PIXEL_FORMATS = ("L", "LA", "RGB", "RGBA")
+
+# Высота полосы строк при проверке формата большого изображения
+_CHECK_ROWS = 1024
+
+
+def has_color(pixel_format: str) -> bool:
+    return pixel_format in ("RGB", "RGBA")
+
+
+def has_alpha(pixel_format: str) -> bool:
+    return pixel_format in ("LA", "RGBA")
+
+
+def make_format(color: bool, alpha: bool) -> str:
+    return ("RGB" if color else "L") + ("A" if alpha else "")
+
+
+def union_format(first: str, second: str) -> str:
+    """Наименьший формат, вмещающий пиксели обоих форматов"""
+    return make_format(has_color(first) or has_color(second),
+                       has_alpha(first) or has_alpha(second))
+
+
+def color_format(color) -> str:
+    """Наименьший формат, в котором представим цвет RGBA"""
+    if not isinstance(color, (tuple, list)):
+        return "L"
+    alpha = len(color) > 3 and color[3] != 255
+    return make_format(len(color) >= 3 and not color[0] == color[1] == color[2], alpha)
+
+
+def image_format(image: Image.Image, known: str = "L") -> str:
+    """Наименьший формат, в котором представимы пиксели изображения.
+
+    known - формат, который и так будет у результата: цвет и альфа,
+    которые в нем уже есть, не проверяются. Большие изображения
+    проверяются полосами строк.
+    """
+    color, alpha = has_color(known), has_alpha(known)
+    if image.mode not in PIXEL_FORMATS:
+        image = image.convert("L" if image.mode == "1" else "RGBA")
+    check_color = not color and has_color(image.mode)
+    check_alpha = not alpha and has_alpha(image.mode)
+
+    for y in range(0, image.height, _CHECK_ROWS):
+        if not (check_color or check_alpha):
+            break
+        strip = image.crop((0, y, image.width, min(image.height, y + _CHECK_ROWS)))
+        if check_color:
+            red, green, blue = strip.getchannel("R"), strip.getchannel("G"), strip.getchannel("B")
+            if (ImageChops.difference(red, green).getbbox() is not None or
+                    ImageChops.difference(red, blue).getbbox() is not None):
+                color, check_color = True, False
+        if check_alpha and strip.getchannel("A").getextrema()[0] != 255:
+            alpha, check_alpha = True, False
+    return make_format(color, alpha)
+
+
+def compact_image(image: Image.Image) -> Image.Image:
+    """Изображение в наименьшем формате (например, для буфера обмена)"""
+    pixel_format = image_format(image)
+    return image if image.mode == pixel_format else image.convert(pixel_format)
+
+
+def format_color(color, pixel_format: str):
+    """Цвет RGBA в формате хранения (число для L, кортеж для остальных)"""
+    if not isinstance(color, (tuple, list)):
+        return color
+    return Image.new("RGBA", (1, 1), tuple(color)).convert(pixel_format).getpixel((0, 0))
+
+
+def expand_pixel(value, pixel_format: str) -> Tuple:
+    """Пиксель формата хранения как кортеж RGBA"""
+    if pixel_format == "L":
+        return (value, value, value, 255)
+    if pixel_format == "LA":
+        return (value[0], value[0], value[0], value[1])
+    if pixel_format == "RGB":
+        return tuple(value) + (255,)
+    return tuple(value)
+
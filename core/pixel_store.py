@@ -0,0 +1,306 @@
+# core/pixel_store.py
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Tuple, Union
+import math
+import threading
+from PIL import Image, ImageMode
+from core.pixel_format import (color_format, format_color, image_format, union_format)
+from core.tiles import clip_box, tile_box, tiles_in_box
+
+# Высота полосы (в тайлах) при построчной обработке всего изображения
+STRIP_TILES = 4
+
+
+class CopyMeter:
+    """Счетчик байтов пикселей, скопированных ради снимков состояния.
+
+    Сюда попадают копирование общих тайлов при записи, копии хранилищ и
+    пиксели, которые история и журнал команд копируют себе. Контроллер
+    закрывает действие (end_action) при каждом обращении к истории, поэтому
+    видно, сколько байтов скопировало последнее действие и самое дорогое.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.total = 0
+        self.actions = 0
+        self.last_action = 0
+        self.max_action = 0
+        self._action_start = 0
+
+    def add(self, nbytes: int):
+        with self._lock:
+            self.total += nbytes
+
+    def end_action(self) -> int:
+        """Закрыть действие; вернуть байты, скопированные с прошлого вызова"""
+        with self._lock:
+            copied = self.total - self._action_start
+            self._action_start = self.total
+        self.actions += 1
+        self.last_action = copied
+        self.max_action = max(self.max_action, copied)
+        return copied
+
+    def summary(self) -> str:
+        """Краткая сводка статистики"""
+        mb = 1024 * 1024
+        average = self.total / self.actions if self.actions else 0
+        return (f"Скопировано пикселей: всего {self.total / mb:.1f} МБ "
+                f"за {self.actions} действий\n"
+                f"На действие: последнее {self.last_action / mb:.2f} МБ, "
+                f"среднее {average / mb:.2f} МБ, максимальное {self.max_action / mb:.2f} МБ")
+
+
+copy_meter = CopyMeter()
+
+
+def image_nbytes(image: Image.Image) -> int:
+    """Объем пикселей изображения PIL (байты)"""
+    return image.width * image.height * len(image.getbands())
+
+
+class Tile:
+    """Пиксели тайла со счетчиком владельцев (копирование при записи).
+
+    Владельцы - изображения TiledImage и дельты истории. Пока владелец
+    один, тайл меняется на месте; общий тайл перед записью копируется
+    (TiledImage._writable). Владелец вызывает acquire, когда начинает
+    хранить ссылку, и release, когда перестает.
+    """
+
+    __slots__ = ("image", "refs")
+    _lock = threading.Lock()
+
+    def __init__(self, image: Image.Image):
+        self.image = image
+        self.refs = 0
+
+    def acquire(self) -> "Tile":
+        with Tile._lock:
+            self.refs += 1
+        return self
+
+    def release(self):
+        with Tile._lock:
+            self.refs -= 1
+
+    @property
+    def shared(self) -> bool:
+        return self.refs > 1
+
+
+class PixelStore(ABC):
+    """Общая часть хранилищ пикселей больших документов (TiledImage, MappedImage).
+
+    Хранилище повторяет ту часть интерфейса PIL.Image, которой пользуются
+    операции над областями (size, mode, crop, paste, getpixel, copy,
+    histogram, reduce), поэтому кисть, фигуры, перемещение выделения,
+    история и холст работают с ним без изменений. Изображение делится на
+    сетку тайлов tile_size (tile, set_tile) - по ней идут заливка и
+    волшебная палочка, а операции над всем изображением идут полосами
+    строк (strips). Полное изображение PIL собирается только по запросу
+    (to_image).
+
+    Операции видят пиксели в режиме mode (RGBA), а хранятся они в формате
+    pixel_format - наименьшем из L, LA, RGB, RGBA, который вмещает
+    изображение: непрозрачный серый документ занимает байт на пиксель.
+    crop и getpixel переводят пиксели в mode, а paste расширяет формат
+    (_promote), только когда вставляемые пиксели содержат цвет или
+    прозрачность, которых в формате нет.
+    """
+
+    def __init__(self, size: Tuple[int, int], color, mode: str, tile_size: int,
+                 pixel_format: Optional[str] = None):
+        self.size = (int(size[0]), int(size[1]))
+        self.mode = mode
+        self.color = tuple(color) if isinstance(color, (tuple, list)) else color
+        self.tile_size = tile_size
+        self.pixel_format = mode
+        self._background = self.color  # Цвет фона в формате хранения
+        if pixel_format is not None and pixel_format != mode:
+            # Цвет фона тоже должен поместиться в формат
+            self._set_format(union_format(pixel_format, color_format(self.color)))
+
+    @property
+    def compact(self) -> bool:
+        """Хранятся ли пиксели в формате, отличном от mode"""
+        return self.pixel_format != self.mode
+
+    def _set_format(self, pixel_format: str):
+        self.pixel_format = pixel_format
+        self._background = format_color(self.color, pixel_format) if self.compact else self.color
+
+    def _promote(self, pixel_format: str):
+        """Расширить формат хранения, чтобы он вмещал pixel_format"""
+        target = union_format(self.pixel_format, pixel_format)
+        if target != self.pixel_format:
+            self._convert_pixels(target)
+            self._set_format(target)
+
+    @abstractmethod
+    def _convert_pixels(self, pixel_format: str):
+        """Перевести хранимые пиксели в формат pixel_format"""
+
+    def _fit(self, im):
+        """Вставляемое изображение или цвет в формате хранения; формат
+        расширяется, если пиксели в него не помещаются"""
+        if not self.compact:
+            if isinstance(im, Image.Image) and im.mode != self.mode:
+                im = im.convert(self.mode)
+            return im
+        if isinstance(im, Image.Image):
+            self._promote(image_format(im, self.pixel_format))
+            return im if im.mode == self.pixel_format else im.convert(self.pixel_format)
+        self._promote(color_format(im))
+        return format_color(im, self.pixel_format)
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    def getbands(self) -> Tuple[str, ...]:
+        return ImageMode.getmode(self.mode).bands
+
+    @property
+    def format_bands(self) -> int:
+        """Число каналов в формате хранения"""
+        return len(ImageMode.getmode(self.pixel_format).bands)
+
+    @property
+    def strip_rows(self) -> int:
+        """Высота полосы строк для strips (кратна tile_size)"""
+        return self.tile_size * STRIP_TILES
+
+    def keys(self) -> Iterator[Tuple[int, int]]:
+        """Индексы всех тайлов изображения"""
+        return tiles_in_box((0, 0) + self.size, *self.size, self.tile_size)
+
+    def tile_box(self, key: Tuple[int, int]) -> Tuple[int, int, int, int]:
+        return tile_box(key[0], key[1], self.width, self.height, self.tile_size)
+
+    def tile(self, key: Tuple[int, int]) -> Optional[Image.Image]:
+        """Тайл для чтения (None - тайл цвета фона); изменять его нельзя"""
+        return self.crop(self.tile_box(key))
+
+    def solid_tile(self, size: Tuple[int, int], color) -> Tile:
+        """Тайл, залитый цветом, в формате хранения (можно поставить на много ключей)"""
+        value = self._fit(color)  # Сначала формат расширяется под цвет
+        return Tile(Image.new(self.pixel_format, size, value))
+
+    def set_tile(self, key: Tuple[int, int], tile: Union[Image.Image, Tile, None]):
+        """Заменить тайл целиком (None - цвет фона)"""
+        if isinstance(tile, Tile):
+            tile = tile.image
+        if tile is None:
+            self.paste(self.color, self.tile_box(key))
+        else:
+            self.paste(tile, self.tile_box(key)[:2])
+
+    def raw_crop(self, box: Tuple[int, int, int, int]) -> Image.Image:
+        """Фрагмент box в формате хранения pixel_format"""
+        piece = self.crop(box)
+        return piece.convert(self.pixel_format) if self.compact else piece
+
+    def _rows(self, y1: int, y2: int) -> Image.Image:
+        """Строки y1..y2 во всю ширину как изображение PIL (только для чтения)"""
+        return self.crop((0, y1, self.width, y2))
+
+    @contextmanager
+    def region(self, box: Tuple[int, int, int, int]):
+        """Изменение области на месте: фрагмент box как изображение PIL,
+        после блока with он записывается обратно в хранилище"""
+        box = clip_box(box, self.width, self.height)
+        piece = self.crop(box)
+        yield piece
+        self.paste(piece, box[:2])
+
+    def strips(self, box: Optional[Tuple] = None) -> Iterator[Tuple[int, int]]:
+        """Полосы строк (y1, y2) области box по strip_rows строк"""
+        x1, y1, x2, y2 = clip_box(box or (0, 0) + self.size, self.width, self.height)
+        step = self.strip_rows
+        start = (y1 // step) * step
+        for y in range(start, y2, step):
+            yield max(y, y1), min(y + step, y2)
+
+    def histogram(self, mask: Optional[Image.Image] = None):
+        """Гистограмма как в Image.histogram, полосами"""
+        total = [0] * (256 * len(self.getbands()))
+        for y1, y2 in self.strips():
+            part = mask.crop((0, y1, self.width, y2)) if mask is not None else None
+            for i, count in enumerate(self._rows(y1, y2).histogram(part)):
+                total[i] += count
+        return total
+
+    def reduce(self, factor: int) -> Image.Image:
+        """Уменьшение в factor раз (как Image.reduce) полосами, без сборки холста"""
+        width, height = math.ceil(self.width / factor), math.ceil(self.height / factor)
+        result = Image.new(self.mode, (width, height))
+        # Высота полосы кратна factor, чтобы блоки не разрезались
+        step = factor * max(1, self.strip_rows // factor)
+        for y in range(0, self.height, step):
+            strip = self._rows(y, min(self.height, y + step))
+            result.paste(strip.reduce(factor), (0, y // factor))
+        return result
+
+    def to_image(self, mode: Optional[str] = None) -> Image.Image:
+        """Собрать полное изображение PIL (память на весь холст) в режиме
+        mode (по умолчанию - self.mode)"""
+        result = Image.new(mode or self.mode, self.size)
+        for y1, y2 in self.strips():
+            result.paste(self._rows(y1, y2), (0, y1))
+        return result
+
+    @property
+    def __array_interface__(self):
+        # np.asarray(store) работает, но собирает все изображение;
+        # операции над областями должны пользоваться crop
+        return self.to_image().__array_interface__
+
+    def save(self, fp, format: Optional[str] = None, mode: Optional[str] = None):
+        """Сохранить в файл (mode - преобразовать перед сохранением)"""
+        self.to_image(mode).save(fp, format=format)
+
+
+def map_strips_in_place(image: PixelStore, operation: Callable[[Image.Image], Image.Image],
+                        margin: int = 0, progress: Optional[Callable[[float], None]] = None):
+    """Применить операцию, сохраняющую размер, ко всему хранилищу полосами (на месте).
+
+    Полоса обрабатывается вместе с margin соседними строками (окрестность
+    фильтра). Результат полосы записывается, только когда ни одна
+    следующая полоса уже не читает его строки, поэтому запас каждой полосы
+    берется из исходных пикселей и результат тот же, что у операции над
+    всем изображением. В памяти одновременно лишь несколько полос.
+
+    progress(доля) вызывается после каждой полосы; исключение из него
+    (например, отмена фоновой задачи) прерывает обработку, оставляя
+    хранилище частично обработанным.
+    """
+    width, height = image.size
+    pending = deque()  # (y1, y2, результат), ожидающие записи
+    strips = list(image.strips())
+    for index, (y1, y2) in enumerate(strips):
+        top, bottom = max(0, y1 - margin), min(height, y2 + margin)
+        while pending and pending[0][1] <= top:
+            done_y1, _, done = pending.popleft()
+            image.paste(done, (0, done_y1))
+
+        result = operation(image.crop((0, top, width, bottom)))
+        result = result.crop((0, y1 - top, width, y2 - top))
+        if result.mode != image.mode:
+            result = result.convert(image.mode)
+        pending.append((y1, y2, result))
+        if progress is not None:
+            progress((index + 1) / len(strips))
+
+    for y1, _, result in pending:
+        image.paste(result, (0, y1))
@@ -0,0 +1,182 @@
+# core/point_ops.py
+from typing import Callable, List, Optional, Sequence, Tuple
+import numpy as np
+from PIL import Image
+
+# Число цветовых каналов, к которым применяются точечные операции (RGB)
+COLOR_CHANNELS = 3
+
+# Коэффициенты яркости (как в Image.convert("L"))
+LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+_LEVELS = np.arange(256, dtype=np.float64)
+
+
+class PointPipeline:
+    """Цепочка точечных операций, компилируемая в одну таблицу (LUT) на канал.
+
+    Каждая операция - преобразование значений 0..255 канала. Цепочка
+    вычисляется над 256 значениями, а изображение проходится один раз
+    через Image.point; альфа-канал не изменяется. Методы возвращают self,
+    поэтому операции можно записывать цепочкой:
+
+        PointPipeline().brightness(1.2).contrast(1.1).apply(image)
+    """
+
+    def __init__(self):
+        # Операции: (функция над массивом (3, 256), нужна ли гистограмма)
+        self._ops: List[Tuple[Callable, bool]] = []
+
+    def __len__(self):
+        return len(self._ops)
+
+    def _add(self, op: Callable, channel: Optional[int] = None, needs_stats: bool = False):
+        if channel is None:
+            self._ops.append((op, needs_stats))
+        else:
+            def channel_op(values, *args):
+                values = values.copy()
+                values[channel] = op(values[channel:channel + 1], *args)[0]
+                return values
+            self._ops.append((channel_op, needs_stats))
+        return self
+
+    def invert(self, channel: Optional[int] = None) -> "PointPipeline":
+        """Инверсия: v -> 255 - v"""
+        return self._add(lambda v: 255 - v, channel)
+
+    def brightness(self, factor: float) -> "PointPipeline":
+        """Яркость: смешивание с черным (как ImageEnhance.Brightness)"""
+        return self._add(lambda v: v * factor)
+
+    def contrast(self, factor: float, pivot: Optional[float] = None) -> "PointPipeline":
+        """Контрастность относительно pivot (как ImageEnhance.Contrast).
+
+        Если pivot не задан, используется средняя яркость изображения на
+        этом шаге цепочки - она считается по гистограмме, без лишнего прохода.
+        """
+        if pivot is not None:
+            return self._add(lambda v: pivot + (v - pivot) * factor)
+
+        def op(v, mean):
+            center = int(mean + 0.5)
+            return center + (v - center) * factor
+        return self._add(op, needs_stats=True)
+
+    def gamma(self, gamma: float, channel: Optional[int] = None) -> "PointPipeline":
+        """Гамма-коррекция: v -> 255 * (v / 255) ^ (1 / gamma)"""
+        if gamma <= 0:
+            raise ValueError("Гамма должна быть положительной")
+        return self._add(lambda v: 255 * (v / 255) ** (1 / gamma), channel)
+
+    def levels(self, in_black: int = 0, in_white: int = 255, gamma: float = 1.0,
+               out_black: int = 0, out_white: int = 255,
+               channel: Optional[int] = None) -> "PointPipeline":
+        """Уровни: входной диапазон, гамма средних тонов и выходной диапазон"""
+        if in_white <= in_black:
+            raise ValueError("Белая точка должна быть больше черной")
+        if gamma <= 0:
+            raise ValueError("Гамма должна быть положительной")
+
+        def op(v):
+            t = np.clip((v - in_black) / (in_white - in_black), 0, 1) ** (1 / gamma)
+            return out_black + t * (out_white - out_black)
+        return self._add(op, channel)
+
+    def curves(self, points: Sequence[Tuple[int, int]],
+               channel: Optional[int] = None) -> "PointPipeline":
+        """Кривые: кусочно-линейная функция через контрольные точки (вход, выход)"""
+        if len(points) < 2:
+            raise ValueError("Для кривой нужно минимум две точки")
+        xs, ys = zip(*sorted(points))
+        return self._add(lambda v: np.interp(v, xs, ys), channel)
+
+    def map(self, function: Callable[[np.ndarray], np.ndarray],
+            channel: Optional[int] = None) -> "PointPipeline":
+        """Произвольная точечная операция над массивом значений 0..255"""
+        return self._add(function, channel)
+
+    def compile(self, histogram: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Собрать таблицы: массив uint8 формы (3, 256).
+
+        histogram - результат Image.histogram() (нужен операциям, зависящим
+        от статистики изображения). Значения обрезаются до 0..255 после
+        каждой операции, как при последовательном применении, а округляются
+        один раз в конце.
+        """
+        values = np.tile(_LEVELS, (COLOR_CHANNELS, 1))
+        counts = None
+        if histogram is not None:
+            # Для L/LA гистограмма одного цветового канала годится для всех трех
+            bands = COLOR_CHANNELS if len(histogram) >= 256 * COLOR_CHANNELS else 1
+            counts = np.asarray(histogram[:256 * bands], dtype=np.float64).reshape(bands, 256)
+            counts = np.broadcast_to(counts, (COLOR_CHANNELS, 256))
+
+        for op, needs_stats in self._ops:
+            if needs_stats:
+                values = op(values, self._mean_luma(values, counts))
+            else:
+                values = op(values)
+            values = np.clip(values, 0, 255)
+
+        return np.rint(values).astype(np.uint8)
+
+    @staticmethod
+    def _mean_luma(values: np.ndarray, counts: Optional[np.ndarray]) -> float:
+        """Средняя яркость изображения после уже собранных операций"""
+        if counts is None:
+            return 127.5
+        total = counts.sum(axis=1)
+        means = (counts * values).sum(axis=1) / np.maximum(total, 1)
+        return float(np.dot(LUMA_WEIGHTS, means))
+
+    @property
+    def needs_histogram(self) -> bool:
+        return any(needs_stats for _, needs_stats in self._ops)
+
+    def apply(self, image: Image.Image, lut: Optional[np.ndarray] = None) -> Image.Image:
+        """Применить цепочку за один проход (Image.point), альфа не меняется.
+
+        lut - заранее собранные таблицы (например, закэшированные для
+        предпросмотра); по умолчанию собираются для этого изображения.
+        """
+        if lut is None:
+            histogram = image.histogram() if self.needs_histogram else None
+            lut = self.compile(histogram)
+        return image.point(lut_table(lut, image.mode))
+
+
+def brightness_contrast_pipeline(brightness: int, contrast: int) -> PointPipeline:
+    """Цепочка яркости и контрастности в единицах диалога (-100..100)"""
+    pipeline = PointPipeline()
+    if brightness:
+        pipeline.brightness((brightness + 100) / 100.0)
+    if contrast:
+        pipeline.contrast((contrast + 100) / 100.0)
+    return pipeline
+
+
+def lut_table(lut: np.ndarray, mode: str) -> List[int]:
+    """Таблица для Image.point: цветовые каналы из lut, альфа - без изменений"""
+    identity = list(range(256))
+    if mode == "RGBA":
+        return lut[0].tolist() + lut[1].tolist() + lut[2].tolist() + identity
+    if mode == "RGB":
+        return lut[0].tolist() + lut[1].tolist() + lut[2].tolist()
+    if mode == "LA":
+        return lut[0].tolist() + identity
+    if mode == "L":
+        return lut[0].tolist()
+    raise ValueError(f"Режим изображения {mode} не поддерживается")
+
+
+def apply_lut_array(array: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """Применить таблицы к массиву (h, w) или (h, w, c) через np.take, альфа не меняется"""
+    if array.ndim == 2:
+        return np.take(lut[0], array)
+
+    result = array.copy()
+    channels = COLOR_CHANNELS if array.shape[2] >= COLOR_CHANNELS else 1
+    for k in range(channels):
+        result[..., k] = np.take(lut[k], array[..., k])
+    return result
@@ -0,0 +1,269 @@
+# core/selection.py
+from typing import Callable, Optional, Tuple
+import numpy as np
+from PIL import Image
+from core.flood_fill import (METRIC_CHANNEL, flood_fill_mask, flood_fill_tiles, mask_bbox,
+                             tiles_mask, tolerance_mask)
+from core.tiles import clip_box, union_box
+from utils.constants import SelectionMode
+
+# Чем заполняется место, откуда перемещен или удален фрагмент
+TRANSPARENT = (0, 0, 0, 0)
+
+
+class SelectionMask:
+    """Выделение произвольной формы: битовая маска (np.packbits по строкам).
+
+    Хранится только прямоугольник, занятый выделением (bbox), по биту на
+    пиксель, поэтому маленькое выделение на большом холсте занимает байты,
+    а операции над ним затрагивают только его область. Маска неизменяема:
+    объединение, пересечение, вычитание и сдвиг возвращают новую маску.
+    """
+
+    __slots__ = ("size", "bbox", "_bits", "_count")
+
+    def __init__(self, size: Tuple[int, int], bbox: Optional[Tuple[int, int, int, int]],
+                 bits: np.ndarray, count: int):
+        self.size = size
+        self.bbox = bbox
+        self._bits = bits
+        self._count = count
+
+    @classmethod
+    def from_array(cls, size: Tuple[int, int], mask: np.ndarray,
+                   origin: Tuple[int, int] = (0, 0)) -> "SelectionMask":
+        """Маска из массива bool, левый верхний угол которого - origin"""
+        width, height = size
+        ox, oy = origin
+        # Отрезаем то, что выходит за изображение
+        x1, y1, x2, y2 = clip_box((ox, oy, ox + mask.shape[1], oy + mask.shape[0]), width, height)
+        if x1 < x2 and y1 < y2:
+            mask = mask[y1 - oy:y2 - oy, x1 - ox:x2 - ox]
+            bbox = mask_bbox(mask)
+        else:
+            bbox = None
+        if bbox is None:
+            return cls(size, None, np.zeros((0, 0), dtype=np.uint8), 0)
+
+        bx1, by1, bx2, by2 = bbox
+        tight = mask[by1:by2, bx1:bx2]
+        return cls(size, (x1 + bx1, y1 + by1, x1 + bx2, y1 + by2),
+                   np.packbits(tight, axis=1), int(np.count_nonzero(tight)))
+
+    @classmethod
+    def from_rect(cls, size: Tuple[int, int], box: Tuple[int, int, int, int]) -> "SelectionMask":
+        """Прямоугольное выделение (x1, y1, x2, y2), правая и нижняя границы не входят"""
+        x1, y1, x2, y2 = clip_box(box, *size)
+        if x1 >= x2 or y1 >= y2:
+            return cls(size, None, np.zeros((0, 0), dtype=np.uint8), 0)
+        return cls.from_array(size, np.ones((y2 - y1, x2 - x1), dtype=bool), (x1, y1))
+
+    @property
+    def empty(self) -> bool:
+        return self.bbox is None
+
+    @property
+    def area(self) -> int:
+        """Число выделенных пикселей"""
+        return self._count
+
+    @property
+    def is_rectangle(self) -> bool:
+        """Выделение совпадает со своей рамкой"""
+        if self.bbox is None:
+            return False
+        x1, y1, x2, y2 = self.bbox
+        return self._count == (x2 - x1) * (y2 - y1)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bits.nbytes
+
+    def array(self, box: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+        """Маска bool области box (по умолчанию - рамки выделения)"""
+        box = box or self.bbox
+        if box is None:
+            return np.zeros((0, 0), dtype=bool)
+        result = np.zeros((box[3] - box[1], box[2] - box[0]), dtype=bool)
+        if self.bbox is None:
+            return result
+
+        x1, y1 = max(box[0], self.bbox[0]), max(box[1], self.bbox[1])
+        x2, y2 = min(box[2], self.bbox[2]), min(box[3], self.bbox[3])
+        if x1 < x2 and y1 < y2:
+            bx, by = self.bbox[:2]
+            # Распаковываем только нужные строки
+            rows = np.unpackbits(self._bits[y1 - by:y2 - by], axis=1,
+                                 count=self.bbox[2] - bx).view(bool)
+            result[y1 - box[1]:y2 - box[1], x1 - box[0]:x2 - box[0]] = rows[:, x1 - bx:x2 - bx]
+        return result
+
+    def mask_image(self, box: Optional[Tuple[int, int, int, int]] = None) -> Image.Image:
+        """Маска области box как изображение "L" (0/255) для Image.paste"""
+        return Image.fromarray(self.array(box).view(np.uint8) * np.uint8(255), "L")
+
+    def contains(self, x: int, y: int) -> bool:
+        if self.bbox is None:
+            return False
+        x1, y1, x2, y2 = self.bbox
+        if not (x1 <= x < x2 and y1 <= y < y2):
+            return False
+        byte = self._bits[y - y1, (x - x1) >> 3]
+        return bool(byte & (0x80 >> ((x - x1) & 7)))
+
+    def _combine(self, other: "SelectionMask", box: Optional[Tuple], operation) -> "SelectionMask":
+        if box is None:
+            return SelectionMask(self.size, None, np.zeros((0, 0), dtype=np.uint8), 0)
+        return SelectionMask.from_array(self.size, operation(self.array(box), other.array(box)),
+                                        box[:2])
+
+    def union(self, other: "SelectionMask") -> "SelectionMask":
+        if other.empty:
+            return self
+        if self.empty:
+            return other
+        box = (min(self.bbox[0], other.bbox[0]), min(self.bbox[1], other.bbox[1]),
+               max(self.bbox[2], other.bbox[2]), max(self.bbox[3], other.bbox[3]))
+        return self._combine(other, box, np.logical_or)
+
+    def intersect(self, other: "SelectionMask") -> "SelectionMask":
+        box = None
+        if not self.empty and not other.empty:
+            x1, y1 = max(self.bbox[0], other.bbox[0]), max(self.bbox[1], other.bbox[1])
+            x2, y2 = min(self.bbox[2], other.bbox[2]), min(self.bbox[3], other.bbox[3])
+            if x1 < x2 and y1 < y2:
+                box = (x1, y1, x2, y2)
+        return self._combine(other, box, np.logical_and)
+
+    def subtract(self, other: "SelectionMask") -> "SelectionMask":
+        if self.empty or other.empty:
+            return self
+        return self._combine(other, self.bbox, lambda a, b: a & ~b)
+
+    def combine(self, other: "SelectionMask", mode: SelectionMode) -> "SelectionMask":
+        """Применить к текущему выделению новое в режиме mode"""
+        if mode == SelectionMode.ADD:
+            return self.union(other)
+        if mode == SelectionMode.SUBTRACT:
+            return self.subtract(other)
+        if mode == SelectionMode.INTERSECT:
+            return self.intersect(other)
+        return other
+
+    def translate(self, dx: int, dy: int) -> "SelectionMask":
+        """Сдвинутое выделение (часть, ушедшая за край изображения, отрезается)"""
+        if self.bbox is None:
+            return self
+        x1, y1, x2, y2 = self.bbox
+        moved = (x1 + dx, y1 + dy, x2 + dx, y2 + dy)
+        if clip_box(moved, *self.size) == moved:
+            return SelectionMask(self.size, moved, self._bits, self._count)
+        return SelectionMask.from_array(self.size, self.array(), moved[:2])
+
+    def outline(self) -> np.ndarray:
+        """Граничные пиксели выделения в его рамке (для отображения контура)"""
+        inside = np.pad(self.array(), 1)
+        interior = (inside[1:-1, 1:-1] & inside[:-2, 1:-1] & inside[2:, 1:-1] &
+                    inside[1:-1, :-2] & inside[1:-1, 2:])
+        return inside[1:-1, 1:-1] & ~interior
+
+
+def magic_wand(image: Image.Image, x: int, y: int, tolerance: int = 0,
+               metric: str = METRIC_CHANNEL, contiguous: bool = True,
+               connectivity: int = 4) -> SelectionMask:
+    """Выделить пиксели, похожие по цвету на пиксель (x, y).
+
+    Сравнение с допуском считается векторно по всему изображению
+    (tolerance_mask), связная область - построчным алгоритмом заливки.
+    """
+    if not (0 <= x < image.width and 0 <= y < image.height):
+        return SelectionMask(image.size, None, np.zeros((0, 0), dtype=np.uint8), 0)
+
+    target = image.getpixel((x, y))
+    if not isinstance(image, Image.Image):
+        return _magic_wand_tiled(image, x, y, target, tolerance, metric, contiguous, connectivity)
+
+    array = np.asarray(image)
+    match = tolerance_mask(array, target, tolerance, metric)
+    if contiguous:
+        match, _ = flood_fill_mask(match, x, y, connectivity)
+    return SelectionMask.from_array(image.size, match)
+
+
+def _magic_wand_tiled(image, x: int, y: int, target: Tuple, tolerance: int, metric: str,
+                      contiguous: bool, connectivity: int) -> SelectionMask:
+    """Волшебная палочка для хранилища PixelStore: связная область ищется по
+    тайлам, несвязная - полосами; полное изображение не собирается"""
+    if contiguous:
+        filled = flood_fill_tiles(image, x, y, target, tolerance, metric, connectivity)
+        bbox = None
+        for key in filled:
+            bbox = union_box(bbox, image.tile_box(key))
+        return SelectionMask.from_array(image.size, tiles_mask(image, filled, bbox), bbox[:2])
+
+    rows, first = [], None
+    for y1, y2 in image.strips():
+        match = tolerance_mask(np.asarray(image.crop((0, y1, image.width, y2))),
+                               target, tolerance, metric)
+        if first is None and not match.any():
+            continue
+        first = y1 if first is None else first
+        rows.append(match)
+    if first is None:
+        return SelectionMask(image.size, None, np.zeros((0, 0), dtype=np.uint8), 0)
+    return SelectionMask.from_array(image.size, np.concatenate(rows), (0, first))
+
+
+def apply_in_selection(image: Image.Image, mask: SelectionMask,
+                       operation: Callable[[Image.Image], Image.Image],
+                       margin: int = 0) -> Optional[Tuple]:
+    """Применить операцию, сохраняющую размер, только к выделению (на месте).
+
+    Операция получает фрагмент рамки выделения, расширенный на margin
+    (радиус окрестности фильтра), поэтому результат у края выделения тот же,
+    что при обработке всего изображения. Результат вставляется через маску
+    выделения. Возвращает измененную область (рамку выделения).
+    """
+    bbox = mask.bbox
+    if bbox is None:
+        return None
+    x1, y1, x2, y2 = bbox
+    source = clip_box((x1 - margin, y1 - margin, x2 + margin, y2 + margin),
+                      image.width, image.height)
+    result = operation(image.crop(source))
+    left, top = x1 - source[0], y1 - source[1]
+    result = result.crop((left, top, left + x2 - x1, top + y2 - y1))
+    if result.mode != image.mode:
+        result = result.convert(image.mode)
+    image.paste(result, bbox[:2], None if mask.is_rectangle else mask.mask_image())
+    return bbox
+
+
+def move_region(image: Image.Image, source: Tuple[int, int, int, int],
+                position: Tuple[int, int],
+                mask: Optional[SelectionMask] = None) -> Tuple[Tuple, Tuple]:
+    """Переместить фрагмент source в точку position (на месте).
+
+    mask - форма фрагмента (None - весь прямоугольник). Исходные пиксели
+    становятся прозрачными, фрагмент накладывается в новом месте по своей
+    альфе. Возвращает (исходная область, новая область) - только их
+    пиксели и меняются.
+    """
+    source = clip_box(source, image.width, image.height)
+    piece = image.crop(source)
+    shape = mask.mask_image(source) if mask is not None and not mask.is_rectangle else None
+
+    if shape is None:
+        image.paste(TRANSPARENT, source)
+        alpha = piece if piece.mode in ("RGBA", "LA") else None
+    else:
+        image.paste(TRANSPARENT, source, shape)
+        alpha = shape
+        if piece.mode in ("RGBA", "LA"):
+            # Пиксели вне формы не переносятся
+            alpha = Image.fromarray(np.minimum(np.asarray(shape), np.asarray(piece.getchannel("A"))))
+    image.paste(piece, position, alpha)
+
+    x, y = position
+    destination = clip_box((x, y, x + piece.width, y + piece.height), image.width, image.height)
+    return source, destination
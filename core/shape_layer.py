@@ -0,0 +1,127 @@
+# core/shape_layer.py
+from typing import Callable, Optional, Tuple
+import numpy as np
+from PIL import Image, ImageDraw
+from core.brush_engine import blend_over
+
+# Коэффициент суперсэмплинга для сглаживания краев фигур
+SUPERSAMPLE = 4
+
+# Наибольший размер маски с суперсэмплингом (пиксели): у больших фигур
+# коэффициент уменьшается, чтобы предпросмотр оставался быстрым
+SUPERSAMPLE_MAX_PIXELS = 4_000_000
+
+
+def supersample_factor(width: int, height: int) -> int:
+    """Коэффициент суперсэмплинга для области width x height"""
+    factor = SUPERSAMPLE
+    while factor > 1 and width * height * factor * factor > SUPERSAMPLE_MAX_PIXELS:
+        factor //= 2
+    return factor
+
+
+class MaskMapping:
+    """Перевод координат изображения в координаты маски области с
+    суперсэмплингом: пиксель (x, y) становится блоком factor x factor"""
+
+    def __init__(self, origin: Tuple[int, int], factor: int):
+        self.origin = origin
+        self.factor = factor
+
+    def point(self, x: float, y: float) -> Tuple[float, float]:
+        """Центр пикселя (для линий и вершин)"""
+        f = self.factor
+        return ((x - self.origin[0]) * f + (f - 1) / 2,
+                (y - self.origin[1]) * f + (f - 1) / 2)
+
+    def box(self, x1: int, y1: int, x2: int, y2: int) -> Tuple[int, int, int, int]:
+        """Рамка из пикселей x1..x2, y1..y2 включительно (как в ImageDraw)"""
+        f = self.factor
+        ox, oy = self.origin
+        return ((x1 - ox) * f, (y1 - oy) * f, (x2 - ox) * f + f - 1, (y2 - oy) * f + f - 1)
+
+    def length(self, value: float) -> int:
+        return max(1, round(value * self.factor))
+
+
+# Наибольшая маска без сглаживания в координатах документа (пиксели),
+# см. shape_coverage
+ABSOLUTE_MASK_MAX_PIXELS = 16_000_000
+
+
+# draw_shape(draw, mapping, fill): нарисовать значением 255 внутренность
+# фигуры (fill=True) или ее контур (fill=False)
+DrawShape = Callable[[ImageDraw.ImageDraw, MaskMapping, bool], None]
+
+
+def shape_coverage(draw_shape: DrawShape, bbox: Tuple, fill: bool,
+                   antialias: bool) -> np.ndarray:
+    """Покрытие области bbox фигурой (float32, 0..1).
+
+    Без сглаживания маска рисуется в координатах документа (от (0, 0) до
+    правого нижнего угла bbox), и пиксели совпадают с ImageDraw по самому
+    изображению: ImageDraw находит края многоугольников (толстых линий) в
+    дробных координатах, и после сдвига к началу области пиксели на
+    границе в полпикселя округлялись бы иначе. Если такая маска больше
+    ABSOLUTE_MASK_MAX_PIXELS, она рисуется в координатах области.
+    """
+    width, height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    if not antialias and bbox[2] * bbox[3] <= ABSOLUTE_MASK_MAX_PIXELS:
+        mask = Image.new("L", (bbox[2], bbox[3]), 0)
+        draw_shape(ImageDraw.Draw(mask), MaskMapping((0, 0), 1), fill)
+        mask = mask.crop(bbox)
+        return np.asarray(mask).astype(np.float32) * np.float32(1 / 255.0)
+
+    factor = supersample_factor(width, height) if antialias else 1
+    mask = Image.new("L", (width * factor, height * factor), 0)
+    draw_shape(ImageDraw.Draw(mask), MaskMapping(bbox[:2], factor), fill)
+    if factor > 1:
+        mask = mask.reduce(factor)
+    return np.asarray(mask).astype(np.float32) * np.float32(1 / 255.0)
+
+
+def _blend_covered(region: np.ndarray, coverage: np.ndarray, color: Tuple):
+    """Наложить цвет только на пиксели с ненулевым покрытием (на месте)"""
+    ys, xs = np.nonzero(coverage)
+    if len(ys) == 0:
+        return
+    pixels = region[ys, xs][:, None]
+    region[ys, xs] = blend_over(pixels, coverage[ys, xs][:, None], color)[:, 0]
+
+
+def render_shape(region: Image.Image, bbox: Tuple, draw_shape: DrawShape,
+                 color: Tuple, fill_color: Optional[Tuple] = None,
+                 antialias: bool = True) -> Image.Image:
+    """Нарисовать фигуру на фрагменте изображения region с координатами bbox.
+
+    Заливка и контур растеризуются в маски покрытия (со сглаживанием -
+    с суперсэмплингом) и накладываются поверх пикселей с учетом альфы
+    цвета. Возвращается новый фрагмент, region не изменяется.
+    """
+    pixels = np.array(region)
+    if fill_color is not None:
+        _blend_covered(pixels, shape_coverage(draw_shape, bbox, True, antialias), fill_color)
+    _blend_covered(pixels, shape_coverage(draw_shape, bbox, False, antialias), color)
+    return Image.fromarray(pixels, region.mode)
+
+
+class PreviewLayer:
+    """Готовый фрагмент предпросмотра поверх изображения.
+
+    Хранит только область фигуры; холст накладывает ее на тайлы при
+    отрисовке (CanvasWidget.set_compositor), изображение не копируется.
+    """
+
+    def __init__(self, image: Image.Image, bbox: Tuple):
+        self.image = image
+        self.bbox = bbox
+
+    def composite(self, tile: Image.Image, box: Tuple) -> Image.Image:
+        x1, y1 = max(box[0], self.bbox[0]), max(box[1], self.bbox[1])
+        x2, y2 = min(box[2], self.bbox[2]), min(box[3], self.bbox[3])
+        if x1 >= x2 or y1 >= y2:
+            return tile
+        part = self.image.crop((x1 - self.bbox[0], y1 - self.bbox[1],
+                                x2 - self.bbox[0], y2 - self.bbox[1]))
+        tile.paste(part, (x1 - box[0], y1 - box[1]))
+        return tile
@@ -0,0 +1,154 @@
+# core/tiled_executor.py
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+from PIL import Image
+
+# Высота полосы (пиксели), на которые делится изображение
+STRIP_HEIGHT = 256
+
+# Изображения меньше этого числа пикселей обрабатываются без пула
+PARALLEL_MIN_PIXELS = 1_000_000
+
+
+class TiledExecutor:
+    """Выполнение операций над изображением горизонтальными полосами в пуле потоков.
+
+    Pillow и NumPy отпускают GIL во время обработки пикселей, поэтому полосы
+    обрабатываются параллельно на нескольких ядрах. Для операций с
+    окрестностью (свертки) полосы берутся с перекрытием overlap строк,
+    которое отрезается перед сборкой результата.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, strip_height: int = STRIP_HEIGHT,
+                 min_pixels: int = PARALLEL_MIN_PIXELS):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.strip_height = strip_height
+        self.min_pixels = min_pixels
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix="tiled")
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _strips(self, height: int, overlap: int = 0) -> List[Tuple[int, int]]:
+        # Не меньше полосы на поток, чтобы загрузить все ядра
+        step = min(self.strip_height, max(1, math.ceil(height / self.max_workers)))
+        # Перекрытие не должно быть больше самой полосы
+        step = max(step, 2 * overlap)
+        return [(y, min(y + step, height)) for y in range(0, height, step)]
+
+    def _run(self, tasks: List[Callable[[], object]], parallel: bool) -> list:
+        if not parallel or self.max_workers == 1 or len(tasks) == 1:
+            return [task() for task in tasks]
+        return list(self._get_pool().map(lambda task: task(), tasks))
+
+    def _parallel(self, width: int, height: int) -> bool:
+        return width * height >= self.min_pixels
+
+    def map_strips(self, image: Image.Image, operation: Callable[[Image.Image], Image.Image],
+                   overlap: int = 0, mode: Optional[str] = None) -> Image.Image:
+        """Применить операцию, сохраняющую размер, к полосам изображения.
+
+        overlap - радиус окрестности операции: полоса обрабатывается вместе
+        с overlap соседними строками сверху и снизу, лишнее отрезается.
+        mode - режим результата, если операция его меняет.
+        """
+        width, height = image.size
+        if not self._parallel(width, height):
+            return operation(image)
+
+        def task(y1: int, y2: int) -> Image.Image:
+            top = max(0, y1 - overlap)
+            bottom = min(height, y2 + overlap)
+            strip = operation(image.crop((0, top, width, bottom)))
+            return strip.crop((0, y1 - top, width, y1 - top + (y2 - y1)))
+
+        strips = self._strips(height, overlap)
+        parts = self._run([lambda a=y1, b=y2: task(a, b) for y1, y2 in strips], True)
+        return self._stitch(parts, strips, (width, height), mode or parts[0].mode)
+
+    def resize(self, image: Image.Image, size: Tuple[int, int],
+               resample=Image.Resampling.LANCZOS) -> Image.Image:
+        """Изменить размер с тем же результатом, что у Image.resize.
+
+        Pillow масштабирует в два прохода с промежуточным изображением того
+        же режима: по горизонтали (каждая строка независимо), затем по
+        вертикали (каждый столбец независимо). Здесь первый проход идет
+        полосами строк, второй - полосами столбцов, поэтому результат
+        совпадает побитно. RGBA и LA, как в Image.resize, масштабируются с
+        умноженной альфой (RGBa, La). NEAREST выполняется целиком.
+        """
+        new_width, new_height = size
+        if (resample == Image.Resampling.NEAREST or image.mode in ("1", "P") or
+                not self._parallel(max(image.width, new_width), max(image.height, new_height))):
+            return image.resize(size, resample)
+
+        premultiplied = {"RGBA": "RGBa", "LA": "La"}.get(image.mode)
+        work_mode = premultiplied or image.mode
+
+        def horizontal(y1: int, y2: int) -> Image.Image:
+            strip = image.crop((0, y1, image.width, y2))
+            if premultiplied:
+                strip = strip.convert(premultiplied)
+            return strip.resize((new_width, y2 - y1), resample)
+
+        def vertical(x1: int, x2: int) -> Image.Image:
+            column = middle.crop((x1, 0, x2, image.height)).resize((x2 - x1, new_height), resample)
+            return column.convert(image.mode) if premultiplied else column
+
+        strips = self._strips(image.height)
+        parts = self._run([lambda a=y1, b=y2: horizontal(a, b) for y1, y2 in strips], True)
+        middle = self._stitch(parts, strips, (new_width, image.height), work_mode)
+
+        columns = self._strips(new_width)
+        parts = self._run([lambda a=x1, b=x2: vertical(a, b) for x1, x2 in columns], True)
+        result = Image.new(image.mode, size)
+        for part, (x1, _) in zip(parts, columns):
+            result.paste(part, (x1, 0))
+        return result
+
+    def rotate(self, image: Image.Image, angle: float, expand: bool = True,
+               resample=Image.Resampling.NEAREST, fillcolor=None) -> Image.Image:
+        """Повернуть изображение (Image.rotate целиком, см. transform)"""
+        return image.rotate(angle, resample, expand=expand, fillcolor=fillcolor)
+
+    def transform(self, image: Image.Image, size: Tuple[int, int], matrix: Tuple[float, ...],
+                  resample=Image.Resampling.BICUBIC, fillcolor=None) -> Image.Image:
+        """Аффинное преобразование (Image.transform с AFFINE) целиком.
+
+        Полосами его не разбить без изменения результата: Pillow получает
+        координаты источника строки, прибавляя коэффициент к координатам
+        предыдущей, и у полосы со сдвинутой матрицей накопленная ошибка
+        округления другая - на стыках выбираются другие пиксели (при
+        NEAREST) или другие веса (BILINEAR, BICUBIC).
+        """
+        return image.transform(size, Image.Transform.AFFINE, matrix, resample,
+                               fillcolor=fillcolor)
+
+    @staticmethod
+    def _stitch(parts: List[Image.Image], strips: List[Tuple[int, int]],
+                size: Tuple[int, int], mode: str) -> Image.Image:
+        result = Image.new(mode, size)
+        for part, (y1, _) in zip(parts, strips):
+            result.paste(part, (0, y1))
+        return result
+
+
+_executor: Optional[TiledExecutor] = None
+
+
+def get_executor() -> TiledExecutor:
+    """Общий исполнитель приложения (пул создается при первом использовании)"""
+    global _executor
+    if _executor is None:
+        _executor = TiledExecutor()
+    return _executor
@@ -0,0 +1,269 @@
+# core/tiled_image.py
+from typing import Dict, Optional, Tuple, Union
+from PIL import Image
+from core.pixel_format import expand_pixel, format_color, image_format
+from core.pixel_store import PixelStore, Tile, copy_meter, image_nbytes
+from core.tiles import TILE_SIZE, clip_box, tiles_in_box
+
+
+class TiledImage(PixelStore):
+    """Изображение, хранящееся тайлами tile_size x tile_size.
+
+    Операции над областями (см. PixelStore) затрагивают только тайлы
+    своей области.
+
+    Тайлы, в которые еще не писали, не хранятся: их пиксели равны цвету фона
+    color. copy() не копирует пиксели - копии делят тайлы (у тайла есть
+    счетчик владельцев, см. Tile), и тайл дублируется только при первой
+    записи в общий тайл (копирование при записи). Тайлы хранятся в
+    формате pixel_format.
+    """
+
+    def __init__(self, size: Tuple[int, int], color: Tuple = (255, 255, 255, 255),
+                 mode: str = "RGBA", tile_size: int = TILE_SIZE,
+                 pixel_format: Optional[str] = None):
+        self._tiles: Dict[Tuple[int, int], Tile] = {}
+        super().__init__(size, color, mode, tile_size, pixel_format)
+
+    def __del__(self):
+        for tile in getattr(self, "_tiles", {}).values():
+            tile.release()
+
+    @classmethod
+    def from_image(cls, image: Image.Image, color: Optional[Tuple] = None,
+                   tile_size: int = TILE_SIZE, compact: bool = False) -> "TiledImage":
+        """Разрезать изображение на тайлы; тайлы цвета фона не хранятся.
+
+        compact - хранить в наименьшем формате, вмещающем пиксели
+        (image - L, LA, RGB или RGBA), операции видят RGBA.
+        """
+        mode = pixel_format = image.mode
+        if compact:
+            mode, pixel_format = "RGBA", image_format(image)
+        if color is None:
+            color = image.getpixel((0, 0)) if image.width and image.height else 0
+            if compact:
+                color = expand_pixel(color, image.mode)
+        tiled = cls(image.size, color, mode, tile_size, pixel_format)
+        uniform = _uniform_extrema(tiled._background, tiled.format_bands)
+        for key in tiled.keys():
+            tile = image.crop(tiled.tile_box(key))
+            if tile.mode != tiled.pixel_format:
+                tile = tile.convert(tiled.pixel_format)
+            if tile.getextrema() != uniform:
+                tiled._tiles[key] = Tile(tile).acquire()
+        return tiled
+
+    @property
+    def nbytes(self) -> int:
+        """Память, занятая хранимыми тайлами (байты; общие тайлы считаются у каждой копии)"""
+        return sum(image_nbytes(tile.image) for tile in self._tiles.values())
+
+    def tile(self, key: Tuple[int, int]) -> Optional[Image.Image]:
+        """Тайл для чтения в режиме mode (None - тайл цвета фона); изменять его нельзя"""
+        tile = self._tiles.get(key)
+        if tile is None:
+            return None
+        return tile.image.convert(self.mode) if self.compact else tile.image
+
+    def tile_ref(self, key: Tuple[int, int]) -> Optional[Tile]:
+        """Сам тайл со счетчиком владельцев (None - тайл цвета фона), чтобы
+        передать его другому изображению или дельте истории без копирования"""
+        return self._tiles.get(key)
+
+    def shares_tile(self, other: "TiledImage", key: Tuple[int, int]) -> bool:
+        """Один и тот же ли тайл key у двух изображений (тогда пиксели равны без сравнения)"""
+        return (self.tile_size == other.tile_size and
+                self._tiles.get(key) is other._tiles.get(key))
+
+    def _writable(self, key: Tuple[int, int]) -> Image.Image:
+        """Тайл для записи: общий тайл копируется, отсутствующий создается"""
+        tile = self._tiles.get(key)
+        if tile is not None and not tile.shared:
+            return tile.image
+        if tile is None:
+            x1, y1, x2, y2 = self.tile_box(key)
+            image = Image.new(self.pixel_format, (x2 - x1, y2 - y1), self._background)
+        else:
+            image = tile.image.copy()
+            copy_meter.add(image_nbytes(image))
+        self.set_tile(key, image)
+        return image
+
+    def set_tile(self, key: Tuple[int, int], tile: Union[Image.Image, Tile, None]):
+        """Заменить тайл целиком (None - цвет фона), не копируя старый.
+
+        Изображение PIL становится тайлом этого изображения; Tile (например,
+        один тайл цвета на много ключей или тайл другой копии) становится
+        общим и скопируется при первой записи. Тайл другого формата
+        переводится в формат хранения.
+        """
+        if isinstance(tile, Tile) and tile.image.mode != self.pixel_format:
+            tile = tile.image
+        if isinstance(tile, Image.Image):
+            tile = Tile(self._fit(tile))
+        old = self._tiles.pop(key, None)
+        if tile is not None:
+            self._tiles[key] = tile.acquire()
+        if old is not None:
+            old.release()
+
+    def copy(self) -> "TiledImage":
+        """Снимок за O(число тайлов): пиксели общие до первой записи"""
+        result = TiledImage(self.size, self.color, self.mode, self.tile_size, self.pixel_format)
+        result._tiles = {key: tile.acquire() for key, tile in self._tiles.items()}
+        return result
+
+    def _convert_pixels(self, pixel_format: str):
+        for key, tile in list(self._tiles.items()):
+            image = tile.image.convert(pixel_format)
+            copy_meter.add(image_nbytes(image))
+            self._tiles[key] = Tile(image).acquire()
+            tile.release()
+
+    def getpixel(self, xy: Tuple[int, int]):
+        x, y = int(xy[0]), int(xy[1])
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError("координаты пикселя вне изображения")
+        key = (x // self.tile_size, y // self.tile_size)
+        tile = self._tiles.get(key)
+        if tile is None:
+            return self.color
+        value = tile.image.getpixel((x - key[0] * self.tile_size, y - key[1] * self.tile_size))
+        return expand_pixel(value, self.pixel_format) if self.compact else value
+
+    def crop(self, box: Tuple[int, int, int, int]) -> Image.Image:
+        """Фрагмент box как обычное изображение PIL (за краем - нули, как в Image.crop)"""
+        return self._crop(box, self.mode)
+
+    def raw_crop(self, box: Tuple[int, int, int, int]) -> Image.Image:
+        return self._crop(box, self.pixel_format)
+
+    def _crop(self, box: Tuple[int, int, int, int], mode: str) -> Image.Image:
+        x1, y1, x2, y2 = (int(v) for v in box)
+        keys = list(tiles_in_box((x1, y1, x2, y2), *self.size, self.tile_size))
+        if len(keys) == 1:
+            # Фрагмент внутри одного тайла
+            tx1, ty1, tx2, ty2 = self.tile_box(keys[0])
+            tile = self._tiles.get(keys[0])
+            if tile is not None and tx1 <= x1 and ty1 <= y1 and x2 <= tx2 and y2 <= ty2:
+                piece = tile.image.crop((x1 - tx1, y1 - ty1, x2 - tx1, y2 - ty1))
+                return piece if piece.mode == mode else piece.convert(mode)
+
+        result = Image.new(mode, (max(0, x2 - x1), max(0, y2 - y1)))
+        background = self.color if mode == self.mode else format_color(self.color, mode)
+        for key in keys:
+            tx1, ty1, tx2, ty2 = self.tile_box(key)
+            px1, py1 = max(x1, tx1), max(y1, ty1)
+            px2, py2 = min(x2, tx2), min(y2, ty2)
+            tile = self._tiles.get(key)
+            if tile is None:
+                result.paste(background, (px1 - x1, py1 - y1, px2 - x1, py2 - y1))
+            else:
+                result.paste(tile.image.crop((px1 - tx1, py1 - ty1, px2 - tx1, py2 - ty1)),
+                             (px1 - x1, py1 - y1))
+        return result
+
+    def paste(self, im, box: Optional[Tuple] = None, mask: Optional[Image.Image] = None):
+        """Вставить изображение или цвет (как Image.paste), меняя только
+        затронутые тайлы. box - левый верхний угол или прямоугольник."""
+        if box is None:
+            box = (0, 0)
+        im = self._fit(im)
+        if isinstance(im, Image.Image):
+            region = (int(box[0]), int(box[1]), int(box[0]) + im.width, int(box[1]) + im.height)
+        elif len(box) == 4:
+            region = tuple(int(v) for v in box)
+        else:
+            size = mask.size if mask is not None else self.size
+            region = (int(box[0]), int(box[1]), int(box[0]) + size[0], int(box[1]) + size[1])
+
+        rx1, ry1 = region[:2]
+        for key in tiles_in_box(region, *self.size, self.tile_size):
+            tx1, ty1, tx2, ty2 = self.tile_box(key)
+            px1, py1 = max(region[0], tx1), max(region[1], ty1)
+            px2, py2 = min(region[2], tx2), min(region[3], ty2)
+            source = (px1 - rx1, py1 - ry1, px2 - rx1, py2 - ry1)
+            part = im.crop(source) if isinstance(im, Image.Image) else im
+            part_mask = mask.crop(source) if mask is not None else None
+
+            if part_mask is None and (px1, py1, px2, py2) == (tx1, ty1, tx2, ty2):
+                # Тайл перекрыт целиком: старые пиксели не нужны, копировать их незачем
+                if isinstance(part, Image.Image):
+                    self.set_tile(key, part)
+                elif part == self._background:
+                    self.set_tile(key, None)
+                else:
+                    self.set_tile(key, Image.new(self.pixel_format, (tx2 - tx1, ty2 - ty1), part))
+                continue
+
+            target = (px1 - tx1, py1 - ty1, px2 - tx1, py2 - ty1)
+            tile = self._writable(key)
+            if isinstance(part, Image.Image):
+                tile.paste(part, target[:2], part_mask)
+            else:
+                tile.paste(part, target, part_mask)
+
+    def cropped(self, box: Tuple[int, int, int, int]) -> "TiledImage":
+        """Обрезка без сборки всего изображения: при обрезке по сетке тайлов
+        тайлы не копируются, а становятся общими"""
+        x1, y1, x2, y2 = clip_box(box, self.width, self.height)
+        result = TiledImage((x2 - x1, y2 - y1), self.color, self.mode, self.tile_size,
+                            self.pixel_format)
+        aligned = x1 % self.tile_size == 0 and y1 % self.tile_size == 0
+        shift = (x1 // self.tile_size, y1 // self.tile_size)
+
+        for key in result.keys():
+            bx1, by1, bx2, by2 = result.tile_box(key)
+            source = (bx1 + x1, by1 + y1, bx2 + x1, by2 + y1)
+            if aligned:
+                src_key = (key[0] + shift[0], key[1] + shift[1])
+                tile = self._tiles.get(src_key)
+                if tile is None:
+                    continue
+                if self.tile_box(src_key) == source:
+                    result.set_tile(key, tile)
+                    continue
+            elif all(self._tiles.get(k) is None
+                     for k in tiles_in_box(source, *self.size, self.tile_size)):
+                continue
+            result.set_tile(key, self.raw_crop(source))
+        return result
+
+    def to_image(self, mode: Optional[str] = None) -> Image.Image:
+        """Собрать полное изображение PIL (память на весь холст) в режиме
+        mode (по умолчанию - self.mode)"""
+        mode = mode or self.mode
+        background = self.color if mode == self.mode else format_color(self.color, mode)
+        result = Image.new(mode, self.size, background)
+        for key, tile in self._tiles.items():
+            result.paste(tile.image, self.tile_box(key)[:2])
+        return result
+
+    def histogram(self, mask: Optional[Image.Image] = None):
+        """Гистограмма как в Image.histogram, по тайлам"""
+        if mask is not None:
+            return super().histogram(mask)
+        bands = len(self.getbands())
+        total = [0] * (256 * bands)
+        missing = 0
+        for key in self.keys():
+            tile = self.tile(key)
+            if tile is None:
+                x1, y1, x2, y2 = self.tile_box(key)
+                missing += (x2 - x1) * (y2 - y1)
+                continue
+            for i, count in enumerate(tile.histogram()):
+                total[i] += count
+        color = self.color if isinstance(self.color, tuple) else (self.color,)
+        for band in range(bands):
+            total[band * 256 + color[band]] += missing
+        return total
+
+
+def _uniform_extrema(color, bands: int) -> Tuple:
+    """Результат getextrema() для тайла, залитого цветом color"""
+    if bands == 1:
+        value = color[0] if isinstance(color, tuple) else color
+        return (value, value)
+    return tuple((value, value) for value in color[:bands])
@@ -0,0 +1,90 @@
+# core/tiles.py
+import numpy as np
+from typing import Iterator, List, Optional, Tuple
+
+# Размер тайла по умолчанию (пиксели)
+TILE_SIZE = 128
+
+# Пустая область: "изменений нет"
+EMPTY_BOX = (0, 0, 0, 0)
+
+
+def tile_box(tx: int, ty: int, width: int, height: int,
+             tile_size: int = TILE_SIZE) -> Tuple[int, int, int, int]:
+    """Прямоугольник тайла (x1, y1, x2, y2) с учетом границ изображения"""
+    x1 = tx * tile_size
+    y1 = ty * tile_size
+    return (x1, y1, min(x1 + tile_size, width), min(y1 + tile_size, height))
+
+
+def tiles_in_box(box: Tuple, width: int, height: int,
+                 tile_size: int = TILE_SIZE) -> Iterator[Tuple[int, int]]:
+    """Индексы тайлов, пересекающих прямоугольник (x1, y1, x2, y2)"""
+    x1, y1, x2, y2 = clip_box(box, width, height)
+    if x1 >= x2 or y1 >= y2:
+        return
+    for ty in range(y1 // tile_size, (y2 - 1) // tile_size + 1):
+        for tx in range(x1 // tile_size, (x2 - 1) // tile_size + 1):
+            yield (tx, ty)
+
+
+def clip_box(box: Tuple, width: int, height: int) -> Tuple[int, int, int, int]:
+    """Обрезать прямоугольник по границам изображения"""
+    x1, y1, x2, y2 = box
+    return (max(0, int(x1)), max(0, int(y1)),
+            min(width, int(x2)), min(height, int(y2)))
+
+
+def union_box(a: Optional[Tuple], b: Optional[Tuple]) -> Optional[Tuple]:
+    """Объединение двух прямоугольников (None - пустой прямоугольник)"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def tiles_bbox(keys, width: int, height: int,
+               tile_size: int = TILE_SIZE) -> Optional[Tuple[int, int, int, int]]:
+    """Область, покрываемая набором тайлов (None для пустого набора)"""
+    bbox = None
+    for tx, ty in keys:
+        bbox = union_box(bbox, tile_box(tx, ty, width, height, tile_size))
+    return bbox
+
+
+def changed_tiles(old: np.ndarray, new: np.ndarray, tile_size: int = TILE_SIZE,
+                  box: Optional[Tuple] = None) -> List[Tuple[int, int]]:
+    """Найти тайлы, в которых два массива одинакового размера отличаются.
+
+    Если указан box, сравниваются только тайлы, пересекающие его.
+    """
+    height, width = old.shape[:2]
+    if box is None:
+        x1, y1, x2, y2 = 0, 0, width, height
+    else:
+        x1, y1, x2, y2 = clip_box(box, width, height)
+        if x1 >= x2 or y1 >= y2:
+            return []
+        # Расширяем до границ тайлов
+        x1 = (x1 // tile_size) * tile_size
+        y1 = (y1 // tile_size) * tile_size
+
+    old, new = old[y1:y2, x1:x2], new[y1:y2, x1:x2]
+    if old.ndim == 3 and old.shape[2] == 4 and old.dtype == new.dtype == np.uint8:
+        # Пиксель RGBA сравнивается одним uint32 (view без копирования)
+        diff = old.view(np.uint32)[..., 0] != new.view(np.uint32)[..., 0]
+    else:
+        diff = old != new
+        if diff.ndim == 3:
+            diff = diff.any(axis=2)
+    if not diff.any():
+        return []
+
+    # Сворачиваем маску отличий до сетки тайлов
+    rows = np.logical_or.reduceat(diff, np.arange(0, diff.shape[0], tile_size), axis=0)
+    grid = np.logical_or.reduceat(rows, np.arange(0, diff.shape[1], tile_size), axis=1)
+
+    ty0 = y1 // tile_size
+    tx0 = x1 // tile_size
+    return [(int(tx) + tx0, int(ty) + ty0) for ty, tx in np.argwhere(grid)]
@@ -0,0 +1,155 @@
+# core/transforms.py
+import math
+from typing import Optional, Tuple
+import numpy as np
+from PIL import Image
+
+# Погрешность, при которой коэффициенты матрицы считаются равными
+EPSILON = 1e-9
+
+# Погрешность (пиксели), при которой углы результата считаются совпадающими
+CORNER_EPSILON = 1e-6
+
+# Транспонирования для поворотов на k * 90 градусов против часовой стрелки
+_RIGHT_ANGLES = {
+    1: Image.Transpose.ROTATE_90,
+    2: Image.Transpose.ROTATE_180,
+    3: Image.Transpose.ROTATE_270,
+}
+
+
+def _translate(tx: float, ty: float) -> np.ndarray:
+    return np.array([[1, 0, tx], [0, 1, ty], [0, 0, 1]], dtype=np.float64)
+
+
+def _scale(sx: float, sy: float) -> np.ndarray:
+    return np.array([[sx, 0, 0], [0, sy, 0], [0, 0, 1]], dtype=np.float64)
+
+
+def _rotation(angle: float) -> np.ndarray:
+    """Поворот на angle градусов против часовой стрелки (ось y направлена вниз)"""
+    radians = math.radians(angle)
+    cos = round(math.cos(radians), 15)
+    sin = round(math.sin(radians), 15)
+    return np.array([[cos, sin, 0], [-sin, cos, 0], [0, 0, 1]], dtype=np.float64)
+
+
+class AffineTransform:
+    """Аффинное преобразование изображения: прямая матрица (источник -> результат)
+    в непрерывных координатах и размер результата.
+
+    Последовательные изменения размера и повороты складываются умножением
+    матриц, а пиксели пересчитываются один раз из исходного изображения,
+    поэтому размытие не накапливается.
+    """
+
+    def __init__(self, source_size: Tuple[int, int], matrix: Optional[np.ndarray] = None,
+                 size: Optional[Tuple[int, int]] = None):
+        self.source_size = source_size
+        self.matrix = np.eye(3) if matrix is None else matrix
+        self.size = size or source_size
+
+    def then_resize(self, width: int, height: int) -> "AffineTransform":
+        """Добавить изменение размера текущего результата до width x height"""
+        w, h = self.size
+        scale = _scale(width / w, height / h)
+        return AffineTransform(self.source_size, scale @ self.matrix, (width, height))
+
+    def then_rotate(self, angle: float, expand: bool = True) -> "AffineTransform":
+        """Добавить поворот результата на angle градусов против часовой (как Image.rotate)"""
+        w, h = self.size
+        rotation = _rotation(angle) @ _translate(-w / 2, -h / 2)
+        if expand:
+            # Размер считается как в Image.rotate: углы в координатах,
+            # сдвинутых на центр исходного изображения
+            corners = rotation @ np.array([[0, w, w, 0], [0, 0, h, h], [1, 1, 1, 1]])
+            nw = _extent(corners[0] + w / 2)
+            nh = _extent(corners[1] + h / 2)
+        else:
+            nw, nh = w, h
+        step = _translate(nw / 2, nh / 2) @ rotation
+        return AffineTransform(self.source_size, step @ self.matrix, (nw, nh))
+
+    def right_angle_turns(self) -> Optional[int]:
+        """Число поворотов на 90 градусов, если линейная часть - поворот на
+        кратный прямой угол, умноженный на положительное масштабирование осей"""
+        for turns in range(4):
+            # Снимаем поворот: остаток должен быть диагональным и положительным
+            rest = self.matrix[:2, :2] @ np.linalg.inv(_rotation(90 * turns)[:2, :2])
+            if (abs(rest[0, 1]) < EPSILON and abs(rest[1, 0]) < EPSILON and
+                    rest[0, 0] > 0 and rest[1, 1] > 0):
+                return turns
+        return None
+
+    def maps_onto_result(self) -> bool:
+        """Переводит ли матрица источник ровно в прямоугольник результата
+        (0, 0)-size, то есть не содержит ли сдвига сверх транспонирования
+        и масштабирования"""
+        w, h = self.source_size
+        corners = self.matrix @ np.array([[0, w, w, 0], [0, 0, h, h], [1, 1, 1, 1]])
+        bounds = (corners[0].min(), corners[1].min(), corners[0].max(), corners[1].max())
+        return all(abs(value - target) < CORNER_EPSILON
+                   for value, target in zip(bounds, (0, 0) + tuple(self.size)))
+
+    def inverse_coefficients(self, matrix: Optional[np.ndarray] = None) -> Tuple[float, ...]:
+        """Коэффициенты для Image.transform(AFFINE): результат -> источник"""
+        inverse = np.linalg.inv(self.matrix if matrix is None else matrix)
+        return tuple(float(v) for v in inverse[:2].reshape(-1))
+
+    def min_scale(self) -> float:
+        """Наименьший коэффициент масштабирования (сингулярное число)"""
+        return float(np.linalg.svd(self.matrix[:2, :2], compute_uv=False).min())
+
+    def apply(self, image: Image.Image, executor=None,
+              resample=Image.Resampling.BICUBIC) -> Image.Image:
+        """Пересчитать изображение одним проходом.
+
+        Повороты на прямые углы выполняются транспонированием без потерь,
+        масштабирование вдоль осей - одним Image.resize (LANCZOS), остальное -
+        одним аффинным преобразованием. Транспонирование годится, только
+        если источник ложится ровно на весь результат: у цепочки вроде
+        поворотов на 30 и -30 градусов с expand линейная часть единичная,
+        но есть сдвиг, и она идет общим путем.
+        """
+        turns = self.right_angle_turns()
+        if turns is not None and self.maps_onto_result():
+            if turns:
+                image = image.transpose(_RIGHT_ANGLES[turns])
+            if image.size == tuple(self.size):
+                return image
+            if executor is not None:
+                return executor.resize(image, self.size, Image.Resampling.LANCZOS)
+            return image.resize(self.size, Image.Resampling.LANCZOS)
+
+        matrix = self.matrix
+        # При сильном уменьшении сначала усредняем блоки, иначе будет алиасинг
+        factor = int(1 / self.min_scale()) if self.min_scale() < 0.5 else 1
+        if factor > 1:
+            image = image.reduce(factor)
+            matrix = matrix @ _scale(factor, factor)
+
+        coefficients = self.inverse_coefficients(matrix)
+        if executor is not None:
+            return executor.transform(image, self.size, coefficients, resample)
+        return image.transform(self.size, Image.Transform.AFFINE, coefficients, resample)
+
+    def preview(self, proxy: Image.Image, max_size: Tuple[int, int]) -> Image.Image:
+        """Быстрый предпросмотр (NEAREST) на уменьшенной копии источника,
+        результат вписан в max_size"""
+        fit = min(max_size[0] / self.size[0], max_size[1] / self.size[1], 1.0)
+        size = (max(1, round(self.size[0] * fit)), max(1, round(self.size[1] * fit)))
+        to_source = _scale(self.source_size[0] / proxy.width, self.source_size[1] / proxy.height)
+        matrix = _scale(fit, fit) @ self.matrix @ to_source
+        return proxy.transform(size, Image.Transform.AFFINE, self.inverse_coefficients(matrix),
+                               Image.Resampling.NEAREST)
+
+
+def _extent(values: np.ndarray) -> int:
+    # Округление крайних координат наружу
+    return math.ceil(values.max() - EPSILON) - math.floor(values.min() + EPSILON)
+
+
+def make_proxy(image: Image.Image, max_size: Tuple[int, int]) -> Image.Image:
+    """Уменьшенная копия для предпросмотра (целый коэффициент, без полного копирования)"""
+    factor = max(1, math.ceil(max(image.width / max_size[0], image.height / max_size[1])))
+    return image.reduce(factor)
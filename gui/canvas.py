@@ -1,8 +1,124 @@
 # gui/canvas.py
 import tkinter as tk
+import time
+import numpy as np
 from PIL import Image, ImageTk
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
 from tools.selection_tool import SelectionTool
+from core.tiles import clip_box, tile_box, tiles_in_box, union_box
+
+# Размер тайла отображения: холст хранит по одному PhotoImage на тайл
+DISPLAY_TILE_SIZE = 256
+
+# Запас вокруг видимой области (в тайлах отображения), который загружается
+# заранее, чтобы при прокрутке не было пустых полос
+VIEWPORT_MARGIN_TILES = 1
+
+# Интервал кадра планировщика отрисовки (мс), ~60 кадров в секунду
+FRAME_INTERVAL_MS = 16
+
+# Цвет контура выделения произвольной формы
+SELECTION_OUTLINE_COLOR = (0, 0, 255, 255)
+
+
+class RenderScheduler:
+    """Планировщик перерисовки: объединяет запросы и рисует не чаще раза за кадр.
+
+    Инструменты помечают холст грязным через request(); один колбэк after()
+    перерисовывает накопленную область. Ведется статистика: нарисованные
+    кадры, объединенные запросы, пропущенные кадры и задержка от первого
+    запроса до отрисовки.
+    """
+
+    def __init__(self, widget: tk.Misc, paint: Callable[[Optional[Tuple]], None],
+                 frame_interval_ms: int = FRAME_INTERVAL_MS):
+        self._widget = widget
+        self._paint = paint
+        self._interval = frame_interval_ms
+        self._after_id = None
+        self._damage: Optional[Tuple] = None
+        self._first_request = None
+        self._scheduled_at = None
+        self._last_frame = 0.0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.frames = 0
+        self.requests = 0
+        self.merged = 0
+        self.dropped = 0
+        self.last_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self._total_latency_ms = 0.0
+
+    @property
+    def average_latency_ms(self) -> float:
+        return self._total_latency_ms / self.frames if self.frames else 0.0
+
+    @property
+    def pending(self) -> bool:
+        return self._after_id is not None
+
+    def request(self, bbox: Optional[Tuple] = None):
+        """Запросить перерисовку области bbox (None - все изменения модели)"""
+        self.requests += 1
+        self._damage = union_box(self._damage, bbox)
+
+        if self._after_id is not None:
+            self.merged += 1
+            return
+
+        now = time.perf_counter()
+        self._first_request = now
+        # Не чаще одного кадра за интервал
+        delay = max(0, int(self._interval - (now - self._last_frame) * 1000))
+        self._scheduled_at = now + delay / 1000
+        self._after_id = self._widget.after(delay, self._on_frame)
+
+    def flush(self):
+        """Нарисовать отложенный кадр немедленно"""
+        if self._after_id is not None:
+            self._widget.after_cancel(self._after_id)
+            self._on_frame()
+
+    def cancel(self):
+        """Отменить отложенный кадр (например, после полной перерисовки)"""
+        if self._after_id is not None:
+            self._widget.after_cancel(self._after_id)
+            self._after_id = None
+            self._damage = None
+
+    def _on_frame(self):
+        self._after_id = None
+        damage, self._damage = self._damage, None
+
+        start = time.perf_counter()
+        # Колбэк опоздал больше чем на кадр - эти кадры пропущены
+        late_ms = (start - self._scheduled_at) * 1000
+        if late_ms > self._interval:
+            self.dropped += int(late_ms // self._interval)
+
+        self._paint(damage)
+
+        end = time.perf_counter()
+        self._last_frame = end
+        self.frames += 1
+        self.last_latency_ms = (end - self._first_request) * 1000
+        self.max_latency_ms = max(self.max_latency_ms, self.last_latency_ms)
+        self._total_latency_ms += self.last_latency_ms
+
+        # Отрисовка дольше кадра тоже съедает кадры
+        paint_ms = (end - start) * 1000
+        if paint_ms > self._interval:
+            self.dropped += int(paint_ms // self._interval)
+
+    def summary(self) -> str:
+        """Краткая сводка статистики"""
+        return (f"Кадров: {self.frames}, запросов: {self.requests}, "
+                f"объединено: {self.merged}, пропущено кадров: {self.dropped}\n"
+                f"Задержка ввод-пиксели: последняя {self.last_latency_ms:.1f} мс, "
+                f"средняя {self.average_latency_ms:.1f} мс, "
+                f"максимальная {self.max_latency_ms:.1f} мс")
 
 
 class CanvasWidget(tk.Canvas):
@@ -13,16 +129,33 @@ class CanvasWidget(tk.Canvas):
         self.controller = controller
         self.model = controller.model
         self.current_tool = None
-        self.tk_image = None
-        self.canvas_image_id = None
         self.scale = 1.0
 
+        # PhotoImage видимых тайлов: (tx, ty) -> (photo, id элемента холста)
+        self._tiles: Dict[Tuple[int, int], Tuple[ImageTk.PhotoImage, int]] = {}
+        self._tiles_size: Optional[Tuple[int, int]] = None
+        self._rendered_generation = -1
+
+        # Функция (фрагмент, область) -> фрагмент, через которую проходят тайлы
+        # перед отображением (например, буфер текущего штриха кисти)
+        self.compositor: Optional[Callable[[Image.Image, Tuple], Image.Image]] = None
+
+        # Контур выделения произвольной формы: (маска, PhotoImage)
+        self._selection_outline: Optional[Tuple] = None
+
+        # Временное изображение поверх холста (предпросмотр)
+        self._overlay_image = None
+        self._overlay_id = None
+
+        self.render_scheduler = RenderScheduler(self, self.update_image)
+
         self.bind("<ButtonPress-1>", self.on_mouse_down)
         self.bind("<B1-Motion>", self.on_mouse_move)
         self.bind("<ButtonRelease-1>", self.on_mouse_up)
         self.bind("<MouseWheel>", self.on_mouse_wheel)
         self.bind("<Button-4>", self.on_mouse_wheel)
         self.bind("<Button-5>", self.on_mouse_wheel)
+        self.bind("<Configure>", lambda event: self._load_visible_tiles())
 
     def set_tool(self, tool):
         if self.current_tool:
@@ -33,68 +166,31 @@ class CanvasWidget(tk.Canvas):
             tool.activate()
             self.config(cursor=tool.cursor)
 
-    def update_image(self):
-        """Обновить изображение на холсте"""
-        if self.model.image:
-            self.tk_image = ImageTk.PhotoImage(self.model.image)
+    def set_compositor(self, compositor: Optional[Callable[[Image.Image, Tuple], Image.Image]]):
+        """Задать (или убрать, None) наложение поверх изображения при отрисовке"""
+        self.compositor = compositor
+
+    def request_redraw(self, bbox: Optional[Tuple] = None):
+        """Отложенная перерисовка: запросы объединяются до следующего кадра"""
+        self.render_scheduler.request(bbox)
 
-            if self.canvas_image_id is not None:
-                self.itemconfig(self.canvas_image_id, image=self.tk_image)
+    def update_image(self, bbox: Optional[Tuple] = None):
+        """Обновить изображение на холсте немедленно.
+
+        Загружаются только поврежденные видимые тайлы: область bbox или
+        все, что изменилось в модели с прошлой отрисовки. Тайлы
+        пересоздаются целиком только при изменении размера изображения.
+        """
+        if self.model.image:
+            if self._tiles_size != self.model.image.size:
+                self._rebuild_tiles()
             else:
-                self.canvas_image_id = self.create_image(
-                    0, 0,
-                    anchor=tk.NW,
-                    image=self.tk_image,
-                    tags="image"
-                )
-
-            # Очищаем старые элементы выделения
-            self.delete("selection")
-            self.delete("selection_handle")
-
-            # Восстанавливаем выделение после обновления изображения
-            if (self.current_tool and
-                    isinstance(self.current_tool, SelectionTool) and
-                    self.model.selection):
-
-                x1, y1, x2, y2 = self.model.selection
-
-                # Создаем прямоугольник выделения
-                self.current_tool.selection_rect = self.create_rectangle(
-                    x1, y1, x2, y2,
-                    outline='blue',
-                    dash=(4, 2),
-                    width=2,
-                    tags="selection"
-                )
-
-                # Создаем ручки для изменения размера
-                handle_size = 6
-                handles_positions = [
-                    (x1, y1),  # верхний левый
-                    (x2, y1),  # верхний правый
-                    (x1, y2),  # нижний левый
-                    (x2, y2),  # нижний правый
-                ]
-
-                self.current_tool.selection_handles = []
-                for hx, hy in handles_positions:
-                    handle = self.create_rectangle(
-                        hx - handle_size, hy - handle_size,
-                        hx + handle_size, hy + handle_size,
-                        fill='white',
-                        outline='blue',
-                        width=1,
-                        tags="selection_handle"
-                    )
-                    self.current_tool.selection_handles.append(handle)
-
-                # Обновляем флаги в инструменте
-                self.current_tool.has_selection = True
-                self.current_tool.start_x = x1
-                self.current_tool.start_y = y1
-                self.current_tool.current_x = x2
-                self.current_tool.current_y = y2
+                damage = union_box(self.model.changes_since(self._rendered_generation), bbox)
+                if damage is not None:
+                    self._paste_region(damage)
+            self._rendered_generation = self.model.generation
+
+            self._draw_selection()
 
             # Устанавливаем правильный порядок элементов:
             # 1. Изображение должно быть на самом нижнем слое
@@ -105,6 +201,169 @@ class CanvasWidget(tk.Canvas):
 
             self.update_scroll_region()
 
+    def _draw_selection(self):
+        """Показать выделение: рамка, контур формы (если это не прямоугольник)
+        и ручки для инструмента выделения"""
+        self.delete("selection")
+        self.delete("selection_handle")
+
+        mask = self.model.selection_mask
+        if mask is None:
+            self._selection_outline = None
+            return
+        x1, y1, x2, y2 = mask.bbox
+
+        if not mask.is_rectangle:
+            # Контур произвольной формы - одно изображение размером с рамку;
+            # маска неизменяема, поэтому изображение строится один раз
+            if self._selection_outline is None or self._selection_outline[0] is not mask:
+                edge = mask.outline()
+                outline = np.zeros(edge.shape + (4,), dtype=np.uint8)
+                outline[edge] = SELECTION_OUTLINE_COLOR
+                photo = ImageTk.PhotoImage(Image.fromarray(outline, "RGBA"))
+                self._selection_outline = (mask, photo)
+            self.create_image(x1, y1, anchor=tk.NW, image=self._selection_outline[1],
+                              tags="selection")
+
+        if not isinstance(self.current_tool, SelectionTool):
+            if mask.is_rectangle:
+                self.create_rectangle(x1, y1, x2, y2, outline='blue', dash=(4, 2),
+                                      width=2, tags="selection")
+            return
+
+        # Создаем прямоугольник выделения
+        self.current_tool.selection_rect = self.create_rectangle(
+            x1, y1, x2, y2,
+            outline='blue',
+            dash=(4, 2),
+            width=2,
+            tags="selection"
+        )
+
+        # Создаем ручки для изменения размера
+        handle_size = 6
+        handles_positions = [
+            (x1, y1),  # верхний левый
+            (x2, y1),  # верхний правый
+            (x1, y2),  # нижний левый
+            (x2, y2),  # нижний правый
+        ]
+
+        self.current_tool.selection_handles = []
+        for hx, hy in handles_positions:
+            handle = self.create_rectangle(
+                hx - handle_size, hy - handle_size,
+                hx + handle_size, hy + handle_size,
+                fill='white',
+                outline='blue',
+                width=1,
+                tags="selection_handle"
+            )
+            self.current_tool.selection_handles.append(handle)
+
+        # Обновляем флаги в инструменте
+        self.current_tool.has_selection = True
+        self.current_tool.start_x = x1
+        self.current_tool.start_y = y1
+        self.current_tool.current_x = x2
+        self.current_tool.current_y = y2
+
+    def _rebuild_tiles(self):
+        """Пересоздать тайлы отображения под новый размер изображения"""
+        self.delete("image")
+        self._tiles.clear()
+        self._tiles_size = self.model.image.size
+        self._load_visible_tiles()
+
+    def xview(self, *args):
+        result = super().xview(*args)
+        if args:
+            self._load_visible_tiles()
+        return result
+
+    def yview(self, *args):
+        result = super().yview(*args)
+        if args:
+            self._load_visible_tiles()
+        return result
+
+    def _visible_box(self) -> Tuple[int, int, int, int]:
+        """Видимая часть изображения с запасом VIEWPORT_MARGIN_TILES"""
+        margin = DISPLAY_TILE_SIZE * VIEWPORT_MARGIN_TILES
+        x1, y1 = self.canvasx(0), self.canvasy(0)
+        x2, y2 = self.canvasx(self.winfo_width()), self.canvasy(self.winfo_height())
+        return clip_box((x1 - margin, y1 - margin, x2 + margin, y2 + margin),
+                        *self._tiles_size)
+
+    def _load_visible_tiles(self):
+        """Держать PhotoImage только для видимых тайлов.
+
+        Из изображения читается лишь видимая область: новые тайлы
+        строятся из текущих пикселей модели, ушедшие из вида удаляются.
+        Поэтому память и время отрисовки зависят от размера окна, а не
+        холста.
+        """
+        if self._tiles_size is None:
+            return
+        width, height = self._tiles_size
+        visible = set(tiles_in_box(self._visible_box(), width, height, DISPLAY_TILE_SIZE))
+
+        for key in [key for key in self._tiles if key not in visible]:
+            self.delete(self._tiles.pop(key)[1])
+        added = False
+        for key in visible:
+            if key in self._tiles:
+                continue
+            box = tile_box(key[0], key[1], width, height, DISPLAY_TILE_SIZE)
+            photo = ImageTk.PhotoImage(self._display_region(box))
+            item = self.create_image(box[0], box[1], anchor=tk.NW, image=photo, tags="image")
+            self._tiles[key] = (photo, item)
+            added = True
+        if added:
+            self.tag_lower("image")
+
+    def _paste_region(self, bbox: Tuple):
+        """Загрузить в PhotoImage только видимые тайлы, пересекающие bbox
+        (невидимые построятся заново, когда попадут в вид)"""
+        width, height = self.model.image.size
+        for key in tiles_in_box(bbox, width, height, DISPLAY_TILE_SIZE):
+            if key not in self._tiles:
+                continue
+            photo, _ = self._tiles[key]
+            box = tile_box(key[0], key[1], width, height, DISPLAY_TILE_SIZE)
+            photo.paste(self._display_region(box))
+
+    def _display_region(self, box: Tuple) -> Image.Image:
+        """Фрагмент изображения для отображения (с наложением, если оно задано)"""
+        region = self.model.image.crop(box)
+        if self.compositor is not None:
+            region = self.compositor(region, box)
+        return region
+
+    def show_overlay(self, image: Image.Image, x: int = 0, y: int = 0):
+        """Показать временное изображение поверх холста"""
+        self._overlay_image = ImageTk.PhotoImage(image)
+        if self._overlay_id is None:
+            self._overlay_id = self.create_image(x, y, anchor=tk.NW,
+                                                 image=self._overlay_image,
+                                                 tags="overlay")
+        else:
+            self.itemconfig(self._overlay_id, image=self._overlay_image)
+            self.coords(self._overlay_id, x, y)
+        self.tag_raise("overlay", "image")
+
+    def move_overlay(self, x: int, y: int):
+        """Передвинуть временное изображение (без пересоздания PhotoImage)"""
+        if self._overlay_id is not None:
+            self.coords(self._overlay_id, x, y)
+
+    def clear_overlay(self):
+        """Убрать временное изображение"""
+        if self._overlay_id is not None:
+            self.delete(self._overlay_id)
+            self._overlay_id = None
+            self._overlay_image = None
+
     def update_scroll_region(self):
         """Обновить область прокрутки"""
         if self.model.image:
@@ -152,7 +411,7 @@ class CanvasWidget(tk.Canvas):
 
             mod_event = ModifiedEvent(x, y, event.state)
             self.current_tool.on_mouse_up(mod_event, self.model, self)
-            self.update_image()
+            self.request_redraw()
 
     def on_mouse_wheel(self, event):
         if event.state & 0x4:  # Ctrl нажат
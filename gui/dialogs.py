@@ -2,6 +2,16 @@
 import tkinter as tk
 from tkinter import ttk, simpledialog, colorchooser
 import tkinter.messagebox as messagebox
+from typing import List
+from PIL import Image, ImageTk
+from core.point_ops import brightness_contrast_pipeline, lut_table
+from core.transforms import AffineTransform, make_proxy
+
+# Максимальный размер уменьшенной копии для предпросмотра
+PREVIEW_SIZE = (320, 240)
+
+# Задержка перед перерисовкой предпросмотра после движения ползунка (мс)
+PREVIEW_DEBOUNCE_MS = 15
 
 
 class NewImageDialog:
@@ -84,25 +94,67 @@ class NewImageDialog:
         self.dialog.destroy()
 
 
+class TransformPreview:
+    """Живой предпросмотр поворота/изменения размера в диалоге.
+
+    Преобразование применяется к уменьшенной копии с NEAREST, поэтому кадр
+    дешев при любом размере документа; события ползунков и полей
+    объединяются с задержкой PREVIEW_DEBOUNCE_MS.
+    """
+
+    def __init__(self, image: Image.Image):
+        self._size = image.size
+        self._proxy = make_proxy(image, PREVIEW_SIZE)
+        self._photo = None
+        self._after_id = None
+
+    def attach(self, dialog, parent_frame, build_transform):
+        """Создать область предпросмотра; build_transform(AffineTransform) -> AffineTransform"""
+        self._dialog = dialog
+        self._build_transform = build_transform
+        self._label = ttk.Label(parent_frame)
+        self._label.pack(pady=(0, 10))
+
+    def schedule(self):
+        if self._after_id is None:
+            self._after_id = self._dialog.after(PREVIEW_DEBOUNCE_MS, self.update)
+
+    def update(self):
+        self._after_id = None
+        if not self._label.winfo_exists():
+            return  # Диалог уже закрыт
+        try:
+            transform = self._build_transform(AffineTransform(self._size))
+        except (ValueError, tk.TclError):
+            return  # Поле ввода временно некорректно
+        preview = transform.preview(self._proxy, PREVIEW_SIZE)
+        self._photo = ImageTk.PhotoImage(preview)
+        self._label.config(image=self._photo)
+
+
 class ResizeDialog:
     """Диалог изменения размера изображения"""
 
-    def __init__(self, parent, current_width, current_height):
+    def __init__(self, parent, current_width, current_height, image: Image.Image = None):
         self.result = None
         self.current_width = current_width
         self.current_height = current_height
+        self._preview = TransformPreview(image) if image is not None else None
         self._create_dialog(parent)
 
     def _create_dialog(self, parent):
         self.dialog = tk.Toplevel(parent)
         self.dialog.title("Изменить размер")
-        self.dialog.geometry("300x250")
+        self.dialog.geometry("360x500" if self._preview else "300x250")
         self.dialog.transient(parent)
         self.dialog.grab_set()
 
         input_frame = ttk.Frame(self.dialog, padding="10")
         input_frame.pack(fill=tk.BOTH, expand=True)
 
+        if self._preview:
+            self._preview.attach(self.dialog, input_frame, self._preview_transform)
+
         ttk.Label(input_frame, text="Текущий размер:").grid(row=0, column=0, sticky=tk.W, pady=5)
         ttk.Label(input_frame, text=f"{self.current_width} × {self.current_height}").grid(row=0, column=1, sticky=tk.W,
                                                                                           pady=5)
@@ -122,6 +174,11 @@ class ResizeDialog:
                                             variable=self.keep_aspect_var)
         keep_aspect_check.grid(row=3, column=0, columnspan=2, sticky=tk.W, pady=10)
 
+        if self._preview:
+            self.width_var.trace("w", lambda *args: self._preview.schedule())
+            self.height_var.trace("w", lambda *args: self._preview.schedule())
+            self._preview.update()
+
         button_frame = ttk.Frame(self.dialog, padding="10")
         button_frame.pack(fill=tk.X)
 
@@ -150,6 +207,13 @@ class ResizeDialog:
         except ValueError as e:
             messagebox.showerror("Ошибка", f"Некорректные данные: {e}")
 
+    def _preview_transform(self, transform: AffineTransform) -> AffineTransform:
+        width = int(self.width_var.get())
+        height = int(self.height_var.get())
+        if width <= 0 or height <= 0:
+            raise ValueError("Размеры должны быть положительными")
+        return transform.then_resize(width, height)
+
     def _on_cancel(self):
         self.dialog.destroy()
 
@@ -157,20 +221,43 @@ class ResizeDialog:
 class RotateDialog:
     """Диалог поворота изображения"""
 
-    def __init__(self, parent):
+    def __init__(self, parent, image: Image.Image = None, histogram: List[int] = None):
         self.result = None
+        self._preview = TransformPreview(image) if image is not None else None
         self._create_dialog(parent)
 
     def _create_dialog(self, parent):
         self.dialog = tk.Toplevel(parent)
         self.dialog.title("Повернуть изображение")
-        self.dialog.geometry("300x200")
+        self.dialog.geometry("360x560" if self._preview else "300x200")
         self.dialog.transient(parent)
         self.dialog.grab_set()
 
         input_frame = ttk.Frame(self.dialog, padding="20")
         input_frame.pack(fill=tk.BOTH, expand=True)
 
+        if self._preview:
+            self._preview.attach(self.dialog, input_frame, self._preview_transform)
+
+            # Произвольный угол с живым предпросмотром
+            angle_frame = ttk.Frame(input_frame)
+            angle_frame.pack(fill=tk.X, pady=(0, 10))
+            self.angle_var = tk.DoubleVar(value=0)
+            ttk.Scale(angle_frame, from_=-180, to=180, variable=self.angle_var,
+                      orient=tk.HORIZONTAL).pack(side=tk.LEFT, fill=tk.X, expand=True)
+            angle_label = ttk.Label(angle_frame, text="0°", width=6)
+            angle_label.pack(side=tk.LEFT, padx=5)
+            ttk.Button(angle_frame, text="Повернуть",
+                       command=lambda: self._set_angle(round(self.angle_var.get(), 1))
+                       ).pack(side=tk.LEFT)
+
+            def update_angle(*args):
+                angle_label.config(text=f"{self.angle_var.get():.1f}°")
+                self._preview.schedule()
+
+            self.angle_var.trace("w", update_angle)
+            self._preview.update()
+
         button_frame = ttk.Frame(input_frame)
         button_frame.pack(expand=True)
 
@@ -203,6 +290,9 @@ class RotateDialog:
         self.result = angle
         self.dialog.destroy()
 
+    def _preview_transform(self, transform: AffineTransform) -> AffineTransform:
+        return transform.then_rotate(self.angle_var.get())
+
     def _custom_angle(self):
         angle = simpledialog.askfloat("Поворот", "Введите угол поворота (градусы):",
                                       minvalue=-360, maxvalue=360)
@@ -215,22 +305,43 @@ class RotateDialog:
 
 
 class BrightnessContrastDialog:
-    """Диалог настройки яркости и контрастности"""
+    """Диалог настройки яркости и контрастности с живым предпросмотром.
 
-    def __init__(self, parent):
+    Предпросмотр строится на уменьшенной копии изображения, поэтому его
+    стоимость не зависит от размера документа. Таблицы (LUT) кэшируются по
+    значениям ползунков, а полноразмерное изображение обрабатывается один
+    раз - после "Применить".
+    """
+
+    def __init__(self, parent, image: Image.Image = None, histogram: List[int] = None):
         self.result = None
+        self._proxy = None
+        self._histogram = None
+        self._lut_cache = {}
+        self._preview_photo = None
+        self._preview_after = None
+        if image is not None:
+            self._proxy = make_proxy(image, PREVIEW_SIZE)
+            # Контраст зависит от средней яркости обрабатываемых пикселей:
+            # при выделении гистограмму передает модель, как и при применении
+            self._histogram = histogram if histogram is not None else image.histogram()
         self._create_dialog(parent)
 
     def _create_dialog(self, parent):
         self.dialog = tk.Toplevel(parent)
         self.dialog.title("Яркость и контрастность")
-        self.dialog.geometry("350x250")
+        self.dialog.geometry("360x520" if self._proxy is not None else "350x250")
         self.dialog.transient(parent)
         self.dialog.grab_set()
 
         input_frame = ttk.Frame(self.dialog, padding="20")
         input_frame.pack(fill=tk.BOTH, expand=True)
 
+        # Предпросмотр
+        if self._proxy is not None:
+            self.preview_label = ttk.Label(input_frame)
+            self.preview_label.pack(pady=(0, 10))
+
         # Яркость
         ttk.Label(input_frame, text="Яркость:").pack(anchor=tk.W)
         self.brightness_var = tk.IntVar(value=0)
@@ -256,9 +367,11 @@ class BrightnessContrastDialog:
         # Привязка обновления значений
         def update_brightness(*args):
             brightness_value.config(text=str(self.brightness_var.get()))
+            self._schedule_preview()
 
         def update_contrast(*args):
             contrast_value.config(text=str(self.contrast_var.get()))
+            self._schedule_preview()
 
         self.brightness_var.trace("w", update_brightness)
         self.contrast_var.trace("w", update_contrast)
@@ -271,6 +384,8 @@ class BrightnessContrastDialog:
         ttk.Button(button_frame, text="Отмена",
                    command=self._on_cancel).pack(side=tk.RIGHT)
 
+        self._update_preview()
+
         self.dialog.update_idletasks()
         x = parent.winfo_rootx() + (parent.winfo_width() // 2) - (self.dialog.winfo_width() // 2)
         y = parent.winfo_rooty() + (parent.winfo_height() // 2) - (self.dialog.winfo_height() // 2)
@@ -278,9 +393,43 @@ class BrightnessContrastDialog:
 
         self.dialog.wait_window(self.dialog)
 
+    def _values(self):
+        return self.brightness_var.get(), self.contrast_var.get()
+
+    def _schedule_preview(self):
+        """Отложить перерисовку: серия событий ползунка дает один кадр"""
+        if self._proxy is None or self._preview_after is not None:
+            return
+        self._preview_after = self.dialog.after(PREVIEW_DEBOUNCE_MS, self._update_preview)
+
+    def _lut(self, brightness: int, contrast: int):
+        """Таблицы для значений ползунков (кэшируются)"""
+        key = (brightness, contrast)
+        lut = self._lut_cache.get(key)
+        if lut is None:
+            lut = brightness_contrast_pipeline(brightness, contrast).compile(self._histogram)
+            self._lut_cache[key] = lut
+        return lut
+
+    def _update_preview(self):
+        self._preview_after = None
+        if self._proxy is None:
+            return
+        lut = self._lut(*self._values())
+        preview = self._proxy.point(lut_table(lut, self._proxy.mode))
+        self._preview_photo = ImageTk.PhotoImage(preview)
+        self.preview_label.config(image=self._preview_photo)
+
+    def _cancel_preview(self):
+        if self._preview_after is not None:
+            self.dialog.after_cancel(self._preview_after)
+            self._preview_after = None
+
     def _on_apply(self):
-        self.result = (self.brightness_var.get(), self.contrast_var.get())
+        self._cancel_preview()
+        self.result = self._values()
         self.dialog.destroy()
 
     def _on_cancel(self):
+        self._cancel_preview()
         self.dialog.destroy()
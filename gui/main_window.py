@@ -5,16 +5,27 @@ from PIL import ImageTk
 import os
 from gui.dialogs import NewImageDialog, ResizeDialog, RotateDialog, BrightnessContrastDialog
 from gui.canvas import CanvasWidget
+from core.pixel_store import copy_meter
 from tools.brush_tool import BrushTool
 from tools.eraser_tool import EraserTool
 from tools.fill_tool import FillTool
 from tools.pipette_tool import PipetteTool
 from tools.selection_tool import SelectionTool
+from tools.magic_wand_tool import MagicWandTool
 from tools.text_tool import TextTool
 from tools.line_tool import LineTool
 from tools.rectangle_tool import RectangleTool
 from tools.ellipse_tool import EllipseTool
-from utils.constants import DEFAULT_FG_COLOR
+from tools.polygon_tool import PolygonTool
+from tools.rounded_rect_tool import RoundedRectTool
+from utils.constants import (DEFAULT_FG_COLOR, FillMode, HistoryMode, PixelStorage,
+                             SelectionMode, StrokeMode, ToleranceMetric)
+
+# Подписи способов хранения пикселей в строке состояния (тайлы - по умолчанию)
+STORAGE_LABELS = {
+    PixelStorage.MEMORY: " (в памяти)",
+    PixelStorage.MAPPED: " (файл подкачки)",
+}
 
 
 class MainWindow:
@@ -61,6 +72,20 @@ class MainWindow:
                               accelerator="Ctrl+S")
         file_menu.add_command(label="Сохранить как...", command=self.save_image_as)
         file_menu.add_separator()
+
+        # Как хранить пиксели новых и открываемых документов
+        storage_menu = tk.Menu(file_menu, tearoff=0)
+        file_menu.add_cascade(label="Хранение пикселей", menu=storage_menu)
+        self.storage_var = tk.StringVar(value=PixelStorage.TILED.value)
+        storage_menu.add_radiobutton(label="Тайлы (копирование при записи)",
+                                     variable=self.storage_var,
+                                     value=PixelStorage.TILED.value)
+        storage_menu.add_radiobutton(label="В памяти", variable=self.storage_var,
+                                     value=PixelStorage.MEMORY.value)
+        storage_menu.add_radiobutton(label="Файл подкачки (для очень больших)",
+                                     variable=self.storage_var,
+                                     value=PixelStorage.MAPPED.value)
+        file_menu.add_separator()
         file_menu.add_command(label="Выход", command=self.root.quit)
 
         # Меню "Правка"
@@ -79,6 +104,22 @@ class MainWindow:
                               accelerator="Ctrl+V")
         edit_menu.add_command(label="Удалить", command=self.delete_selection,
                               accelerator="Del")
+        edit_menu.add_command(label="Снять выделение", command=self.deselect,
+                              accelerator="Ctrl+D")
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Память истории...", command=self.history_memory_dialog)
+
+        history_mode_menu = tk.Menu(edit_menu, tearoff=0)
+        edit_menu.add_cascade(label="Режим истории", menu=history_mode_menu)
+        self.history_mode_var = tk.StringVar(value=self.controller.history_mode.value)
+        history_mode_menu.add_radiobutton(label="Снимки изменений",
+                                          variable=self.history_mode_var,
+                                          value=HistoryMode.SNAPSHOT.value,
+                                          command=self._update_history_mode)
+        history_mode_menu.add_radiobutton(label="Журнал команд",
+                                          variable=self.history_mode_var,
+                                          value=HistoryMode.JOURNAL.value,
+                                          command=self._update_history_mode)
 
         # Меню "Изображение"
         image_menu = tk.Menu(menubar, tearoff=0)
@@ -96,10 +137,26 @@ class MainWindow:
                                 command=lambda: self.apply_filter("grayscale"))
         filter_menu.add_command(label="Яркость/Контрастность...",
                                 command=self.brightness_contrast_dialog)
+        filter_menu.add_separator()
+        filter_menu.add_command(label="Размытие по Гауссу...",
+                                command=lambda: self.radius_filter_dialog("gaussian_blur",
+                                                                          "Размытие по Гауссу"))
+        filter_menu.add_command(label="Размытие по рамке...",
+                                command=lambda: self.radius_filter_dialog("box_blur",
+                                                                          "Размытие по рамке"))
+        filter_menu.add_command(label="Нерезкая маска...",
+                                command=lambda: self.radius_filter_dialog("unsharp_mask",
+                                                                          "Нерезкая маска"))
+        filter_menu.add_command(label="Выделение краев",
+                                command=lambda: self.apply_filter("edge_detect"))
+        filter_menu.add_command(label="Тиснение",
+                                command=lambda: self.apply_filter("emboss"))
 
         # Меню "Справка"
         help_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Справка", menu=help_menu)
+        help_menu.add_command(label="Статистика отрисовки", command=self.show_render_stats)
+        help_menu.add_separator()
         help_menu.add_command(label="О программе", command=self.show_about)
 
         # Привязка горячих клавиш
@@ -110,6 +167,7 @@ class MainWindow:
         self.root.bind("<Control-c>", lambda e: self.copy_selection())
         self.root.bind("<Control-v>", lambda e: self.paste_selection())
         self.root.bind("<Delete>", lambda e: self.delete_selection())
+        self.root.bind("<Control-d>", lambda e: self.deselect())
 
     def _update_brush_size(self):
         """Обновить размер кисти и толщину линии"""
@@ -122,7 +180,7 @@ class MainWindow:
             self.tools["eraser"].set_size(size)
 
         # Обновляем толщину линии для геометрических примитивов
-        for tool_id in ["line", "rectangle", "ellipse"]:
+        for tool_id in ["line", "rectangle", "ellipse", "polygon", "rounded_rect"]:
             if tool_id in self.tools and self.tools[tool_id] and hasattr(self.tools[tool_id], 'set_line_width'):
                 self.tools[tool_id].set_line_width(size)
 
@@ -138,11 +196,14 @@ class MainWindow:
             ("Ластик", "🧽", "eraser"),
             ("Заливка", "🎨", "fill"),
             ("Выделение", "▢", "selection"),
+            ("Волшебная палочка", "🪄", "magic_wand"),
             ("Пипетка", "🔍", "pipette"),
             ("Текст", "T", "text"),
             ("Линия", "📏", "line"),
             ("Прямоугольник", "⬜", "rectangle"),
             ("Эллипс", "⭕", "ellipse"),
+            ("Многоугольник", "⬟", "polygon"),
+            ("Скругленный прямоугольник", "▭", "rounded_rect"),
         ]
 
         for text, icon, tool_id in tools:
@@ -171,6 +232,29 @@ class MainWindow:
         # Привязка события изменения
         self.brush_size_var.trace("w", lambda *args: self._update_brush_size())
 
+        # Параметры штриха кисти (в процентах)
+        tk.Label(toolbar_frame, text="Жесткость:").pack(side=tk.LEFT, padx=5)
+        self.brush_hardness_var = tk.IntVar(value=100)
+        tk.Spinbox(toolbar_frame, from_=0, to=100, increment=10,
+                   textvariable=self.brush_hardness_var, width=4,
+                   command=self._update_brush_tool).pack(side=tk.LEFT, padx=2)
+        self.brush_hardness_var.trace("w", lambda *args: self._update_brush_tool())
+
+        tk.Label(toolbar_frame, text="Непрозр.:").pack(side=tk.LEFT, padx=5)
+        self.brush_opacity_var = tk.IntVar(value=100)
+        tk.Spinbox(toolbar_frame, from_=1, to=100, increment=10,
+                   textvariable=self.brush_opacity_var, width=4,
+                   command=self._update_brush_tool).pack(side=tk.LEFT, padx=2)
+        self.brush_opacity_var.trace("w", lambda *args: self._update_brush_tool())
+
+        self.stroke_mode_var = tk.StringVar(value=StrokeMode.DIRECT.value)
+        for text, mode in [("Сразу", StrokeMode.DIRECT),
+                           ("Буфер", StrokeMode.MAX),
+                           ("Накопление", StrokeMode.ACCUMULATE)]:
+            tk.Radiobutton(toolbar_frame, text=text, value=mode.value,
+                           variable=self.stroke_mode_var,
+                           command=self._update_brush_tool).pack(side=tk.LEFT)
+
         # Разделитель
         tk.Label(toolbar_frame, text="|").pack(side=tk.LEFT, padx=5)
 
@@ -181,10 +265,128 @@ class MainWindow:
                                     command=self._update_fill_mode)
         fill_check.pack(side=tk.LEFT, padx=5)
 
+        # Параметры фигур: сглаживание, число сторон многоугольника, радиус углов
+        self.shape_antialias_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(toolbar_frame, text="Сглаж. фигур",
+                       variable=self.shape_antialias_var,
+                       command=self._update_shape_tools).pack(side=tk.LEFT, padx=2)
+
+        tk.Label(toolbar_frame, text="Стороны:").pack(side=tk.LEFT, padx=5)
+        self.polygon_sides_var = tk.IntVar(value=6)
+        tk.Spinbox(toolbar_frame, from_=3, to=24, textvariable=self.polygon_sides_var,
+                   width=3, command=self._update_shape_tools).pack(side=tk.LEFT, padx=2)
+        self.polygon_sides_var.trace("w", lambda *args: self._update_shape_tools())
+
+        tk.Label(toolbar_frame, text="Радиус:").pack(side=tk.LEFT, padx=5)
+        self.corner_radius_var = tk.IntVar(value=10)
+        tk.Spinbox(toolbar_frame, from_=0, to=200, textvariable=self.corner_radius_var,
+                   width=4, command=self._update_shape_tools).pack(side=tk.LEFT, padx=2)
+        self.corner_radius_var.trace("w", lambda *args: self._update_shape_tools())
+
+        # Разделитель
+        tk.Label(toolbar_frame, text="|").pack(side=tk.LEFT, padx=5)
+
+        # Параметры инструмента Заливка
+        tk.Label(toolbar_frame, text="Допуск:").pack(side=tk.LEFT, padx=5)
+        self.fill_tolerance_var = tk.IntVar(value=0)
+        tolerance_spin = tk.Spinbox(toolbar_frame, from_=0, to=255,
+                                    textvariable=self.fill_tolerance_var,
+                                    width=4,
+                                    command=self._update_fill_tool)
+        tolerance_spin.pack(side=tk.LEFT, padx=2)
+        self.fill_tolerance_var.trace("w", lambda *args: self._update_fill_tool())
+
+        self.fill_metric_var = tk.StringVar(value=ToleranceMetric.CHANNEL.value)
+        for text, metric in [("RGBA", ToleranceMetric.CHANNEL),
+                             ("Евклид", ToleranceMetric.EUCLIDEAN)]:
+            tk.Radiobutton(toolbar_frame, text=text, value=metric.value,
+                           variable=self.fill_metric_var,
+                           command=self._update_fill_tool).pack(side=tk.LEFT)
+
+        self.fill_global_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(toolbar_frame, text="Везде",
+                       variable=self.fill_global_var,
+                       command=self._update_fill_tool).pack(side=tk.LEFT, padx=2)
+
+        self.fill_antialias_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(toolbar_frame, text="Сглаживание",
+                       variable=self.fill_antialias_var,
+                       command=self._update_fill_tool).pack(side=tk.LEFT, padx=2)
+
+        # Режим выделения (Shift/Ctrl при щелчке меняют его временно)
+        tk.Label(toolbar_frame, text="|").pack(side=tk.LEFT, padx=5)
+        self.selection_mode_var = tk.StringVar(value=SelectionMode.REPLACE.value)
+        for text, mode in [("Новое", SelectionMode.REPLACE),
+                           ("+", SelectionMode.ADD),
+                           ("−", SelectionMode.SUBTRACT),
+                           ("∩", SelectionMode.INTERSECT)]:
+            tk.Radiobutton(toolbar_frame, text=text, value=mode.value,
+                           variable=self.selection_mode_var,
+                           command=self._update_selection_mode).pack(side=tk.LEFT)
+
+    def _update_brush_tool(self):
+        """Обновить жесткость, непрозрачность и режим штриха кисти и ластика"""
+        try:
+            hardness = self.brush_hardness_var.get() / 100.0
+            opacity = self.brush_opacity_var.get() / 100.0
+        except tk.TclError:
+            return  # Поле временно пустое при вводе
+
+        for tool_id in ["brush", "eraser"]:
+            tool = self.tools.get(tool_id)
+            if tool:
+                tool.set_hardness(hardness)
+                tool.set_opacity(opacity)
+
+        if self.tools.get("brush"):
+            self.tools["brush"].set_stroke_mode(StrokeMode(self.stroke_mode_var.get()))
+
+    def _update_shape_tools(self):
+        """Обновить сглаживание фигур и параметры многоугольника и скругленного прямоугольника"""
+        if not self.tools.get("rounded_rect"):
+            return
+        try:
+            sides = self.polygon_sides_var.get()
+            radius = self.corner_radius_var.get()
+        except tk.TclError:
+            return  # Поле временно пустое при вводе
+
+        for tool_id in ["line", "rectangle", "ellipse", "polygon", "rounded_rect"]:
+            self.tools[tool_id].set_antialias(self.shape_antialias_var.get())
+        self.tools["polygon"].set_sides(sides)
+        self.tools["rounded_rect"].set_radius(radius)
+
+    def _update_fill_tool(self):
+        """Обновить параметры инструментов Заливка и Волшебная палочка"""
+        fill_tool = self.tools.get("fill")
+        if not fill_tool:
+            return
+        try:
+            tolerance = self.fill_tolerance_var.get()
+        except tk.TclError:
+            return  # Поле допуска временно пустое при вводе
+        metric = ToleranceMetric(self.fill_metric_var.get())
+        mode = FillMode.GLOBAL if self.fill_global_var.get() else FillMode.CONTIGUOUS
+        fill_tool.set_tolerance(tolerance, metric)
+        fill_tool.set_mode(mode)
+        fill_tool.set_antialias(self.fill_antialias_var.get())
+
+        wand_tool = self.tools.get("magic_wand")
+        if wand_tool:
+            wand_tool.set_tolerance(tolerance, metric)
+            wand_tool.set_fill_mode(mode)
+
+    def _update_selection_mode(self):
+        """Режим совмещения нового выделения с текущим"""
+        mode = SelectionMode(self.selection_mode_var.get())
+        for tool_id in ["selection", "magic_wand"]:
+            if self.tools.get(tool_id):
+                self.tools[tool_id].set_mode(mode)
+
     def _update_fill_mode(self):
         """Обновить режим заливки для инструментов"""
         fill = self.fill_var.get()
-        for tool_id in ["rectangle", "ellipse"]:
+        for tool_id in ["rectangle", "ellipse", "polygon", "rounded_rect"]:
             if tool_id in self.tools and self.tools[tool_id]:
                 self.tools[tool_id].fill = fill
 
@@ -241,6 +443,16 @@ class MainWindow:
         self.tool_label = tk.Label(self.statusbar, text="Инструмент: Кисть")
         self.tool_label.pack(side=tk.LEFT, padx=20)
 
+        # Ход фоновой операции и кнопка отмены (видны, пока она выполняется)
+        self.job_frame = tk.Frame(self.statusbar)
+        self.job_label = tk.Label(self.job_frame, text="")
+        self.job_label.pack(side=tk.LEFT, padx=5)
+        self.job_progress = ttk.Progressbar(self.job_frame, length=160, maximum=1.0,
+                                            mode="indeterminate")
+        self.job_progress.pack(side=tk.LEFT, padx=5)
+        self.job_cancel = tk.Button(self.job_frame, text="Отмена", padx=4, pady=0)
+        self.job_cancel.pack(side=tk.LEFT, padx=5)
+
         # Индикатор координат
         self.coords_label = tk.Label(self.statusbar, text="x: 0, y: 0")
         self.coords_label.pack(side=tk.RIGHT, padx=10)
@@ -292,16 +504,19 @@ class MainWindow:
         brush_tool.set_color(self.current_color)
         brush_tool.set_size(self.brush_size_var.get())
         self.tools["brush"] = brush_tool
+        self._update_brush_tool()
 
         # Ластик
         eraser_tool = EraserTool()
         eraser_tool.set_size(self.brush_size_var.get())
         self.tools["eraser"] = eraser_tool
+        self._update_brush_tool()
 
         # Заливка
         fill_tool = FillTool()
         fill_tool.set_color(self.current_color)
         self.tools["fill"] = fill_tool
+        self._update_fill_tool()
 
         # Пипетка
         pipette_tool = PipetteTool()
@@ -311,6 +526,10 @@ class MainWindow:
         selection_tool = SelectionTool()
         self.tools["selection"] = selection_tool
 
+        # Волшебная палочка
+        self.tools["magic_wand"] = MagicWandTool()
+        self._update_fill_tool()
+
         # Текст
         text_tool = TextTool()
         text_tool.set_color(self.current_color)
@@ -339,14 +558,28 @@ class MainWindow:
         ellipse_tool.fill = self.fill_var.get()
         self.tools["ellipse"] = ellipse_tool
 
+        # Многоугольник
+        polygon_tool = PolygonTool()
+        polygon_tool.set_color(self.current_color)
+        polygon_tool.set_fill_color(self.current_color)
+        polygon_tool.set_line_width(self.brush_size_var.get())
+        polygon_tool.fill = self.fill_var.get()
+        self.tools["polygon"] = polygon_tool
+
+        # Скругленный прямоугольник
+        rounded_rect_tool = RoundedRectTool()
+        rounded_rect_tool.set_color(self.current_color)
+        rounded_rect_tool.set_fill_color(self.current_color)
+        rounded_rect_tool.set_line_width(self.brush_size_var.get())
+        rounded_rect_tool.fill = self.fill_var.get()
+        self.tools["rounded_rect"] = rounded_rect_tool
+        self._update_shape_tools()
+
     def select_tool(self, tool_id: str):
         """Выбрать инструмент"""
         if tool_id in self.tools and self.tools[tool_id] is not None:
-            # Очищаем выделение при смене инструмента (кроме самого инструмента выделения)
-            if tool_id != "selection" and self.tools["selection"]:
-                self.tools["selection"].clear_selection(self.canvas)
-                self.model.set_selection(None)
-
+            # Выделение сохраняется при смене инструмента: заливки и фильтры
+            # работают только внутри него
             self.current_tool = tool_id
             self.canvas.set_tool(self.tools[tool_id])
             self.tool_label.config(text=f"Инструмент: {self.tools[tool_id].name}")
@@ -374,7 +607,7 @@ class MainWindow:
                 tool.set_color(color)
 
         # Для инструментов с заливкой
-        for tool_id in ["rectangle", "ellipse"]:
+        for tool_id in ["rectangle", "ellipse", "polygon", "rounded_rect"]:
             if tool_id in self.tools and self.tools[tool_id] and hasattr(self.tools[tool_id], 'set_fill_color'):
                 self.tools[tool_id].set_fill_color(color)
 
@@ -404,6 +637,12 @@ class MainWindow:
         if self.tools["ellipse"]:
             self.tools["ellipse"].set_line_width(size)
 
+        if self.tools["polygon"]:
+            self.tools["polygon"].set_line_width(size)
+
+        if self.tools["rounded_rect"]:
+            self.tools["rounded_rect"].set_line_width(size)
+
     def _update_coords(self, event):
         """Обновить координаты в строке состояния"""
         x = self.canvas.canvasx(event.x)
@@ -452,6 +691,14 @@ class MainWindow:
             if self.tools["selection"]:
                 self.tools["selection"].clear_selection(self.canvas)
 
+    def deselect(self):
+        """Снять выделение (фильтры и заливки снова действуют на все изображение)"""
+        if self.model.selection:
+            self.model.set_selection(None)
+            if self.tools["selection"]:
+                self.tools["selection"].clear_selection(self.canvas)
+            self.update_image()
+
     def update_image(self):
         """Обновить изображение на холсте"""
         self.canvas.update_image()
@@ -459,8 +706,10 @@ class MainWindow:
 
     def update_status(self):
         """Обновить строку состояния"""
+        storage = STORAGE_LABELS.get(self.model.storage, "")
         self.image_size_label.config(
-            text=f"Размер: {self.model.width}x{self.model.height}"
+            text=f"Размер: {self.model.width}x{self.model.height}, "
+                 f"{self.model.pixel_format}{storage}"
         )
 
         filename = "Новое изображение"
@@ -473,12 +722,44 @@ class MainWindow:
 
         self.status_label.config(text=status_text)
 
+    def begin_job(self, job):
+        """Показать ход фоновой операции; остальной ввод окна заблокирован"""
+        self.job_label.config(text=f"{job.title}...")
+        self.job_progress.config(mode="indeterminate", value=0)
+        self.job_progress.start(20)
+        self.job_cancel.config(command=job.cancel)
+        self.job_frame.pack(side=tk.LEFT, padx=10)
+        # Пока операция идет, события получает только строка хода:
+        # документ, меню и инструменты не меняют его под фоновой задачей
+        self.root.config(cursor="watch")
+        self.job_frame.update_idletasks()
+        try:
+            self.job_frame.grab_set()
+        except tk.TclError:
+            pass
+
+    def show_progress(self, fraction: float, text=None):
+        """Обновить ход фоновой операции (доля 0..1)"""
+        if str(self.job_progress.cget("mode")) != "determinate":
+            self.job_progress.stop()
+            self.job_progress.config(mode="determinate")
+        self.job_progress.config(value=fraction)
+        if text:
+            self.job_label.config(text=text)
+
+    def end_job(self):
+        """Убрать ход фоновой операции и вернуть ввод"""
+        self.job_progress.stop()
+        self.job_frame.grab_release()
+        self.job_frame.pack_forget()
+        self.root.config(cursor="")
+
     def create_new_image(self):
         """Создать новое изображение"""
         dialog = NewImageDialog(self.root)
         if dialog.result:
             width, height, bg_color = dialog.result
-            self.model.create_new(width, height, bg_color)
+            self.model.create_new(width, height, bg_color, self._selected_storage())
             self.update_image()
             self.controller.history.clear()  # Очищаем историю
             self.controller.save_state()  # Сохраняем начальное состояние
@@ -498,26 +779,26 @@ class MainWindow:
         )
 
         if filename:
-            try:
-                self.model.load_image(filename)
-                self.update_image()
+            storage = self._selected_storage()
+
+            def opened():
                 self.status_label.config(text=f"Открыт файл: {os.path.basename(filename)}")
                 self.controller.history.clear()  # Очищаем историю
                 self.controller.save_state()  # Сохраняем начальное состояние
-            except Exception as e:
+
+            def failed(e):
                 messagebox.showerror("Ошибка", f"Не удалось открыть файл:\n{e}")
 
+            # Файл читается в фоне; документ заменяется, только когда он прочитан
+            self.controller.run_job("Открытие", lambda model: model.load_image(filename, storage),
+                                    snapshot=False, on_done=opened, on_error=failed)
+
     def save_image(self):
         """Сохранить изображение"""
         if self.model.filepath:
-            try:
-                ext = os.path.splitext(self.model.filepath)[1].lower()
-                format = "PNG" if ext == ".png" else "JPEG" if ext in [".jpg", ".jpeg"] else "PNG"
-
-                self.model.save_image(self.model.filepath, format)
-                self.update_status()
-            except Exception as e:
-                messagebox.showerror("Ошибка", f"Не удалось сохранить файл:\n{e}")
+            ext = os.path.splitext(self.model.filepath)[1].lower()
+            format = "PNG" if ext == ".png" else "JPEG" if ext in [".jpg", ".jpeg"] else "PNG"
+            self._save_to(self.model.filepath, format)
         else:
             self.save_image_as()
 
@@ -536,37 +817,34 @@ class MainWindow:
         )
 
         if filename:
-            try:
-                format = "PNG" if filename.lower().endswith('.png') else "JPEG"
-                self.model.save_image(filename, format)
-                self.update_status()
-                self.status_label.config(text=f"Сохранено: {os.path.basename(filename)}")
-            except Exception as e:
-                messagebox.showerror("Ошибка", f"Не удалось сохранить файл:\n{e}")
+            format = "PNG" if filename.lower().endswith('.png') else "JPEG"
+            self._save_to(filename, format)
+
+    def _save_to(self, filename: str, format: str):
+        """Сохранить документ в фоне (пиксели только читаются, снимок не нужен)"""
+        def saved():
+            self.status_label.config(text=f"Сохранено: {os.path.basename(filename)}")
+
+        def failed(e):
+            messagebox.showerror("Ошибка", f"Не удалось сохранить файл:\n{e}")
+
+        self.controller.run_job("Сохранение", lambda model: model.save_image(filename, format),
+                                snapshot=False, on_done=saved, on_error=failed)
 
     def resize_image(self):
         """Изменить размер изображения"""
-        dialog = ResizeDialog(self.root, self.model.width, self.model.height)
+        dialog = ResizeDialog(self.root, self.model.width, self.model.height, self.model.image)
         if dialog.result:
             new_width, new_height = dialog.result
-            try:
-                self.controller.save_state()  # Сохраняем состояние
-                self.model.resize(new_width, new_height)
-                self.update_image()
-            except Exception as e:
-                messagebox.showerror("Ошибка", str(e))
+            self.controller.run_job("Изменение размера",
+                                    lambda model: model.resize(new_width, new_height))
 
     def rotate_image(self):
         """Повернуть изображение"""
-        dialog = RotateDialog(self.root)
+        dialog = RotateDialog(self.root, self.model.image)
         if dialog.result:
             angle = dialog.result
-            try:
-                self.controller.save_state()  # Сохраняем состояние
-                self.model.rotate(angle)
-                self.update_image()
-            except Exception as e:
-                messagebox.showerror("Ошибка", str(e))
+            self.controller.run_job("Поворот", lambda model: model.rotate(angle))
 
     def crop_image(self):
         """Обрезать изображение"""
@@ -577,29 +855,64 @@ class MainWindow:
         else:
             messagebox.showwarning("Внимание", "Сначала выделите область для обрезки")
 
-    def apply_filter(self, filter_type):
-        """Применить фильтр"""
-        try:
-            self.controller.save_state()  # Сохраняем состояние
-            self.model.apply_filter(filter_type)
-            self.update_image()
-        except Exception as e:
-            messagebox.showerror("Ошибка", str(e))
+    def apply_filter(self, filter_type, **kwargs):
+        """Применить фильтр (в фоне, с ходом по полосам и отменой)"""
+        self.controller.run_job("Фильтр",
+                                lambda model: model.apply_filter(filter_type, **kwargs))
+
+    def radius_filter_dialog(self, filter_type, title):
+        """Запросить радиус и применить фильтр с окрестностью"""
+        radius = simpledialog.askinteger(title, "Радиус (пиксели):",
+                                         initialvalue=2, minvalue=1, maxvalue=250,
+                                         parent=self.root)
+        if radius:
+            self.apply_filter(filter_type, radius=radius)
 
     def brightness_contrast_dialog(self):
         """Диалог яркости/контрастности"""
-        dialog = BrightnessContrastDialog(self.root)
+        dialog = BrightnessContrastDialog(self.root, self.model.image,
+                                          self.model.histogram())
         if dialog.result:
             brightness, contrast = dialog.result
+            self.apply_filter("brightness_contrast", brightness=brightness, contrast=contrast)
+
+    def _selected_storage(self) -> PixelStorage:
+        """Способ хранения из меню"""
+        return PixelStorage(self.storage_var.get())
+
+    def _update_history_mode(self):
+        """Переключить режим истории"""
+        mode = HistoryMode(self.history_mode_var.get())
+        self.controller.set_history_mode(mode)
+        self.status_label.config(text="Режим истории изменен, история очищена")
+
+    def history_memory_dialog(self):
+        """Диалог бюджета памяти истории"""
+        history = self.controller.history
+        current_mb = (history.memory_limit or 0) // (1024 * 1024)
+        used_mb = history.memory_usage() / (1024 * 1024)
+
+        limit_mb = simpledialog.askinteger(
+            "Память истории",
+            f"Сейчас занято: {used_mb:.1f} МБ\n"
+            f"Лимит памяти для Undo/Redo (МБ):",
+            initialvalue=current_mb or None,
+            minvalue=16,
+            parent=self.root
+        )
+        if limit_mb:
             try:
-                self.controller.save_state()  # Сохраняем состояние
-                self.model.apply_filter("brightness_contrast",
-                                        brightness=brightness,
-                                        contrast=contrast)
-                self.update_image()
+                history.set_memory_limit(limit_mb * 1024 * 1024)
+                self.status_label.config(text=f"Лимит памяти истории: {limit_mb} МБ")
             except Exception as e:
                 messagebox.showerror("Ошибка", str(e))
 
+    def show_render_stats(self):
+        """Показать статистику планировщика отрисовки"""
+        messagebox.showinfo("Статистика отрисовки",
+                            self.canvas.render_scheduler.summary() + "\n\n" +
+                            copy_meter.summary())
+
     def show_about(self):
         """Показать информацию о программе"""
         messagebox.showinfo(
@@ -610,8 +923,10 @@ class MainWindow:
             "Специальность: Информационная безопасность автоматизированных систем\n\n"
             "Реализованы все базовые функции редактора:\n"
             "- Открытие/сохранение PNG, JPEG, BMP\n"
-            "- Инструменты: Кисть, Ластик, Заливка, Пипетка, Выделение, Текст\n"
-            "- Геометрические примитивы: Линия, Прямоугольник, Эллипс\n"
+            "- Инструменты: Кисть, Ластик, Заливка, Пипетка, Выделение,\n"
+            "  Волшебная палочка, Текст\n"
+            "- Геометрические примитивы: Линия, Прямоугольник, Эллипс, Многоугольник,\n"
+            "  Скругленный прямоугольник\n"
             "- Операции: Изменение размера, Поворот, Обрезка\n"
             "- Фильтры: Инверсия, Оттенки серого, Яркость/Контрастность\n"
             "- Система Undo/Redo (до 50 действий)\n"
@@ -1,9 +1,15 @@
 18.	# main.py
 import tkinter as tk
 from tkinter import messagebox
+from typing import Callable, Optional
 from core.image_model import ImageModel
 from core.history_manager import HistoryManager
+from core.jobs import Job, JobRunner
+from core.command_journal import CommandHistory, DrawCommand
+from core.pixel_store import copy_meter
+from core.tiles import EMPTY_BOX
 from gui.main_window import MainWindow
+from utils.constants import DEFAULT_HISTORY_MEMORY_MB, JOURNAL_KEYFRAME_INTERVAL, HistoryMode
 
 
 class ImageEditorApp:
@@ -17,7 +23,12 @@ class ImageEditorApp:
 
             # Инициализация модели
             self.model = ImageModel()
-            self.history = HistoryManager(max_history=50)
+            self.history_mode = HistoryMode.SNAPSHOT
+            self.history = self._create_history(self.history_mode)
+            # Поколение модели на момент последнего обращения к истории
+            self._history_generation = self.model.generation
+            # Долгие операции над документом выполняются в фоне по одной
+            self.jobs = JobRunner(self.root.after)
 
             # Инициализация представления
             self.view = MainWindow(self.root, self)
@@ -62,20 +73,117 @@ class ImageEditorApp:
         self.redo()
         return "break"  # Предотвращаем дальнейшую обработку
 
+    def _create_history(self, mode: HistoryMode, memory_limit: int = None):
+        """Создать менеджер истории для выбранного режима"""
+        if memory_limit is None:
+            memory_limit = DEFAULT_HISTORY_MEMORY_MB * 1024 * 1024
+
+        if mode == HistoryMode.JOURNAL:
+            return CommandHistory(max_history=50,
+                                  keyframe_interval=JOURNAL_KEYFRAME_INTERVAL,
+                                  memory_limit=memory_limit)
+        return HistoryManager(max_history=50, memory_limit=memory_limit)
+
+    def set_history_mode(self, mode: HistoryMode):
+        """Переключить режим истории (история начинается заново)"""
+        if mode == self.history_mode:
+            return
+
+        memory_limit = self.history.memory_limit
+        self.history.clear()
+        self.history_mode = mode
+        self.history = self._create_history(mode, memory_limit)
+        self.save_state()
+
+    def record_command(self, command: DrawCommand):
+        """Записать выполненную команду рисования в журнал истории"""
+        if self.history_mode == HistoryMode.JOURNAL:
+            self.history.push_command(command, self.model.image)
+            self._history_generation = self.model.generation
+
+    def _history_dirty_box(self):
+        """Область, измененная с последнего обращения к истории"""
+        return self.model.changes_since(self._history_generation) or EMPTY_BOX
+
     def save_state(self):
         """Сохранить текущее состояние в историю"""
-        # Сохраняем копию текущего изображения
+        # История сама копирует только изменившиеся тайлы
         if self.model.image:
-            self.history.push_state(self.model.image.copy())
+            self.history.push_state(self.model.image, self._history_dirty_box())
+            self._history_generation = self.model.generation
+            # Копирование при записи в прошлом действии и снимок для истории
+            copy_meter.end_action()
+
+    def run_job(self, title: str, operation: Callable[[ImageModel], None],
+                snapshot: bool = True, on_done: Optional[Callable[[], None]] = None,
+                on_error: Optional[Callable[[Exception], None]] = None) -> Optional[Job]:
+        """Выполнить долгую операцию над документом в фоновой задаче.
+
+        operation(модель) получает копию модели (ImageModel.fork) и
+        выполняется в пуле потоков; окно тем временем отвечает, строка
+        состояния показывает ход и кнопку отмены. Готовый результат
+        переносится в модель (ImageModel.commit) в потоке интерфейса, после
+        чего вызывается on_done. Операция, меняющая документ (snapshot=True),
+        записывается в историю только при переносе результата: непосредственно
+        перед ним сохраняется состояние до операции. Задачи со snapshot=False
+        (сохранение, загрузка) и отмененные задачи историю не трогают, поэтому
+        стек redo у них сохраняется. Одновременно выполняется одна задача.
+        """
+        if self.jobs.busy:
+            self.view.status_label.config(text="Дождитесь окончания текущей операции")
+            return None
+
+        # Снимок берется здесь, в потоке интерфейса: в пуле модель могла бы
+        # меняться, пока копируются тайлы
+        fork = self.model.fork(snapshot)
+
+        def work(context):
+            fork.progress = context.progress
+            operation(fork)
+            context.check()
+            return fork
+
+        def done(fork):
+            self.view.end_job()
+            if not self.model.is_current(fork):
+                self.view.status_label.config(text="Документ изменился, результат отброшен")
+                return
+            if snapshot:
+                # Документ не менялся с начала задачи: это состояние до операции
+                self.save_state()
+            self.model.commit(fork)
+            self.view.update_image()
+            if on_done is not None:
+                on_done()
+
+        def failed(error):
+            self.view.end_job()
+            if on_error is not None:
+                on_error(error)
+            else:
+                messagebox.showerror("Ошибка", str(error))
+
+        def cancelled():
+            self.view.end_job()
+            self.view.status_label.config(text=f"{title}: отменено")
+
+        job = Job(title, work, on_done=done, on_error=failed, on_cancel=cancelled,
+                  on_progress=self.view.show_progress)
+        self.view.begin_job(job)
+        return self.jobs.submit(job)
 
     def undo(self):
         """Отменить последнее действие"""
+        if self.jobs.busy:
+            return
         if self.history.can_undo():
             # Получаем предыдущее состояние
-            previous_state = self.history.undo(self.model.image.copy())
+            previous_state = self.history.undo(self.model.image, self._history_dirty_box())
 
             # Восстанавливаем состояние
-            self.model._image = previous_state
+            self.model.set_image(previous_state, self.history.last_changed_box)
+            self._history_generation = self.model.generation
+            copy_meter.end_action()
             self.model.modified = True
             self.model.set_selection(None)  # Очищаем выделение
 
@@ -85,12 +193,16 @@ class ImageEditorApp:
 
     def redo(self):
         """Вернуть отмененное действие"""
+        if self.jobs.busy:
+            return
         if self.history.can_redo():
             # Получаем следующее состояние
-            next_state = self.history.redo(self.model.image.copy())
+            next_state = self.history.redo(self.model.image, self._history_dirty_box())
 
             # Восстанавливаем состояние
-            self.model._image = next_state
+            self.model.set_image(next_state, self.history.last_changed_box)
+            self._history_generation = self.model.generation
+            copy_meter.end_action()
             self.model.modified = True
             self.model.set_selection(None)  # Очищаем выделение
 
@@ -100,6 +212,14 @@ class ImageEditorApp:
 
     def on_closing(self):
         """Обработчик закрытия окна"""
+        if self.jobs.busy:
+            if not messagebox.askyesno("Выход", "Операция еще выполняется. Прервать ее?"):
+                return
+            self.jobs.cancel_all()
+            # Вернемся к закрытию, когда задача остановится
+            self._after_jobs(self.on_closing)
+            return
+
         if self.model.modified:
             response = messagebox.askyesnocancel(
                 "Сохранение",
@@ -110,9 +230,27 @@ class ImageEditorApp:
                 return
             elif response:
                 self.view.save_image()
+                if self.jobs.busy:
+                    # Окно закроется, когда сохранение закончится
+                    self._after_jobs(self._close_if_saved)
+                    return
 
+        self.jobs.shutdown()
         self.root.destroy()
 
+    def _after_jobs(self, callback: Callable[[], None]):
+        """Вызвать callback, когда фоновых задач не останется"""
+        if self.jobs.busy:
+            self.root.after(100, lambda: self._after_jobs(callback))
+        else:
+            callback()
+
+    def _close_if_saved(self):
+        # Если сохранение не удалось, окно остается открытым
+        if not self.model.modified:
+            self.jobs.shutdown()
+            self.root.destroy()
+
     def run(self):
         """Запустить приложение"""
         self.root.mainloop()
@@ -0,0 +1,23 @@
+# tests/test_convolution.py
+import numpy as np
+import pytest
+from PIL import Image
+from core.convolution import edge_detect, emboss
+from core.tiled_executor import TiledExecutor
+
+
+def _step(alpha: int) -> Image.Image:
+    image = Image.new("RGBA", (40, 40), (60, 60, 60, alpha))
+    image.paste((90, 90, 90, alpha), (20, 0, 40, 40))
+    return image
+
+
+@pytest.mark.parametrize("operation", [edge_detect, emboss])
+def test_uniform_alpha_does_not_change_color(operation):
+    """Цвет результата не зависит от прозрачности, одинаковой по всей картинке"""
+    executor = TiledExecutor(max_workers=2, strip_height=8, min_pixels=0)
+    opaque = np.asarray(operation(_step(255), executor)).astype(int)
+    half = np.asarray(operation(_step(128), executor)).astype(int)
+    inner = (slice(1, -1), slice(1, -1), slice(0, 3))
+    assert np.abs(opaque[inner] - half[inner]).max() <= 2
+    assert (half[..., 3] == 128).all()
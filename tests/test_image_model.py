@@ -0,0 +1,25 @@
+# tests/test_image_model.py
+from PIL import Image
+from core.image_model import ImageModel
+from core.point_ops import brightness_contrast_pipeline
+
+
+def test_histogram_counts_only_selection():
+    model = ImageModel(100, 100)
+    model.draw_pixel(20, 20, (0, 0, 0, 255), 9)
+    model.set_selection((10, 10, 30, 30))
+    selected = model.image.crop((10, 10, 30, 30))
+    assert model.histogram() == selected.histogram()
+    assert model.histogram() != model.image.histogram()
+
+
+def test_preview_pivot_matches_apply():
+    """Предпросмотр и применение считают контраст по одной гистограмме"""
+    model = ImageModel(100, 100)
+    model.draw_pixel(20, 20, (0, 0, 0, 255), 15)
+    model.set_selection((10, 10, 30, 30))
+    before = model.image.copy()
+    lut = brightness_contrast_pipeline(0, 60).compile(model.histogram())
+    model.apply_filter("brightness_contrast", brightness=0, contrast=60)
+    expected = [int(v) for v in lut[0][[before.getpixel((x, 20))[0] for x in range(10, 30)]]]
+    assert [model.get_pixel_color(x, 20)[0] for x in range(10, 30)] == expected
@@ -0,0 +1,160 @@
+# tests/test_jobs.py
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+import pytest
+from core.image_model import ImageModel
+from core.jobs import Job, JobRunner
+from utils.constants import HistoryMode
+from main import ImageEditorApp
+
+
+class _Label:
+    def config(self, **kwargs):
+        self.options = kwargs
+
+
+class _View:
+    """Окно без Tk: контроллеру нужны только строка состояния и ход задачи"""
+
+    def __init__(self):
+        self.status_label = _Label()
+
+    def begin_job(self, job):
+        pass
+
+    def end_job(self):
+        pass
+
+    def show_progress(self, fraction, text=None):
+        pass
+
+    def update_image(self):
+        pass
+
+
+class _Scheduler:
+    """Замена root.after: колбэки выполняются в run()"""
+
+    def __init__(self):
+        self.pending = []
+
+    def __call__(self, ms, callback):
+        self.pending.append(callback)
+
+    def run(self, runner: JobRunner, timeout: float = 30):
+        start = time.time()
+        while (runner.busy or self.pending) and time.time() - start < timeout:
+            while self.pending:
+                self.pending.pop(0)()
+            time.sleep(0.005)
+
+
+def _app(mode: HistoryMode):
+    app = ImageEditorApp.__new__(ImageEditorApp)
+    app.model = ImageModel(400, 300)
+    app.history_mode = mode
+    app.history = app._create_history(mode)
+    app._history_generation = app.model.generation
+    app.scheduler = _Scheduler()
+    app.jobs = JobRunner(app.scheduler)
+    app.view = _View()
+    app.save_state()
+    return app
+
+
+def _pixels(app):
+    return np.asarray(app.model.image.to_image()).copy()
+
+
+def _run(app, operation, **kwargs):
+    job = app.run_job("test", operation, **kwargs)
+    app.scheduler.run(app.jobs)
+    return job
+
+
+@pytest.mark.parametrize("mode", list(HistoryMode))
+def test_job_result_is_undoable(mode):
+    app = _app(mode)
+    _run(app, lambda model: model.draw_pixel(10, 10, (255, 0, 0, 255), 9))
+    before = _pixels(app)
+    _run(app, lambda model: model.apply_filter("invert"))
+    after = _pixels(app)
+    assert not np.array_equal(before, after)
+
+    app.undo()
+    assert np.array_equal(_pixels(app), before)
+    app.redo()
+    assert np.array_equal(_pixels(app), after)
+
+
+@pytest.mark.parametrize("mode", list(HistoryMode))
+def test_save_job_keeps_redo(mode):
+    app = _app(mode)
+    _run(app, lambda model: model.draw_pixel(10, 10, (255, 0, 0, 255), 9))
+    _run(app, lambda model: model.apply_filter("invert"))
+    app.undo()
+    assert app.history.can_redo()
+
+    path = os.path.join(tempfile.mkdtemp(), "saved.png")
+    _run(app, lambda model: model.save_image(path), snapshot=False)
+    assert os.path.exists(path) and not app.model.modified
+    assert app.history.can_redo()
+
+
+@pytest.mark.parametrize("mode", list(HistoryMode))
+def test_cancelled_job_leaves_history(mode):
+    app = _app(mode)
+    _run(app, lambda model: model.draw_pixel(10, 10, (255, 0, 0, 255), 9))
+    _run(app, lambda model: model.apply_filter("invert"))
+    app.undo()
+    before = _pixels(app)
+    can_undo = app.history.can_undo()
+
+    job = app.run_job("test", lambda model: model.apply_filter("invert"))
+    job.cancel()
+    app.scheduler.run(app.jobs)
+    assert np.array_equal(_pixels(app), before)
+    assert app.history.can_redo()
+    assert app.history.can_undo() == can_undo
+
+
+def test_runner_delivers_result_on_poll():
+    scheduler = _Scheduler()
+    runner = JobRunner(scheduler)
+    results = []
+    runner.submit(Job("test", lambda context: 42, on_done=results.append))
+    assert runner.busy
+    scheduler.run(runner)
+    assert results == [42] and not runner.busy
+
+
+def test_fork_is_taken_when_job_starts():
+    app = _app(HistoryMode.SNAPSHOT)
+    # Единственный поток пула занят, пока не откроем gate
+    gate = threading.Event()
+    app.jobs._pool.submit(gate.wait)
+    seen = []
+    app.run_job("test", lambda model: seen.append(model.get_pixel_color(5, 5)))
+    app.model.draw_pixel(5, 5, (255, 0, 0, 255))
+    gate.set()
+    app.scheduler.run(app.jobs)
+    # Копия не видит правку, сделанную после запуска, и ее результат отброшен
+    assert seen == [(255, 255, 255, 255)]
+    assert app.model.get_pixel_color(5, 5) == (255, 0, 0, 255)
+
+
+def test_replace_color_error_reaches_job(monkeypatch):
+    app = _app(HistoryMode.SNAPSHOT)
+
+    def broken(*args, **kwargs):
+        raise MemoryError("нет памяти")
+
+    monkeypatch.setattr("core.image_model.replace_color", broken)
+    errors = []
+    _run(app, lambda model: model.replace_color((255, 255, 255, 255), (0, 0, 0, 255)),
+         on_error=errors.append)
+    assert len(errors) == 1 and isinstance(errors[0], MemoryError)
+    assert app.model.get_pixel_color(5, 5) == (255, 255, 255, 255)
@@ -0,0 +1,63 @@
+# tests/test_shape_tools.py
+import random
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from core.command_journal import DrawCommand
+from tools.ellipse_tool import EllipseTool
+from tools.line_tool import LineTool
+from tools.rectangle_tool import RectangleTool
+
+COLOR = (255, 0, 0, 255)
+FILL = (0, 0, 255, 255)
+TOOLS = {"rectangle": RectangleTool, "line": LineTool, "ellipse": EllipseTool}
+
+
+def _imagedraw(name, points, width, fill):
+    """Та же фигура, нарисованная ImageDraw прямо на изображении"""
+    image = Image.new("RGBA", (220, 220), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    if name == "line":
+        draw.line(points, fill=COLOR, width=width)
+    else:
+        getattr(draw, name)(points, fill=fill, outline=COLOR, width=width)
+    return image
+
+
+def _replayed(name, points, width, fill):
+    image = Image.new("RGBA", (220, 220), (255, 255, 255, 255))
+    command = DrawCommand(name, COLOR, width, points, fill_color=fill,
+                          params={"antialias": False})
+    TOOLS[name].replay(image, command)
+    return image
+
+
+def _cases():
+    cases = [
+        ("rectangle", [(22, 59), (84, 59)], 3, None),
+        ("rectangle", [(11, 3), (11, 64)], 6, None),
+        ("rectangle", [(117, 74), (119, 127)], 9, FILL),
+        ("line", [(56, 160), (113, 132)], 9, None),
+        ("line", [(50, 0), (159, 106)], 2, None),
+    ]
+    rng = random.Random(0)
+    for _ in range(300):
+        name = rng.choice(sorted(TOOLS))
+        x1, y1 = rng.randint(0, 190), rng.randint(0, 190)
+        if rng.random() < 0.3:
+            # Вырожденные и тонкие рамки
+            x2, y2 = x1 + rng.randint(0, 3), y1 + rng.randint(0, 80)
+        else:
+            x2, y2 = rng.randint(0, 200), rng.randint(0, 200)
+        if name != "line":
+            x1, x2 = sorted((x1, x2))
+            y1, y2 = sorted((y1, y2))
+        fill = FILL if name != "line" and rng.random() < 0.5 else None
+        cases.append((name, [(x1, y1), (x2, y2)], rng.randint(1, 12), fill))
+    return cases
+
+
+@pytest.mark.parametrize("name, points, width, fill", _cases())
+def test_without_antialias_matches_imagedraw(name, points, width, fill):
+    expected = np.asarray(_imagedraw(name, points, width, fill))
+    assert np.array_equal(np.asarray(_replayed(name, points, width, fill)), expected)
@@ -0,0 +1,65 @@
+# tests/test_tiled_executor.py
+import numpy as np
+import pytest
+from PIL import Image
+from core.tiled_executor import TiledExecutor
+
+R = Image.Resampling
+
+
+@pytest.fixture(scope="module")
+def executor():
+    executor = TiledExecutor(max_workers=4, strip_height=64, min_pixels=0)
+    yield executor
+    executor.shutdown()
+
+
+def _noise(width: int, height: int, mode: str = "RGBA") -> Image.Image:
+    rng = np.random.default_rng(width * height)
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    shape = (height, width, bands) if bands > 1 else (height, width)
+    return Image.fromarray(rng.integers(0, 256, shape, dtype=np.uint8), mode)
+
+
+def _gradient(width: int, height: int) -> Image.Image:
+    x = np.linspace(0, 255, width)[None, :]
+    y = np.linspace(0, 255, height)[:, None]
+    pixels = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2, 255 - x / 2 + 0 * y], -1)
+    return Image.fromarray(pixels.astype(np.uint8), "RGBA")
+
+
+def _same(first: Image.Image, second: Image.Image) -> bool:
+    return first.size == second.size and np.array_equal(np.asarray(first), np.asarray(second))
+
+
+@pytest.mark.parametrize("resample", [R.NEAREST, R.BILINEAR, R.BICUBIC, R.LANCZOS, R.BOX])
+@pytest.mark.parametrize("size", [(2400, 3100), (600, 400), (1201, 300), (90, 1537)])
+def test_resize_matches_serial(executor, resample, size):
+    image = _noise(1201, 1537)
+    assert _same(executor.resize(image, size, resample), image.resize(size, resample))
+
+
+@pytest.mark.parametrize("mode", ["RGB", "L", "LA"])
+def test_resize_matches_serial_in_other_modes(executor, mode):
+    image = _noise(701, 533, mode)
+    for size in ((1500, 1000), (350, 260)):
+        assert _same(executor.resize(image, size), image.resize(size, R.LANCZOS))
+
+
+def test_resize_gradient_matches_serial(executor):
+    image = _gradient(1201, 1537)
+    assert _same(executor.resize(image, (2400, 3100)), image.resize((2400, 3100), R.LANCZOS))
+
+
+@pytest.mark.parametrize("resample", [R.NEAREST, R.BILINEAR, R.BICUBIC])
+@pytest.mark.parametrize("angle, expand", [(30, False), (30, True), (-17.5, True)])
+def test_rotate_matches_serial(executor, resample, angle, expand):
+    image = _noise(800, 600)
+    assert _same(executor.rotate(image, angle, expand, resample),
+                 image.rotate(angle, resample, expand=expand))
+
+
+def test_map_strips_matches_whole_image(executor):
+    image = _noise(500, 700)
+    assert _same(executor.map_strips(image, lambda strip: strip.point(lambda v: 255 - v)),
+                 image.point(lambda v: 255 - v))
@@ -0,0 +1,61 @@
+# tests/test_transforms.py
+import numpy as np
+import pytest
+from PIL import Image
+from core.transforms import AffineTransform
+
+RED = (255, 0, 0, 255)
+
+
+def _image_with_box() -> Image.Image:
+    """300x200 с красным квадратом 100x100 не в центре"""
+    image = Image.new("RGBA", (300, 200), (255, 255, 255, 255))
+    image.paste(RED, (20, 30, 120, 130))
+    return image
+
+
+def _red_box(image: Image.Image):
+    pixels = np.asarray(image.convert("RGBA")).astype(int)
+    red = (pixels[..., 0] > 200) & (pixels[..., 1] < 60) & (pixels[..., 2] < 60)
+    ys, xs = np.nonzero(red)
+    return xs.min(), ys.min(), xs.max() + 1, ys.max() + 1
+
+
+def _center_offset(image: Image.Image):
+    """Смещение центра красного квадрата от центра изображения и его размер"""
+    x1, y1, x2, y2 = _red_box(image)
+    return ((x1 + x2 - image.width) / 2, (y1 + y2 - image.height) / 2, x2 - x1, y2 - y1)
+
+
+@pytest.mark.parametrize("angles, reference", [
+    ((30, -30), 0),
+    ((45, 45), 90),
+    ((60, 30), 90),
+    ((100, 80), 180),
+])
+def test_composed_rotations_keep_position_and_shape(angles, reference):
+    image = _image_with_box()
+    transform = AffineTransform(image.size)
+    for angle in angles:
+        transform = transform.then_rotate(angle, expand=True)
+    result = transform.apply(image)
+
+    expected = image.rotate(reference, expand=True)
+    dx, dy, width, height = _center_offset(result)
+    ex, ey, ewidth, eheight = _center_offset(expected)
+    assert abs(dx - ex) <= 2 and abs(dy - ey) <= 2
+    assert abs(width - ewidth) <= 3 and abs(height - eheight) <= 3
+
+
+def test_single_right_angle_is_lossless_transpose():
+    image = _image_with_box()
+    result = AffineTransform(image.size).then_rotate(90).apply(image)
+    assert np.array_equal(np.asarray(result),
+                          np.asarray(image.transpose(Image.Transpose.ROTATE_90)))
+
+
+def test_right_angle_with_resize_uses_whole_result():
+    image = _image_with_box()
+    transform = AffineTransform(image.size).then_rotate(90).then_resize(100, 150)
+    assert transform.maps_onto_result()
+    assert transform.apply(image).size == (100, 150)
@@ -1,8 +1,12 @@
 7.	# tools/brush_tool.py
 from tools.base_tool import BaseTool
-from PIL import ImageDraw
-import math
-from typing import Tuple
+from core.command_journal import DrawCommand, register_renderer
+from core.tiles import union_box
+from core.brush_engine import StrokeBuffer, paint_stamps, segment_positions, stroke_positions
+from utils.constants import StrokeMode
+from PIL import Image
+import numpy as np
+from typing import Optional, Sequence, Tuple
 
 
 class BrushTool(BaseTool):
@@ -16,7 +20,12 @@ class BrushTool(BaseTool):
         self.drawing = False
         self.size = 5
         self.color = (0, 0, 0, 255)
+        self.hardness = 1.0
+        self.opacity = 1.0
+        self.stroke_mode = StrokeMode.DIRECT
+        self.stroke_buffer: Optional[StrokeBuffer] = None  # Буфер текущего штриха
         self.pressure_sensitive = False  # Для плавности линий
+        self.stroke_points = []  # Точки текущего штриха для журнала команд
 
     def on_mouse_down(self, event, model, canvas):
         # Сохраняем состояние перед началом рисования
@@ -26,46 +35,110 @@ class BrushTool(BaseTool):
         self.drawing = True
         self.last_x = event.x
         self.last_y = event.y
-        self._draw_point(event.x, event.y, model)
+        self.stroke_points = [(event.x, event.y)]
+
+        if self.stroke_mode is StrokeMode.DIRECT:
+            bbox = self._draw_point(model.image, event.x, event.y, self.color, self.size,
+                                    self.hardness)
+            if bbox:
+                model.mark_dirty(bbox)
+        else:
+            # Штрих копится в буфере, холст показывает его поверх изображения
+            self.stroke_buffer = StrokeBuffer(model.image.size, self.color, self.size,
+                                              self.hardness, self.opacity, self.stroke_mode)
+            canvas.set_compositor(self.stroke_buffer.composite)
+            bbox = self.stroke_buffer.add(np.array([[event.x, event.y]]))
+            if bbox:
+                canvas.request_redraw(bbox)
 
     def on_mouse_move(self, event, model, canvas):
         if self.drawing and self.last_x is not None and self.last_y is not None:
-            # Рассчитываем расстояние между точками
-            distance = math.sqrt((event.x - self.last_x) ** 2 + (event.y - self.last_y) ** 2)
-
-            if distance > 0:
-                # Адаптивный шаг в зависимости от скорости движения
-                step = max(1, self.size // 3)
-                steps = max(1, int(distance / step))
-
-                for i in range(steps + 1):
-                    t = i / steps
-                    x = int(self.last_x + (event.x - self.last_x) * t)
-                    y = int(self.last_y + (event.y - self.last_y) * t)
-                    self._draw_point(x, y, model)
+            if self.stroke_buffer is not None:
+                # Начало отрезка уже нанесено предыдущим событием
+                positions = segment_positions(self.last_x, self.last_y,
+                                              event.x, event.y, self.size)[1:]
+                bbox = self.stroke_buffer.add(positions)
+                if bbox:
+                    canvas.request_redraw(bbox)
+            else:
+                bbox = self._draw_segment(model.image, self.last_x, self.last_y,
+                                          event.x, event.y, self.color, self.size,
+                                          self.hardness)
+                if bbox:
+                    model.mark_dirty(bbox)
+            self.stroke_points.append((event.x, event.y))
 
             self.last_x = event.x
             self.last_y = event.y
-            canvas.update_image()
+            canvas.request_redraw()
 
     def on_mouse_up(self, event, model, canvas):
+        if self.stroke_buffer is not None:
+            # Изображение изменяется один раз - в конце штриха
+            bbox = self.stroke_buffer.apply(model.image)
+            if bbox:
+                model.mark_dirty(bbox)
+            canvas.set_compositor(None)
+            self.stroke_buffer = None
+
+        if self.drawing and self.stroke_points and hasattr(canvas, 'controller'):
+            canvas.controller.record_command(
+                DrawCommand("brush", self.color, self.size, self.stroke_points,
+                            params={"hardness": self.hardness, "opacity": self.opacity,
+                                    "mode": self.stroke_mode.value})
+            )
+
         self.drawing = False
         self.last_x = None
         self.last_y = None
+        self.stroke_points = []
         model.modified = True
-        canvas.update_image()
-
-    def _draw_point(self, x: int, y: int, model):
-        """Нарисовать одну точку/круг"""
-        if 0 <= x < model.width and 0 <= y < model.height:
-            draw = ImageDraw.Draw(model.image)
-            if self.size == 1:
-                draw.point((x, y), fill=self.color)
-            else:
-                radius = self.size // 2
-                # Для лучшего качества рисуем эллипс
-                draw.ellipse((x - radius, y - radius, x + radius, y + radius),
-                             fill=self.color, outline=self.color)
+        canvas.request_redraw()
+
+    @staticmethod
+    def render_stroke(image: Image.Image, points: Sequence[Tuple[int, int]],
+                      color: Tuple, size: int, hardness: float = 1.0, opacity: float = 1.0,
+                      mode: StrokeMode = StrokeMode.DIRECT) -> Optional[Tuple]:
+        """Нарисовать штрих по точкам так же, как при рисовании мышью.
+
+        Возвращает измененную область.
+        """
+        if not points:
+            return None
+
+        if mode is not StrokeMode.DIRECT:
+            stroke_buffer = StrokeBuffer(image.size, color, size, hardness, opacity, mode)
+            stroke_buffer.add(stroke_positions(points, size))
+            return stroke_buffer.apply(image)
+
+        # Отрезки рисуются по одному, как события мыши (мягкий край
+        # смешивается на стыках так же)
+        bbox = BrushTool._draw_point(image, points[0][0], points[0][1], color, size, hardness)
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            bbox = union_box(bbox, BrushTool._draw_segment(image, x0, y0, x1, y1,
+                                                           color, size, hardness))
+        return bbox
+
+    @staticmethod
+    def replay(image: Image.Image, command: DrawCommand) -> Optional[Tuple]:
+        """Воспроизвести команду кисти"""
+        params = command.params
+        return BrushTool.render_stroke(image, command.points, command.color, command.width,
+                                       params.get("hardness", 1.0), params.get("opacity", 1.0),
+                                       StrokeMode(params.get("mode", StrokeMode.DIRECT.value)))
+
+    @staticmethod
+    def _draw_segment(image: Image.Image, x0: int, y0: int, x1: int, y1: int,
+                      color: Tuple, size: int, hardness: float = 1.0) -> Optional[Tuple]:
+        """Нарисовать отрезок штриха: все отпечатки отрезка за один проход"""
+        return paint_stamps(image, segment_positions(x0, y0, x1, y1, size),
+                            color, size, hardness)
+
+    @staticmethod
+    def _draw_point(image: Image.Image, x: int, y: int, color: Tuple,
+                    size: int, hardness: float = 1.0) -> Optional[Tuple]:
+        """Нарисовать один отпечаток кисти, вернуть закрашенную область"""
+        return paint_stamps(image, np.array([[x, y]]), color, size, hardness)
 
     def set_color(self, color: Tuple):
         self.color = color
@@ -73,3 +146,17 @@ class BrushTool(BaseTool):
     def set_size(self, size: int):
         if size > 0:
             self.size = size
+
+    def set_hardness(self, hardness: float):
+        """Жесткость края кисти (0..1)"""
+        self.hardness = min(1.0, max(0.0, hardness))
+
+    def set_opacity(self, opacity: float):
+        """Непрозрачность штриха (0..1), действует в режимах с буфером"""
+        self.opacity = min(1.0, max(0.0, opacity))
+
+    def set_stroke_mode(self, mode: StrokeMode):
+        self.stroke_mode = mode
+
+
+register_renderer("brush", BrushTool.replay)
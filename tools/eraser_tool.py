@@ -1,12 +1,17 @@
 9.	# tools/eraser_tool.py
 from tools.base_tool import BaseTool
-from PIL import ImageDraw
-import math
-from typing import Tuple
+from core.brush_engine import StrokeBuffer, segment_positions, stroke_positions
+from core.command_journal import DrawCommand, register_renderer
+from PIL import Image
+import numpy as np
+from typing import Optional, Sequence, Tuple
+
+# Цвет в журнале команд для ластика (не используется при стирании)
+ERASE_COLOR = (0, 0, 0, 0)
 
 
 class EraserTool(BaseTool):
-    """Инструмент Ластик для стирания"""
+    """Инструмент Ластик: уменьшает альфу пикселей (делает их прозрачными)"""
 
     def __init__(self):
         super().__init__(name="Ластик", icon="🧽")
@@ -15,7 +20,10 @@ class EraserTool(BaseTool):
         self.last_y = None
         self.drawing = False
         self.size = 10
-        self.eraser_color = (255, 255, 255, 255)
+        self.hardness = 1.0
+        self.opacity = 1.0
+        self.stroke_buffer: Optional[StrokeBuffer] = None  # Покрытие текущего штриха
+        self.stroke_points = []
 
     def on_mouse_down(self, event, model, canvas):
         # Сохраняем состояние перед началом стирания
@@ -25,51 +33,81 @@ class EraserTool(BaseTool):
         self.drawing = True
         self.last_x = event.x
         self.last_y = event.y
-        self._erase_point(event.x, event.y, model)
+        self.stroke_points = [(event.x, event.y)]
+
+        # Стирание копится в буфере штриха, холст показывает его поверх
+        # изображения; перекрытия отпечатков не стирают сильнее opacity
+        self.stroke_buffer = StrokeBuffer(model.image.size, ERASE_COLOR, self.size,
+                                          self.hardness, self.opacity, erase=True)
+        canvas.set_compositor(self.stroke_buffer.composite)
+        self._add_stamps(np.array([[event.x, event.y]]), canvas)
 
     def on_mouse_move(self, event, model, canvas):
-        if self.drawing and self.last_x is not None and self.last_y is not None:
-            self._erase_smooth_line(self.last_x, self.last_y,
-                                    event.x, event.y, model)
+        if self.drawing and self.stroke_buffer is not None and self.last_x is not None:
+            # Начало отрезка уже нанесено предыдущим событием
+            positions = segment_positions(self.last_x, self.last_y,
+                                          event.x, event.y, self.size)[1:]
+            self._add_stamps(positions, canvas)
+            self.stroke_points.append((event.x, event.y))
             self.last_x = event.x
             self.last_y = event.y
 
     def on_mouse_up(self, event, model, canvas):
+        if self.stroke_buffer is not None:
+            bbox = self.stroke_buffer.apply(model.image)
+            if bbox:
+                model.mark_dirty(bbox)
+            canvas.set_compositor(None)
+            self.stroke_buffer = None
+
+            if self.stroke_points and hasattr(canvas, 'controller'):
+                canvas.controller.record_command(
+                    DrawCommand("eraser", ERASE_COLOR, self.size, self.stroke_points,
+                                params={"hardness": self.hardness, "opacity": self.opacity})
+                )
+
         self.drawing = False
         self.last_x = None
         self.last_y = None
+        self.stroke_points = []
         model.modified = True
+        canvas.request_redraw()
+
+    def _add_stamps(self, positions: np.ndarray, canvas):
+        """Добавить отпечатки в буфер и перерисовать только стертую область"""
+        bbox = self.stroke_buffer.add(positions)
+        if bbox:
+            canvas.request_redraw(bbox)
 
-    def _erase_point(self, x: int, y: int, model):
-        """Стереть одну точку/круг"""
-        if 0 <= x < model.width and 0 <= y < model.height:
-            draw = ImageDraw.Draw(model.image)
-            if self.size == 1:
-                draw.point((x, y), fill=self.eraser_color)
-            else:
-                radius = self.size // 2
-                draw.ellipse((x - radius, y - radius, x + radius, y + radius),
-                             fill=self.eraser_color)
-
-    def _erase_smooth_line(self, x1: int, y1: int, x2: int, y2: int, model):
-        """Стереть плавную линию из перекрывающихся кругов"""
-        dx = x2 - x1
-        dy = y2 - y1
-        distance = math.sqrt(dx * dx + dy * dy)
-
-        if distance == 0:
-            self._erase_point(x1, y1, model)
-            return
-
-        step = max(1, self.size // 2)
-        num_steps = int(distance / step) + 1
-
-        for i in range(num_steps + 1):
-            t = i / num_steps if num_steps > 0 else 0
-            x = int(x1 + dx * t)
-            y = int(y1 + dy * t)
-            self._erase_point(x, y, model)
+    @staticmethod
+    def render_stroke(image: Image.Image, points: Sequence[Tuple[int, int]], size: int,
+                      hardness: float = 1.0, opacity: float = 1.0) -> Optional[Tuple]:
+        """Стереть штрих по точкам так же, как при стирании мышью"""
+        if not points:
+            return None
+        stroke_buffer = StrokeBuffer(image.size, ERASE_COLOR, size, hardness, opacity,
+                                     erase=True)
+        stroke_buffer.add(stroke_positions(points, size))
+        return stroke_buffer.apply(image)
+
+    @staticmethod
+    def replay(image: Image.Image, command: DrawCommand) -> Optional[Tuple]:
+        """Воспроизвести команду ластика"""
+        return EraserTool.render_stroke(image, command.points, command.width,
+                                        command.params.get("hardness", 1.0),
+                                        command.params.get("opacity", 1.0))
 
     def set_size(self, size: int):
         if size > 0:
             self.size = size
+
+    def set_hardness(self, hardness: float):
+        """Жесткость края ластика (0..1)"""
+        self.hardness = min(1.0, max(0.0, hardness))
+
+    def set_opacity(self, opacity: float):
+        """Сила стирания (0..1): доля альфы, снимаемая за один штрих"""
+        self.opacity = min(1.0, max(0.0, opacity))
+
+
+register_renderer("eraser", EraserTool.replay)
@@ -1,8 +1,7 @@
 10.	# tools/fill_tool.py
 from tools.base_tool import BaseTool
-import numpy as np
-from PIL import Image
 from typing import Tuple
+from utils.constants import FillMode, ToleranceMetric
 
 
 class FillTool(BaseTool):
@@ -12,20 +11,37 @@ class FillTool(BaseTool):
         super().__init__(name="Заливка", icon="🎨")
         self.cursor = "spraycan"
         self.color = (0, 0, 0, 255)
+        self.connectivity = 4
+        self.mode = FillMode.CONTIGUOUS
+        self.tolerance = 0
+        self.metric = ToleranceMetric.CHANNEL
+        self.antialias = False
 
     def on_mouse_down(self, event, model, canvas):
-        # Сохраняем состояние перед заливкой
-        if hasattr(canvas, 'controller'):
-            canvas.controller.save_state()
-
         x, y = event.x, event.y
+        if not (0 <= x < model.width and 0 <= y < model.height):
+            return
 
-        if 0 <= x < model.width and 0 <= y < model.height:
-            try:
-                self._flood_fill(model, x, y, self.color)
-                model.modified = True
-            except Exception as e:
-                print(f"Ошибка заливки: {e}")
+        # Параметры берутся сейчас: заливка может выполняться в фоне
+        color, tolerance = self.color, self.tolerance
+        metric, antialias = self.metric.value, self.antialias
+        if self.mode == FillMode.GLOBAL:
+            target = model.image.getpixel((x, y))
+            fill = lambda m: m.replace_color(target, color, tolerance, metric, antialias)
+        else:
+            # Модель ограничивает заливку выделением
+            connectivity = self.connectivity
+            fill = lambda m: m.fill_area(x, y, color, connectivity, tolerance, metric, antialias)
+
+        if hasattr(canvas, 'controller'):
+            # Заливка большой области идет в фоне; состояние до нее
+            # контроллер сохраняет сам при запуске задачи
+            canvas.controller.run_job("Заливка", fill)
+            return
+        try:
+            fill(model)
+        except Exception as e:
+            print(f"Ошибка заливки: {e}")
 
     def on_mouse_move(self, event, model, canvas):
         pass
@@ -33,42 +49,23 @@ class FillTool(BaseTool):
     def on_mouse_up(self, event, model, canvas):
         pass
 
-    def _flood_fill(self, model, x: int, y: int, fill_color: Tuple):
-        target_color = model.image.getpixel((x, y))
-
-        if target_color == fill_color:
-            return
-
-        img_array = np.array(model.image)
-        height, width = img_array.shape[:2]
-
-        stack = [(x, y)]
-        visited = set()
-
-        target_color_np = np.array(target_color, dtype=np.uint8)
-        fill_color_np = np.array(fill_color, dtype=np.uint8)
-
-        while stack:
-            cx, cy = stack.pop()
-
-            if cx < 0 or cx >= width or cy < 0 or cy >= height:
-                continue
-
-            if (cx, cy) in visited:
-                continue
-
-            if not np.array_equal(img_array[cy, cx], target_color_np):
-                continue
+    def set_color(self, color: Tuple):
+        self.color = color
 
-            img_array[cy, cx] = fill_color_np
-            visited.add((cx, cy))
+    def set_connectivity(self, connectivity: int):
+        """Установить связность заливки (4 или 8)"""
+        self.connectivity = connectivity
 
-            stack.append((cx + 1, cy))
-            stack.append((cx - 1, cy))
-            stack.append((cx, cy + 1))
-            stack.append((cx, cy - 1))
+    def set_mode(self, mode: FillMode):
+        """Установить режим: связная область или замена цвета везде"""
+        self.mode = mode
 
-        model._image = Image.fromarray(img_array, 'RGBA')
+    def set_tolerance(self, tolerance: int, metric: ToleranceMetric = None):
+        """Установить допуск совпадения цвета (0 - точное совпадение)"""
+        self.tolerance = max(0, int(tolerance))
+        if metric is not None:
+            self.metric = metric
 
-    def set_color(self, color: Tuple):
-        self.color = color
+    def set_antialias(self, antialias: bool):
+        """Включить сглаживание края заливки"""
+        self.antialias = antialias
@@ -0,0 +1,43 @@
+# tools/magic_wand_tool.py
+from tools.base_tool import BaseTool
+from tools.selection_tool import selection_mode
+from core.flood_fill import METRIC_CHANNEL
+from utils.constants import FillMode, SelectionMode, ToleranceMetric
+
+
+class MagicWandTool(BaseTool):
+    """Инструмент Волшебная палочка: выделение области похожего цвета"""
+
+    def __init__(self):
+        super().__init__(name="Волшебная палочка", icon="🪄")
+        self.cursor = "crosshair"
+        self.tolerance = 32
+        self.metric = METRIC_CHANNEL
+        self.fill_mode = FillMode.CONTIGUOUS
+        self.connectivity = 4
+        self.mode = SelectionMode.REPLACE
+
+    def on_mouse_down(self, event, model, canvas):
+        # Shift/Ctrl совмещают новую область с текущим выделением
+        mode = selection_mode(getattr(event, "state", 0), self.mode)
+        model.select_similar(event.x, event.y, self.tolerance, self.metric,
+                             self.fill_mode == FillMode.CONTIGUOUS, self.connectivity, mode)
+        canvas.request_redraw()
+
+    def on_mouse_move(self, event, model, canvas):
+        pass
+
+    def on_mouse_up(self, event, model, canvas):
+        pass
+
+    def set_tolerance(self, tolerance: int, metric: ToleranceMetric = None):
+        self.tolerance = max(0, tolerance)
+        if metric is not None:
+            self.metric = metric.value
+
+    def set_fill_mode(self, mode: FillMode):
+        """Связная область от точки щелчка или похожий цвет по всему изображению"""
+        self.fill_mode = mode
+
+    def set_mode(self, mode: SelectionMode):
+        self.mode = mode
@@ -0,0 +1,48 @@
+# tools/polygon_tool.py
+import math
+from tools.shape_tool import ShapeTool
+from core.command_journal import register_renderer
+from typing import Dict, List, Tuple
+
+DEFAULT_POLYGON_SIDES = 6
+
+
+class PolygonTool(ShapeTool):
+    """Инструмент для рисования правильного многоугольника, вписанного в рамку"""
+
+    tool_id = "polygon"
+
+    def __init__(self):
+        super().__init__(name="Многоугольник", icon="⬟")
+        self.sides = DEFAULT_POLYGON_SIDES
+
+    def _params(self) -> Dict:
+        params = super()._params()
+        params["sides"] = self.sides
+        return params
+
+    @staticmethod
+    def vertices(box: Tuple[int, int, int, int], sides: int) -> List[Tuple[float, float]]:
+        """Вершины многоугольника, вписанного в эллипс рамки (первая - сверху)"""
+        x1, y1, x2, y2 = box
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        rx, ry = (x2 - x1) / 2, (y2 - y1) / 2
+        return [(cx + rx * math.sin(2 * math.pi * k / sides),
+                 cy - ry * math.cos(2 * math.pi * k / sides)) for k in range(sides)]
+
+    @staticmethod
+    def _draw(draw, mapping, command, fill):
+        box = (*command.points[0], *command.points[1])
+        points = [mapping.point(x, y)
+                  for x, y in PolygonTool.vertices(box, command.params.get("sides",
+                                                                           DEFAULT_POLYGON_SIDES))]
+        if fill:
+            draw.polygon(points, fill=255)
+        else:
+            draw.polygon(points, outline=255, width=mapping.length(command.width))
+
+    def set_sides(self, sides: int):
+        self.sides = max(3, sides)
+
+
+register_renderer("polygon", PolygonTool.replay)
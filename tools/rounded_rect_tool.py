@@ -0,0 +1,37 @@
+# tools/rounded_rect_tool.py
+from tools.shape_tool import ShapeTool
+from core.command_journal import register_renderer
+from typing import Dict
+
+DEFAULT_CORNER_RADIUS = 10
+
+
+class RoundedRectTool(ShapeTool):
+    """Инструмент для рисования прямоугольника со скругленными углами"""
+
+    tool_id = "rounded_rect"
+
+    def __init__(self):
+        super().__init__(name="Скругленный прямоугольник", icon="▭")
+        self.radius = DEFAULT_CORNER_RADIUS
+
+    def _params(self) -> Dict:
+        params = super()._params()
+        params["radius"] = self.radius
+        return params
+
+    @staticmethod
+    def _draw(draw, mapping, command, fill):
+        box = mapping.box(*command.points[0], *command.points[1])
+        radius = mapping.length(command.params.get("radius", DEFAULT_CORNER_RADIUS))
+        if fill:
+            draw.rounded_rectangle(box, radius=radius, fill=255)
+        else:
+            draw.rounded_rectangle(box, radius=radius, outline=255,
+                                   width=mapping.length(command.width))
+
+    def set_radius(self, radius: int):
+        self.radius = max(0, radius)
+
+
+register_renderer("rounded_rect", RoundedRectTool.replay)
@@ -1,12 +1,40 @@
 14.	# tools/selection_tool.py
 from tools.base_tool import BaseTool
-from PIL import Image, ImageDraw, ImageTk
-import tkinter as tk
+from core.command_journal import DrawCommand, register_renderer
+from core.selection import TRANSPARENT, move_region
+from core.shape_layer import PreviewLayer
+from core.tiles import union_box
+from utils.constants import SelectionMode
+from PIL import Image
+import numpy as np
 from typing import Optional, Tuple
 
+# Модификаторы Tk в event.state
+SHIFT_MASK = 0x0001
+CONTROL_MASK = 0x0004
+
+
+def selection_mode(state: int, default: SelectionMode) -> SelectionMode:
+    """Режим выделения с учетом клавиш: Shift - добавить, Ctrl - вычесть,
+    Shift+Ctrl - пересечь"""
+    shift = bool(state & SHIFT_MASK)
+    control = bool(state & CONTROL_MASK)
+    if shift and control:
+        return SelectionMode.INTERSECT
+    if shift:
+        return SelectionMode.ADD
+    if control:
+        return SelectionMode.SUBTRACT
+    return default
+
 
 class SelectionTool(BaseTool):
-    """Инструмент для прямоугольного выделения области"""
+    """Инструмент для прямоугольного выделения области.
+
+    Прямоугольник заменяет текущее выделение или совмещается с ним
+    (объединение, вычитание, пересечение), поэтому выделение может иметь
+    произвольную форму. Перетаскивание внутри выделения перемещает пиксели.
+    """
 
     def __init__(self):
         super().__init__(name="Выделение", icon="▢")
@@ -20,17 +48,19 @@ class SelectionTool(BaseTool):
         self.dragging = False
         self.moving = False
         self.has_selection = False
+        self.mode = SelectionMode.REPLACE
+        self.drag_mode = SelectionMode.REPLACE
 
         # Визуальное представление
         self.selection_rect = None
         self.selection_handles = []  # Ручки для изменения размера
-        self.selection_image = None
-        self.original_image_backup = None
+        self.selection_image = None  # Плавающий фрагмент при перемещении
 
         # Для перемещения
         self.move_start_x = None
         self.move_start_y = None
         self.original_selection_pos = None
+        self.floating_pos = None
 
     def on_mouse_down(self, event, model, canvas):
         # Сохраняем состояние перед операцией с выделением
@@ -38,27 +68,34 @@ class SelectionTool(BaseTool):
             canvas.controller.save_state()
 
         x, y = event.x, event.y
+        mode = selection_mode(getattr(event, "state", 0), self.mode)
 
-        if self.has_selection and self._is_inside_selection(x, y):
+        if mode == SelectionMode.REPLACE and self._is_inside_selection(x, y, model):
             # Начало перемещения существующего выделения
             self.moving = True
             self.move_start_x = x
             self.move_start_y = y
             self.original_selection_pos = model.selection
+            self.floating_pos = model.selection[:2]
 
-            # Сохраняем копию оригинального изображения для предпросмотра
-            self.original_image_backup = model.image.copy()
+            # Фрагмент становится плавающим слоем: отдельный элемент холста,
+            # который двигается через coords; на его месте показываем пустоту
             self.selection_image = model.get_selection_image()
+            canvas.set_compositor(PreviewLayer(self._hole_image(model), model.selection).composite)
+            canvas.request_redraw(model.selection)
+            canvas.show_overlay(self.selection_image, *self.floating_pos)
 
         else:
-            # Начало нового выделения
+            # Начало нового выделения (или прямоугольника для совмещения с текущим)
             self.dragging = True
+            self.drag_mode = mode
             self.start_x = x
             self.start_y = y
             self.current_x = x
             self.current_y = y
-            self.has_selection = False
-            model.set_selection(None)
+            if mode == SelectionMode.REPLACE:
+                self.has_selection = False
+                model.set_selection(None)
 
             # Очищаем старое выделение
             self._clear_selection_display(canvas)
@@ -69,7 +106,7 @@ class SelectionTool(BaseTool):
     def on_mouse_move(self, event, model, canvas):
         x, y = event.x, event.y
 
-        if self.moving and model.selection and self.selection_image:
+        if self.moving and model.selection and self.selection_image is not None:
             # Перемещение выделения с предпросмотром
             self._move_selection_preview(x, y, model, canvas)
 
@@ -93,59 +130,44 @@ class SelectionTool(BaseTool):
 
             # Проверяем, что выделение не нулевое
             if abs(x2 - x1) > 2 and abs(y2 - y1) > 2:
-                self.has_selection = True
-                model.set_selection((x1, y1, x2, y2))
-                self.selection_image = model.get_selection_image()
-
-                # Добавляем ручки для изменения размера
-                self._add_resize_handles(canvas, x1, y1, x2, y2)
-            else:
-                self.has_selection = False
+                model.set_selection((x1, y1, x2, y2), self.drag_mode)
+            elif self.drag_mode == SelectionMode.REPLACE:
                 model.set_selection(None)
-                self.selection_image = None
-                self._clear_selection_display(canvas)
+
+            # Рамка и ручки итогового выделения рисуются холстом по модели
+            self._clear_selection_display(canvas)
+            self.has_selection = model.selection is not None
+            self.selection_image = None
 
         elif self.moving:
-            # Завершение перемещения
+            # Завершение перемещения: изображение меняется один раз
             self.moving = False
+            canvas.set_compositor(None)
+            canvas.clear_overlay()
+            source = self.original_selection_pos
+
+            if source and self.selection_image and self.floating_pos != source[:2]:
+                mask = model.selection_mask
+                model.move_region(source, self.floating_pos)
+                if hasattr(canvas, 'controller'):
+                    # В журнал попадают только исходная область, новое положение
+                    # и (для непрямоугольного выделения) упакованная маска
+                    params = {} if mask.is_rectangle else {"mask": mask}
+                    canvas.controller.record_command(
+                        DrawCommand("move_selection", TRANSPARENT, 0,
+                                    [source[:2], source[2:], self.floating_pos], params=params)
+                    )
+            else:
+                canvas.request_redraw(source)
 
-            if model.selection and self.selection_image:
-                # Применяем перемещение
-                x1, y1, x2, y2 = self.original_selection_pos
-                width = x2 - x1
-                height = y2 - y1
-
-                # Рассчитываем смещение
-                dx = x - self.move_start_x
-                dy = y - self.move_start_y
-
-                new_x1 = max(0, min(x1 + dx, model.width - width))
-                new_y1 = max(0, min(y1 + dy, model.height - height))
-                new_x2 = new_x1 + width
-                new_y2 = new_y1 + height
-
-                # Обновляем изображение
-                if self.original_image_backup:
-                    model._image = self.original_image_backup.copy()
-
-                # Очищаем старую область
-                draw = ImageDraw.Draw(model.image)
-                draw.rectangle((x1, y1, x2, y2), fill=(0, 0, 0, 0))
-
-                # Вставляем в новое положение
-                model.image.paste(self.selection_image, (new_x1, new_y1), self.selection_image)
-
-                # Обновляем выделение
-                model.set_selection((new_x1, new_y1, new_x2, new_y2))
-                model.modified = True
-
-                # Обновляем отображение
-                self._update_selection_rect(canvas)
-                self._add_resize_handles(canvas, new_x1, new_y1, new_x2, new_y2)
-
-            self.original_image_backup = None
+            # Обновляем отображение
+            x1, y1, x2, y2 = model.selection
+            self.start_x, self.start_y, self.current_x, self.current_y = x1, y1, x2, y2
+            self._update_selection_rect(canvas)
+            self._add_resize_handles(canvas, x1, y1, x2, y2)
+            self.floating_pos = None
 
-        canvas.update_image()
+        canvas.request_redraw()
 
     def _normalize_coords(self) -> Tuple:
         """Нормализовать координаты прямоугольника"""
@@ -210,16 +232,21 @@ class SelectionTool(BaseTool):
             canvas.delete(handle)
         self.selection_handles.clear()
 
-    def _is_inside_selection(self, x: int, y: int) -> bool:
-        """Проверить, находится ли точка внутри выделения"""
-        if not self.has_selection or self.start_x is None or self.start_y is None:
-            return False
+    def _is_inside_selection(self, x: int, y: int, model) -> bool:
+        """Проверить, находится ли точка внутри выделения (с учетом его формы)"""
+        mask = model.selection_mask
+        return self.has_selection and mask is not None and mask.contains(x, y)
 
-        x1, y1, x2, y2 = self._normalize_coords()
-        return x1 <= x <= x2 and y1 <= y <= y2
+    @staticmethod
+    def _hole_image(model) -> Image.Image:
+        """Рамка выделения, в которой выделенные пиксели стали прозрачными"""
+        mask = model.selection_mask
+        region = np.array(model.image.crop(mask.bbox))
+        region[mask.array()] = TRANSPARENT[:region.shape[2]] if region.ndim == 3 else 0
+        return Image.fromarray(region, model.image.mode)
 
     def _move_selection_preview(self, x: int, y: int, model, canvas):
-        """Предпросмотр перемещения выделения"""
+        """Предпросмотр перемещения: сдвигаются только элементы холста"""
         if not self.original_selection_pos or not self.selection_image:
             return
 
@@ -234,36 +261,31 @@ class SelectionTool(BaseTool):
         # Новые координаты с ограничениями
         new_x1 = max(0, min(x1 + dx, model.width - width))
         new_y1 = max(0, min(y1 + dy, model.height - height))
+        self.floating_pos = (new_x1, new_y1)
 
-        # Восстанавливаем оригинальное изображение
-        if self.original_image_backup:
-            temp_image = self.original_image_backup.copy()
-        else:
-            temp_image = model.image.copy()
-
-        # Очищаем старую область в preview
-        draw = ImageDraw.Draw(temp_image)
-        draw.rectangle((x1, y1, x2, y2), fill=(0, 0, 0, 0))
+        canvas.move_overlay(new_x1, new_y1)
 
-        # Вставляем выделение в новое положение
-        temp_image.paste(self.selection_image, (new_x1, new_y1), self.selection_image)
-
-        # Показываем preview
-        temp_tk_image = ImageTk.PhotoImage(temp_image)
-        canvas.itemconfig(canvas.canvas_image_id, image=temp_tk_image)
-        canvas.tk_image = temp_tk_image
-
-        # Обновляем прямоугольник выделения
-        self._clear_selection_display(canvas)
-        self.selection_rect = canvas.create_rectangle(
-            new_x1, new_y1, new_x1 + width, new_y1 + height,
-            outline='blue',
-            dash=(4, 2),
-            width=2,
-            tags="selection"
-        )
-        self._add_resize_handles(canvas, new_x1, new_y1,
-                                 new_x1 + width, new_y1 + height)
+        # Сдвигаем прямоугольник выделения и ручки
+        offset_x = new_x1 - x1
+        offset_y = new_y1 - y1
+        if self.selection_rect:
+            canvas.coords(self.selection_rect, new_x1, new_y1, new_x1 + width, new_y1 + height)
+        handle_size = 6
+        corners = [(x1, y1), (x2, y1), (x1, y2), (x2, y2)]
+        for handle, (hx, hy) in zip(self.selection_handles, corners):
+            hx, hy = hx + offset_x, hy + offset_y
+            canvas.coords(handle, hx - handle_size, hy - handle_size,
+                          hx + handle_size, hy + handle_size)
+
+    @staticmethod
+    def replay(image: Image.Image, command: DrawCommand) -> Optional[Tuple]:
+        """Повторить перемещение фрагмента: точки - углы исходной области и новое положение"""
+        (x1, y1), (x2, y2), position = command.points
+        return union_box(*move_region(image, (x1, y1, x2, y2), position,
+                                      command.params.get("mask")))
+
+    def set_mode(self, mode: SelectionMode):
+        self.mode = mode
 
     def clear_selection(self, canvas):
         """Очистить выделение"""
@@ -276,7 +298,7 @@ class SelectionTool(BaseTool):
         self.dragging = False
         self.moving = False
         self.selection_image = None
-        self.original_image_backup = None
+        self.floating_pos = None
 
     def select_tool(self, tool_id: str):
         """Выбрать инструмент"""
@@ -301,3 +323,6 @@ class SelectionTool(BaseTool):
         for tool_id in ["rectangle", "ellipse"]:
             if tool_id in self.tools and self.tools[tool_id]:
                 self.tools[tool_id].set_fill(fill)
+
+
+register_renderer("move_selection", SelectionTool.replay)
@@ -1,11 +1,25 @@
 15.	# tools/shape_tool.py
 from tools.base_tool import BaseTool
+from core.command_journal import DrawCommand, command_bbox
+from core.shape_layer import MaskMapping, PreviewLayer, render_shape
+from core.tiles import clip_box, union_box
 from PIL import Image, ImageDraw
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional
 
 
 class ShapeTool(BaseTool):
-    """Базовый класс для геометрических примитивов"""
+    """Базовый класс для геометрических примитивов.
+
+    Фигура задается точками от нажатия до текущего положения мыши.
+    Предпросмотр растеризуется только в области фигуры и показывается
+    наложением на холсте (PreviewLayer), поэтому видны сглаживание и
+    прозрачность, а изображение не копируется. Окончательная фигура
+    рисуется тем же кодом, что и предпросмотр, и записывается в журнал.
+    Дочерние классы задают tool_id и _draw.
+    """
+
+    tool_id = ""       # Имя инструмента в журнале команд
+    normalize = True   # Фигура задается рамкой (углы упорядочиваются)
 
     def __init__(self, name: str, icon: str = ""):
         super().__init__(name, icon)
@@ -19,6 +33,8 @@ class ShapeTool(BaseTool):
         self.fill = False
         self.fill_color = (0, 0, 0, 255)
         self.line_width = 2
+        self.antialias = True
+        self.preview: Optional[PreviewLayer] = None
 
     def on_mouse_down(self, event, model, canvas):
         # Сохраняем состояние перед началом рисования
@@ -36,26 +52,13 @@ class ShapeTool(BaseTool):
             self.current_x = event.x
             self.current_y = event.y
 
-            # Создаем временное изображение для предпросмотра
-            temp_image = model.image.copy()
-            draw = ImageDraw.Draw(temp_image)
-
-            # Рисуем предпросмотр фигуры
-            x1, y1, x2, y2 = self._normalize_coords(
-                self.start_x, self.start_y,
-                self.current_x, self.current_y
-            )
-
-            # Рисуем фигуру на временном изображении
-            self._draw_preview(draw, x1, y1, x2, y2)
-
-            # Временно заменяем изображение для предпросмотра
-            original_image = model.image
-            model._image = temp_image
-            canvas.update_image()
-
-            # Восстанавливаем оригинальное изображение
-            model._image = original_image
+            # Перерисовываем старую и новую области предпросмотра
+            old_box = self.preview.bbox if self.preview else None
+            self.preview = self.render_preview(model.image, self._make_command())
+            canvas.set_compositor(self.preview.composite if self.preview else None)
+            damage = union_box(old_box, self.preview.bbox if self.preview else None)
+            if damage is not None:
+                canvas.request_redraw(damage)
 
     def on_mouse_up(self, event, model, canvas):
         if self.drawing:
@@ -64,14 +67,13 @@ class ShapeTool(BaseTool):
             self.current_y = event.y
 
             if self.start_x is not None and self.start_y is not None:
-                # Нормализуем координаты
-                x1, y1, x2, y2 = self._normalize_coords(
-                    self.start_x, self.start_y,
-                    self.current_x, self.current_y
-                )
-
                 # Рисуем фигуру на изображении
-                self._draw_shape(model, x1, y1, x2, y2)
+                command = self._make_command()
+                bbox = self.replay(model.image, command)
+                if bbox:
+                    model.mark_dirty(bbox)
+                if hasattr(canvas, 'controller'):
+                    canvas.controller.record_command(command)
 
                 self.start_x = None
                 self.start_y = None
@@ -80,29 +82,76 @@ class ShapeTool(BaseTool):
 
                 model.modified = True
 
-                # Обновляем холст
-                canvas.update_image()
+            # Убираем предпросмотр и обновляем холст
+            old_box = self.preview.bbox if self.preview else None
+            self.preview = None
+            canvas.set_compositor(None)
+            canvas.request_redraw(old_box)
+
+    def deactivate(self):
+        super().deactivate()
+        self.drawing = False
+        self.preview = None
 
     def _normalize_coords(self, x1, y1, x2, y2) -> Tuple:
         """Нормализовать координаты (делаем x1 <= x2 и y1 <= y2)"""
         # Для линии НЕ нормализуем, потому что это меняет направление
-        # Для прямоугольника и эллипса - нормализуем
-        if self.__class__.__name__ in ['LineTool']:
+        if not self.normalize:
             return (x1, y1, x2, y2)
-        else:
-            return (
-                min(x1, x2),
-                min(y1, y2),
-                max(x1, x2),
-                max(y1, y2)
-            )
-
-    def _draw_shape(self, model, x1: int, y1: int, x2: int, y2: int):
-        """Абстрактный метод - должен быть переопределен в дочерних классах"""
-        pass
-
-    def _draw_preview(self, draw, x1: int, y1: int, x2: int, y2: int):
-        """Метод для рисования предпросмотра"""
+        return (
+            min(x1, x2),
+            min(y1, y2),
+            max(x1, x2),
+            max(y1, y2)
+        )
+
+    def _make_command(self) -> DrawCommand:
+        """Команда для фигуры от точки нажатия до текущей точки"""
+        x1, y1, x2, y2 = self._normalize_coords(self.start_x, self.start_y,
+                                                self.current_x, self.current_y)
+        return DrawCommand(self.tool_id, self.color, self.line_width, [(x1, y1), (x2, y2)],
+                           fill_color=self.fill_color if self.fill else None,
+                           params=self._params())
+
+    def _params(self) -> Dict:
+        """Параметры фигуры для команды (дочерние классы дополняют)"""
+        return {"antialias": self.antialias}
+
+    @classmethod
+    def _render(cls, image: Image.Image,
+                command: DrawCommand) -> Tuple[Optional[Image.Image], Optional[Tuple]]:
+        """Фрагмент изображения с нарисованной фигурой и его область"""
+        bbox = clip_box(command_bbox(command), image.width, image.height)
+        if bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+            return None, None
+
+        def draw_shape(draw, mapping, fill):
+            cls._draw(draw, mapping, command, fill)
+
+        region = render_shape(image.crop(bbox), bbox, draw_shape, command.color,
+                              command.fill_color, command.params.get("antialias", False))
+        return region, bbox
+
+    @classmethod
+    def render_preview(cls, image: Image.Image, command: DrawCommand) -> Optional[PreviewLayer]:
+        """Предпросмотр фигуры: изображение не изменяется"""
+        region, bbox = cls._render(image, command)
+        return PreviewLayer(region, bbox) if region is not None else None
+
+    @classmethod
+    def replay(cls, image: Image.Image, command: DrawCommand) -> Optional[Tuple]:
+        """Нарисовать фигуру по команде (без участия Tk), вернуть область"""
+        region, bbox = cls._render(image, command)
+        if region is not None:
+            image.paste(region, bbox[:2])
+        return bbox
+
+    @staticmethod
+    def _draw(draw: ImageDraw.ImageDraw, mapping: MaskMapping, command: DrawCommand,
+              fill: bool):
+        """Нарисовать в маске значением 255 внутренность (fill=True) или контур
+        фигуры; координаты переводятся через mapping. Переопределяется в
+        дочерних классах"""
         pass
 
     def set_color(self, color: Tuple):
@@ -116,3 +165,6 @@ class ShapeTool(BaseTool):
 
     def set_fill(self, fill: bool):
         self.fill = fill
+
+    def set_antialias(self, antialias: bool):
+        self.antialias = antialias
@@ -2,7 +2,7 @@
 from tools.base_tool import BaseTool
 import tkinter as tk
 from tkinter import simpledialog, font
-from PIL import ImageFont, ImageDraw
+from PIL import ImageFont
 import os
 import sys
 from typing import Tuple
@@ -151,10 +151,8 @@ class TextTool(BaseTool):
                         print(f"Шрифт загружен: {self.font_name}, размер: {font_size}")
 
                     # Добавляем текст на изображение
-                    draw = ImageDraw.Draw(model.image)
-                    draw.text((x, y), text, fill=self.color, font=font_obj)
-                    model.modified = True
-                    canvas.update_image()
+                    bbox = model.draw_text(x, y, text, self.color, font_obj)
+                    canvas.request_redraw(bbox)
 
                 except Exception as e:
                     print(f"Ошибка добавления текста: {e}")
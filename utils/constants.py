@@ -15,6 +15,40 @@ class SelectionAction(Enum):
     PASTE = "paste"
     DELETE = "delete"
 
+class FillMode(Enum):
+    CONTIGUOUS = "contiguous"  # Связная область от точки щелчка
+    GLOBAL = "global"          # Замена цвета по всему изображению
+
+class ToleranceMetric(Enum):
+    CHANNEL = "channel"      # Максимум разницы по каналам RGBA
+    EUCLIDEAN = "euclidean"  # Евклидово расстояние в RGBA
+
+class StrokeMode(Enum):
+    DIRECT = "direct"          # Отпечатки сразу пишутся в изображение
+    MAX = "max"                # Буфер штриха: максимум покрытия отпечатков
+    ACCUMULATE = "accumulate"  # Буфер штриха: покрытие накапливается
+
+class SelectionMode(Enum):
+    REPLACE = "replace"      # Новое выделение
+    ADD = "add"              # Объединение с текущим
+    SUBTRACT = "subtract"    # Вычитание из текущего
+    INTERSECT = "intersect"  # Пересечение с текущим
+
+class PixelStorage(Enum):
+    MEMORY = "memory"  # Одно изображение PIL в памяти
+    TILED = "tiled"    # Тайлы с копированием при записи (TiledImage)
+    MAPPED = "mapped"  # Временный файл, отображенный в память (MappedImage)
+
+class HistoryMode(Enum):
+    SNAPSHOT = "snapshot"  # Тайловые снимки пикселей
+    JOURNAL = "journal"    # Журнал команд с опорными кадрами
+
 # Цвета по умолчанию
 DEFAULT_BG_COLOR = (255, 255, 255, 255)  # Белый
 DEFAULT_FG_COLOR = (0, 0, 0, 255)        # Чёрный
+
+# Бюджет памяти истории Undo/Redo по умолчанию (МБ)
+DEFAULT_HISTORY_MEMORY_MB = 1024
+
+# Опорный кадр журнала команд берется каждые N команд
+JOURNAL_KEYFRAME_INTERVAL = 10